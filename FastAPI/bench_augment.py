@@ -0,0 +1,104 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from functools import partial
+import dataset_augment
+
+# 离线增强（_aug_ 副本落盘） vs 在线增强（训练时实时执行）对比：
+#   1. 磁盘占用：原图 / 副本字节数
+#   2. 数据加载吞吐：用 Ultralytics 的 ClassificationDataset + DataLoader 各跑一遍训练集，统计张/秒和每轮耗时
+#   3. Top-1（可选，--epochs > 0）：两种模式各训练一次，比较验证集准确率
+# python bench_augment.py --dataset <数据集目录> [--workers 4] [--batch 64] [--epochs 0]
+
+print = partial(print, flush=True)
+
+
+def disk_usage(train_dir):
+    """返回 (原图字节数, 副本字节数, 原图数, 副本数)"""
+    src_bytes = aug_bytes = src_n = aug_n = 0
+    for class_entry in os.scandir(train_dir):
+        if not class_entry.is_dir(): continue
+        for entry in os.scandir(class_entry.path):
+            if not entry.name.lower().endswith(dataset_augment.IMG_EXTS): continue
+            if dataset_augment.AUG_MARK in entry.name:
+                aug_bytes += entry.stat().st_size
+                aug_n += 1
+            else:
+                src_bytes += entry.stat().st_size
+                src_n += 1
+    return src_bytes, aug_bytes, src_n, aug_n
+
+
+def _count(batch):
+    # 只计数，不拼 batch，测的是读图 + 增强 + 预处理本身
+    return len(batch)
+
+
+def loading_throughput(train_dir, mode, args):
+    """完整遍历一轮训练集，返回 (样本数, 秒)"""
+    from torch.utils.data import DataLoader
+    from ultralytics.cfg import get_cfg
+    from ultralytics.data import ClassificationDataset
+
+    cfg = get_cfg(overrides={"imgsz": args.img_size, "cache": False})
+    dataset = ClassificationDataset(train_dir, cfg, augment=True, prefix="train")
+    if mode == "online":
+        dataset_augment.enable_online_augment(dataset, args.policy, args.p)
+    loader = DataLoader(dataset, batch_size=args.batch, shuffle=True, num_workers=args.workers,
+                        collate_fn=_count)
+    start = time.perf_counter()
+    n = sum(loader)
+    return n, time.perf_counter() - start
+
+
+def train_top1(dataset_root, mode, args, project):
+    from ultralytics import YOLO
+
+    model = YOLO(f"yolov8{args.model_type}-cls.pt")
+    trainer = dataset_augment.online_trainer(args.policy, args.p) if mode == "online" else None
+    results = model.train(
+        data=dataset_root, trainer=trainer, epochs=args.epochs, batch=args.batch, imgsz=args.img_size,
+        workers=args.workers, project=project, name=mode, plots=False, seed=0, deterministic=True,
+        fliplr=0.5, degrees=15.0, shear=2.5, scale=0.2, translate=0.1, hsv_h=0.0, hsv_s=0.0, hsv_v=0.1,
+    )
+    return float(results.top1) * 100
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", required=True)
+    parser.add_argument("--policy", default=dataset_augment.DEFAULT_POLICY)
+    parser.add_argument("--p", type=float, default=0.5, help="在线增强概率")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--img_size", type=int, default=224)
+    parser.add_argument("--epochs", type=int, default=0, help="大于 0 时两种模式各训练一次比较 Top-1")
+    parser.add_argument("--model_type", default="n")
+    args = parser.parse_args()
+
+    train_dir = os.path.join(args.dataset, "train")
+    dataset_augment.augment_offline(train_dir, args.policy)
+    src_bytes, aug_bytes, src_n, aug_n = disk_usage(train_dir)
+    print(f"\n💾 磁盘占用：原图 {src_n} 张 {src_bytes / 1024 / 1024:.1f} MB，"
+          f"离线副本 {aug_n} 张 {aug_bytes / 1024 / 1024:.1f} MB（+{aug_bytes / max(src_bytes, 1):.0%}），在线模式 0 MB")
+
+    print(f"\n🚚 数据加载（DataLoader workers={args.workers}，batch={args.batch}）")
+    for mode in ("offline", "online"):
+        n, seconds = loading_throughput(train_dir, mode, args)
+        print(f"   {mode:<8}每轮 {n:>7} 张  {seconds:>7.1f} 秒  {n / seconds:>8.1f} 张/秒")
+
+    if args.epochs > 0:
+        project = tempfile.mkdtemp(prefix="bench_augment_")
+        try:
+            print(f"\n🏋️ 训练 {args.epochs} 轮比较 Top-1 ...")
+            top1 = {mode: train_top1(args.dataset, mode, args, project) for mode in ("offline", "online")}
+        finally:
+            shutil.rmtree(project, ignore_errors=True)
+        for mode, acc in top1.items():
+            print(f"   {mode:<8}Top-1 {acc:.2f}%")
+
+
+if __name__ == "__main__":
+    main()
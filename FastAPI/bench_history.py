@@ -0,0 +1,149 @@
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+
+# 历史列表接口并发基准：同步 def + 线程池会话（改造前） vs 异步引擎 + AsyncSession（改造后）
+# 每种模式启动一个独立的 uvicorn 进程，用 httpx 并发请求 GET /Predictions/，统计 req/s 与延迟
+# python bench_history.py [--rows 100000] [--concurrency 64] [--duration 10]
+
+print = partial(print, flush=True)
+
+
+def build_app(mode):
+    from fastapi import Depends, FastAPI, Query
+    app = FastAPI()
+    if mode == "async":
+        import history_router
+        app.include_router(history_router.router)
+        return app
+
+    # 改造前的同步实现：与 history_router.list_Predictions 相同的查询，只是走同步会话和线程池
+    from sqlmodel import Session
+    from database import get_session
+    import history_search
+    from history_models import PredictionPage, PredictionRead
+    from history_router import _encode_cursor, _parse_fields
+
+    @app.get("/Predictions/", response_model=PredictionPage, response_model_exclude_unset=True)
+    def list_sync(limit: int = Query(50), session: Session = Depends(get_session)):
+        rows = session.exec(history_search.list_statement(_parse_fields(None), {}, limit=limit)).all()
+        items = [PredictionRead(**dict(row._mapping)) for row in rows[:limit]]
+        page = PredictionPage(items=items, next_cursor=None)
+        if len(rows) > limit:
+            page.next_cursor = _encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id)
+        return page
+
+    return app
+
+
+def serve(mode, port):
+    import uvicorn
+    uvicorn.run(build_app(mode), host="127.0.0.1", port=port, log_level="warning")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def load(url, concurrency, duration):
+    import httpx
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(client):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            # 不取总数，两种模式执行完全相同的 SQL
+            r = await client.get(url, params={"limit": 50, "with_total": "false"})
+            latencies.append(time.perf_counter() - t0)
+            errors += r.status_code != 200
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "errors": errors,
+    }
+
+
+def wait_ready(url, proc, timeout=30):
+    import httpx
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("服务进程启动失败")
+        try:
+            if httpx.get(url, params={"limit": 1}).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("等待服务启动超时")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--serve", choices=["sync", "async"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, "bench.db")
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}"}
+    # 在子进程里建库、灌数据，保证使用与服务相同的 DATABASE_URL
+    subprocess.run(
+        [sys.executable, "-c",
+         "from database import engine, init_db; import history_search; from check_query_plans import seed; "
+         f"init_db(); seed(engine, {args.rows})"],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)), check=True, stdout=subprocess.DEVNULL,
+    )
+    print(f"🧪 {args.rows} 条记录，并发 {args.concurrency}，每种模式 {args.duration:.0f} 秒")
+
+    results = {}
+    for mode in ("sync", "async"):
+        port = free_port()
+        proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", mode, "--port", str(port)],
+            env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        try:
+            url = f"http://127.0.0.1:{port}/Predictions/"
+            wait_ready(url, proc)
+            results[mode] = asyncio.run(load(url, args.concurrency, args.duration))
+        finally:
+            proc.terminate()
+            proc.wait()
+        r = results[mode]
+        print(f"   {mode:<6}{r['rps']:>10.1f} req/s   p50 {r['p50']:>7.1f} ms   p99 {r['p99']:>7.1f} ms   错误 {r['errors']}")
+
+    print(f"   提升: {results['async']['rps'] / results['sync']['rps']:.2f}x")
+    for name in os.listdir(tmp_dir):
+        os.remove(os.path.join(tmp_dir, name))
+    os.rmdir(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
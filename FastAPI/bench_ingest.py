@@ -0,0 +1,80 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from functools import partial
+from types import SimpleNamespace
+import numpy as np
+from PIL import Image
+import ingest
+
+# 上传图像读取基准：旧流程（copyfileobj 落盘 -> PIL 读回 -> np.array）vs ingest（缓冲区直接解码 + 一次写盘）
+# python bench_ingest.py [图像路径]
+
+print = partial(print, flush=True)
+
+
+def make_upload(data, spool_max=1024 * 1024):
+    """模拟 Starlette 的 UploadFile：默认 1MB 以内在内存中，超过则落到临时文件"""
+    f = tempfile.SpooledTemporaryFile(max_size=spool_max)
+    f.write(data)
+    f.seek(0)
+    return SimpleNamespace(file=f, filename="bench.jpg")
+
+
+def old_path(upload, path):
+    upload.file.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(upload.file, f)
+    image = Image.open(path).convert("RGB")
+    return np.array(image)
+
+
+def new_path(upload, path):
+    buf = ingest.upload_bytes(upload)
+    ingest.write_bytes(path, buf)
+    return ingest.decode_image(buf)
+
+
+def measure(label, fn, number):
+    fn()
+    seconds = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"   {label:<8}{seconds * 1000:>10.2f} ms{peak / 1024 / 1024:>12.2f} MB")
+    return seconds
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            data = f.read()
+    else:
+        rng = np.random.default_rng(0)
+        arr = (rng.random((512, 512, 3)) * 255).astype(np.uint8)
+        out = io.BytesIO()
+        Image.fromarray(arr).save(out, "JPEG", quality=95)
+        data = out.getvalue()
+
+    tmp_dir = tempfile.mkdtemp()
+    target = os.path.join(tmp_dir, "upload.jpg")
+    try:
+        for spool_max, desc in [(len(data) + 1, "内存缓冲"), (1, "磁盘缓冲")]:
+            upload = make_upload(data, spool_max)
+            assert np.array_equal(old_path(upload, target), new_path(upload, target))
+            print(f"\n📷 {len(data) / 1024:.0f} KB 图像，上传内容在{desc}")
+            print(f"   {'':<8}{'耗时':>10}{'峰值分配':>12}")
+            old = measure("旧流程", lambda: old_path(upload, target), 50)
+            new = measure("ingest", lambda: new_path(upload, target), 50)
+            print(f"   加速比: {old / new:.2f}x")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
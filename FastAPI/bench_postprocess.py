@@ -0,0 +1,161 @@
+import sys
+import timeit
+from functools import partial
+from types import SimpleNamespace
+import numpy as np
+from postprocess import parse_result, parse_results
+
+# 后处理微基准：旧的逐框 Python 循环 vs postprocess 向量化实现
+# python bench_postprocess.py [检测框数量]
+
+print = partial(print, flush=True)
+
+
+def legacy_parse_result(result, class_names):
+    """改为向量化之前 predict_api 中的逐框循环实现，作为对照"""
+    all_results_list = []
+    bboxes_list = []
+
+    # 情况1：分类模型（有 probs 且非 None）
+    if hasattr(result, "probs") and result.probs is not None:
+        probs = result.probs.data.cpu().numpy() if hasattr(result.probs.data, 'cpu') else np.asarray(result.probs.data)
+        sorted_indices = np.argsort(probs)[::-1]  # 按置信度降序排列
+        all_results_list = [
+            {"class": class_names[int(idx)], "confidence": float(probs[int(idx)])}
+            for idx in sorted_indices
+        ]
+        # 分类任务的原始分数=概率，归一化概率=概率（无需额外计算）
+        class_scores_raw = [float(probs[int(idx)]) for idx in sorted_indices]
+        class_probs = [float(probs[int(idx)]) for idx in sorted_indices]
+
+    # 情况2：检测模型（提取所有检测框的类别+置信度）
+    elif hasattr(result, "boxes") and result.boxes is not None:
+        boxes = result.boxes
+        det_results = []
+        xyxy = boxes.xyxy.cpu().numpy() if hasattr(boxes.xyxy, 'cpu') else np.array(boxes.xyxy)
+        confs = boxes.conf.data.cpu().numpy() if hasattr(boxes.conf, 'data') else np.array(boxes.conf)
+        clss = boxes.cls.data.cpu().numpy() if hasattr(boxes.cls, 'data') else np.array(boxes.cls)
+
+        for (xy, c, conf) in zip(xyxy, clss, confs):
+            cls_idx = int(c)
+            conf_val = float(conf)
+            det_results.append({
+                "class": class_names[cls_idx],
+                "confidence": conf_val,
+            })
+            bboxes_list.append({
+                "xyxy": [float(xy[0]), float(xy[1]), float(xy[2]), float(xy[3])],
+                "class": class_names[cls_idx],
+                "confidence": conf_val,
+            })
+
+        # 检测任务：按类别取最大置信度作为原始分数，再归一化
+        class_scores = {name: 0.0 for name in class_names}
+        for d in det_results:
+            cname = d["class"]
+            class_scores[cname] = max(class_scores.get(cname, 0.0), d["confidence"])
+        class_scores_raw = [float(class_scores[name]) for name in class_names]
+        total = sum(class_scores_raw)
+        class_probs = [score/total if total>0 else 0.0 for score in class_scores_raw]
+        # 检测任务的all_results_list按类别顺序排列
+        all_results_list = [
+            {"class": class_names[i], "confidence": class_probs[i]}
+            for i in range(len(class_names))
+        ]
+
+    else:
+        return None
+
+    # 提取置信度最高的类别
+    main_class = None
+    main_confidence = None
+    if all_results_list:
+        main_result = max(all_results_list, key=lambda x: x["confidence"])
+        main_class = main_result["class"]
+        main_confidence = main_result["confidence"]
+
+    return {
+        "main_class": main_class,
+        "confidence": main_confidence,
+        "all_results": all_results_list,
+        "bboxes": bboxes_list,  # 分类任务自动为[]，检测任务为边界框列表
+        "class_scores_raw": class_scores_raw,
+        "class_probs": class_probs,
+    }
+
+
+class FakeTensor:
+    """模拟 torch.Tensor 的 .data / .cpu().numpy() 接口"""
+
+    def __init__(self, array):
+        self.array = array
+
+    @property
+    def data(self):
+        return self
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+def fake_detection(num_boxes, num_classes, rng):
+    xy = rng.uniform(0, 600, size=(num_boxes, 2)).astype(np.float32)
+    wh = rng.uniform(5, 40, size=(num_boxes, 2)).astype(np.float32)
+    boxes = SimpleNamespace(
+        xyxy=FakeTensor(np.concatenate([xy, xy + wh], axis=1)),
+        cls=FakeTensor(rng.integers(0, num_classes, size=num_boxes).astype(np.float32)),
+        conf=FakeTensor(rng.uniform(0.05, 1.0, size=num_boxes).astype(np.float32)),
+    )
+    return SimpleNamespace(probs=None, boxes=boxes)
+
+
+def fake_classification(num_classes, rng):
+    logits = rng.normal(size=num_classes)
+    probs = (np.exp(logits) / np.exp(logits).sum()).astype(np.float32)
+    return SimpleNamespace(probs=SimpleNamespace(data=FakeTensor(probs)), boxes=None)
+
+
+def assert_same(a, b):
+    assert a.keys() == b.keys()
+    for key in a:
+        if isinstance(a[key], list):
+            assert len(a[key]) == len(b[key]), key
+    assert a["main_class"] == b["main_class"]
+    assert a["bboxes"] == b["bboxes"]
+    assert [r["class"] for r in a["all_results"]] == [r["class"] for r in b["all_results"]]
+    assert np.allclose(a["class_probs"], b["class_probs"], rtol=0, atol=1e-12)
+    assert np.allclose(a["class_scores_raw"], b["class_scores_raw"], rtol=0, atol=1e-12)
+
+
+def bench(label, fn, number):
+    seconds = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"   {label:<14}{seconds * 1e6:>12.1f} us")
+    return seconds
+
+
+def main():
+    num_boxes = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    rng = np.random.default_rng(0)
+    class_names = ["Mild Impairment", "Moderate Impairment", "No Impairment", "Very Mild Impairment"]
+
+    det = fake_detection(num_boxes, len(class_names), rng)
+    assert_same(legacy_parse_result(det, class_names), parse_result(det, class_names))
+    print(f"📦 检测结果，{num_boxes} 个框")
+    old = bench("旧实现", lambda: legacy_parse_result(det, class_names), 200)
+    new = bench("向量化", lambda: parse_result(det, class_names), 200)
+    print(f"   加速比: {old / new:.2f}x")
+
+    cls_results = [fake_classification(len(class_names), rng) for _ in range(64)]
+    for r in cls_results:
+        assert_same(legacy_parse_result(r, class_names), parse_result(r, class_names))
+    print(f"\n🏷️  分类结果，批量 {len(cls_results)} 张")
+    old = bench("旧实现", lambda: [legacy_parse_result(r, class_names) for r in cls_results], 200)
+    new = bench("向量化", lambda: parse_results(cls_results, class_names), 200)
+    print(f"   加速比: {old / new:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
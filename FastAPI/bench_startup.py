@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+from functools import partial
+
+# 各启动角色的导入耗时与内存占用：python bench_startup.py [重复次数]
+
+print = partial(print, flush=True)
+
+ROLES = ["history-only", "inference", "api"]
+
+# 在子进程中导入 main（完成路由注册和 init_db），输出耗时(秒)与峰值 RSS(MB)
+PROBE = r"""
+import os, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if sys.platform == "darwin":
+        rss /= 1024
+except ImportError:
+    import psutil
+    rss = psutil.Process().memory_info().peak_wset / 1024 / 1024
+heavy = [m for m in ("torch", "ultralytics", "cv2") if m in sys.modules]
+print(f"{elapsed:.4f} {rss:.1f} {','.join(heavy) or '-'}")
+"""
+
+
+def probe(role):
+    env = os.environ.copy()
+    env["APP_ROLE"] = role
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout.strip().splitlines()[-1]
+    elapsed, rss, heavy = out.split()
+    return float(elapsed), float(rss), heavy
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print(f"{'角色':<14}{'导入耗时(s)':>12}{'峰值RSS(MB)':>14}  已加载的重型模块")
+    for role in ROLES:
+        runs = [probe(role) for _ in range(repeat)]
+        elapsed = min(r[0] for r in runs)
+        rss = min(r[1] for r in runs)
+        print(f"{role:<14}{elapsed:>12.3f}{rss:>14.1f}  {runs[-1][2]}")
+
+
+if __name__ == "__main__":
+    main()
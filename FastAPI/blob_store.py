@@ -0,0 +1,223 @@
+import hashlib
+import os
+import re
+import tempfile
+import time
+from sqlalchemy import delete, event, func, inspect, update
+from sqlmodel import Session, select
+from database import engine
+from history_models import PredictionRecord, UploadBlob
+
+# 上传图像的内容寻址存储：uploads/ab/cd/<sha256>.jpg
+# 相同图像只保存一份，PredictionRecord.image_path 指向共享的 blob；
+# 记录增删改时通过 ORM 事件维护 UploadBlob.refcount（登记 blob、刷新 touched_at 也在同一事务中，
+# 预测接口不再为此单独开写事务），gc() 清理无人引用的 blob
+
+BASE_DIR = os.path.dirname(__file__)
+UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+# refcount 为 0 的 blob 至少闲置这么久才会被回收，避免删掉刚写入、记录还没入库的图像
+BLOB_GC_GRACE_SECONDS = int(os.environ.get("BLOB_GC_GRACE_SECONDS", "3600"))
+
+IMG_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+_BLOB_RE = re.compile(r"^uploads/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z]+$")
+
+
+def is_blob_path(rel_path):
+    return bool(rel_path) and bool(_BLOB_RE.match(rel_path))
+
+
+def blob_rel_path(digest, ext):
+    return f"uploads/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def _normalize_ext(filename):
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if ext in IMG_EXTS else ".jpg"
+
+
+def content_hash(buf):
+    return hashlib.sha256(buf).hexdigest()
+
+
+def put_bytes(buf, filename=None, digest=None):
+    """
+    保存图像字节，返回相对路径 uploads/ab/cd/<sha256>.ext
+    已存在的相同内容直接复用，并刷新文件 mtime（gc 以此判断最近是否有人用过）；
+    新文件先写临时文件再 rename，保证原子性
+    调用方已算过哈希时通过 digest 传入，避免重复计算
+    """
+    digest = digest or content_hash(buf)
+    rel_path = blob_rel_path(digest, _normalize_ext(filename))
+    abs_path = os.path.join(BASE_DIR, rel_path)
+    try:
+        os.utime(abs_path)
+        return rel_path
+    except FileNotFoundError:
+        pass  # 新图像，或恰好被 gc 回收，重新写入
+    shard_dir = os.path.dirname(abs_path)
+    os.makedirs(shard_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=shard_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(buf)
+        os.replace(tmp_path, abs_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return rel_path
+
+
+# 引用计数：随 PredictionRecord 的增删改自动维护（同一个事务内完成）
+
+def _insert(connection):
+    if connection.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(UploadBlob)
+
+
+def _register(connection, rel_path):
+    """引用 +1：blob 未登记时插入，否则 refcount + 1 并刷新 touched_at"""
+    try:
+        size = os.path.getsize(os.path.join(BASE_DIR, rel_path))
+    except OSError:
+        size = None
+    now = time.time()
+    stmt = _insert(connection).values(path=rel_path, size=size, refcount=1, touched_at=now)
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=["path"],
+        set_={"refcount": UploadBlob.refcount + 1, "touched_at": now},
+    ))
+
+
+def _adjust(connection, rel_path, delta):
+    if not is_blob_path(rel_path):
+        return
+    if delta > 0:
+        _register(connection, rel_path)
+        return
+    connection.execute(
+        update(UploadBlob)
+        .where(UploadBlob.path == rel_path)
+        .values(refcount=UploadBlob.refcount + delta)
+    )
+
+
+@event.listens_for(PredictionRecord, "after_insert")
+def _on_insert(mapper, connection, target):
+    _adjust(connection, target.image_path, 1)
+
+
+@event.listens_for(PredictionRecord, "after_delete")
+def _on_delete(mapper, connection, target):
+    _adjust(connection, target.image_path, -1)
+
+
+@event.listens_for(PredictionRecord, "before_update")
+def _on_update(mapper, connection, target):
+    history = inspect(target).attrs.image_path.history
+    if not history.added:
+        return
+    old_paths = history.deleted
+    if not old_paths:
+        # commit 后属性已过期，旧值不在 history 中，UPDATE 执行前从库里读出
+        old_paths = [connection.execute(
+            select(PredictionRecord.image_path).where(PredictionRecord.id == target.id)
+        ).scalar()]
+    for rel_path in old_paths:
+        _adjust(connection, rel_path, -1)
+    for rel_path in history.added:
+        _adjust(connection, rel_path, 1)
+
+
+def reconcile():
+    """
+    按检测记录重新统计 refcount，并登记磁盘上存在但表中没有的 blob
+    （例如模型不存在、解码失败时已落盘但没有写入记录的图像），touched_at 取文件 mtime
+    """
+    with Session(engine) as session:
+        known = set(session.exec(select(UploadBlob.path)).all())
+        connection = session.connection()
+        for root, _, files in os.walk(UPLOAD_DIR):
+            for name in files:
+                rel_path = os.path.relpath(os.path.join(root, name), BASE_DIR).replace(os.sep, "/")
+                if not is_blob_path(rel_path) or rel_path in known:
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                connection.execute(
+                    _insert(connection)
+                    .values(path=rel_path, size=st.st_size, refcount=0, touched_at=st.st_mtime)
+                    .on_conflict_do_nothing(index_elements=["path"])
+                )
+
+        session.execute(update(UploadBlob).values(refcount=0))
+        counts = session.exec(
+            select(PredictionRecord.image_path, func.count())
+            .where(PredictionRecord.image_path.like("uploads/%/%/%"))
+            .group_by(PredictionRecord.image_path)
+        ).all()
+        for rel_path, count in counts:
+            session.execute(update(UploadBlob).where(UploadBlob.path == rel_path).values(refcount=count))
+        session.commit()
+    return len(counts)
+
+
+def _remove_file(abs_path, cutoff):
+    """
+    先把文件原子地改名为墓碑再检查 mtime：改名前被 put_bytes 刷新过 mtime 的放回原处，返回 False；
+    改名后才到达的 put_bytes 找不到文件，会重新写入一份，不受这里删除的影响
+    """
+    tomb = abs_path + ".gc"
+    try:
+        os.replace(abs_path, tomb)
+    except FileNotFoundError:
+        return True
+    if os.stat(tomb).st_mtime >= cutoff:
+        os.replace(tomb, abs_path)  # 内容寻址，覆盖期间重新写入的同一内容也无妨
+        return False
+    os.unlink(tomb)
+    return True
+
+
+def gc(dry_run=False, grace_seconds=BLOB_GC_GRACE_SECONDS):
+    """
+    删除 refcount 为 0、且登记时间和文件 mtime 都超过宽限期的 blob，返回被删除（或将被删除）的路径
+    先执行 reconcile()，从未登记过的文件（写记录前出错的上传）也一并回收
+    """
+    cutoff = time.time() - grace_seconds
+    reconcile()
+    with Session(engine) as session:
+        stmt = select(UploadBlob.path).where(UploadBlob.refcount <= 0, UploadBlob.touched_at < cutoff)
+        candidates = session.exec(stmt).all()
+
+    removed = []
+    for rel_path in candidates:
+        abs_path = os.path.join(BASE_DIR, rel_path)
+        try:
+            if os.stat(abs_path).st_mtime >= cutoff:
+                continue  # 宽限期内又被上传过
+        except FileNotFoundError:
+            pass
+        if dry_run:
+            removed.append(rel_path)
+            continue
+        # 查询之后可能有新记录引用了这张图像：按条件逐个删除，只有真正删掉了这一行才删文件；
+        # 文件在事务提交前删除，期间写锁挡住新记录的登记
+        with engine.connect() as connection:
+            transaction = connection.begin()
+            result = connection.execute(
+                delete(UploadBlob).where(
+                    UploadBlob.path == rel_path, UploadBlob.refcount <= 0, UploadBlob.touched_at < cutoff
+                )
+            )
+            if result.rowcount != 1 or not _remove_file(abs_path, cutoff):
+                transaction.rollback()
+                continue
+            transaction.commit()
+        removed.append(rel_path)
+    return removed
@@ -0,0 +1,17 @@
+from typing import Optional
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from sqlmodel import SQLModel, Field, Column, JSON
+
+# 推理结果缓存：key = 图像 SHA-256 + 模型 SHA-256 + 推理参数
+class PredictionCacheEntry(SQLModel, table=True):
+    key: str = Field(primary_key=True)
+    image_hash: str = Field(index=True)
+    model_id: str = Field(index=True)
+    params: str = Field(default="default")
+
+    # parse_result 的返回结构（main_class / confidence / all_results / bboxes / class_scores_raw / class_probs）
+    result: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+
+    # 使用北京时间
+    created_at: datetime = Field(default_factory=lambda: datetime.now(tz=ZoneInfo('Asia/Shanghai')))
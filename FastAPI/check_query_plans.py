@@ -0,0 +1,133 @@
+import argparse
+import contextvars
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from sqlalchemy import event
+from sqlmodel import Session, create_engine
+from database import init_db
+import history_search
+from history_models import PredictionRecord
+
+# 检测历史查询计划检查：在临时库中灌入模拟数据，对常用检索组合执行 EXPLAIN QUERY PLAN，
+# 确认走了预期的索引，并给出实际查询耗时；有查询没走索引时退出码为 1
+# python check_query_plans.py [--rows 1000000] [--db 已有数据库路径]
+
+print = partial(print, flush=True)
+
+LABELS = ["No Impairment", "Very Mild Impairment", "Mild Impairment", "Moderate Impairment"]
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗"
+GIVEN = "伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超秀兰霞平刚桂英"
+
+_explain = contextvars.ContextVar("explain", default=False)
+
+# (说明, 筛选条件, 预期出现在查询计划中的索引)
+# 不足 3 个字符的姓名走 LIKE 子串扫描：按 (created_at, id) 索引倒序扫描，凑满一页即停止
+SCENARIOS = [
+    ("最新一页", {}, "ix_predictionrecord_created_at_id"),
+    ("按类别", {"label": "Mild Impairment"}, "ix_predictionrecord_label_created_at"),
+    ("按病历号", {"medical_id": "MR0000042"}, "ix_predictionrecord_medical_id_created_at"),
+    ("姓名子串", {"patient_name": "王秀英"}, history_search.FTS_TABLE),
+    ("姓名短词", {"patient_name": "王"}, "ix_predictionrecord_created_at_id"),
+    ("姓名或病历号", {"q": "MR00001"}, history_search.FTS_TABLE),
+    ("类别 + 日期", {"label": "No Impairment", "date_from": datetime(2025, 6, 1)}, "ix_predictionrecord_label_created_at"),
+    ("日期 + 置信度", {"date_from": datetime(2025, 6, 1), "conf_min": 0.9}, "ix_predictionrecord_created_at_id"),
+]
+
+
+def seed(engine, rows, chunk=50000):
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    done = 0
+    with engine.begin() as connection:
+        while done < rows:
+            n = min(chunk, rows - done)
+            batch = []
+            for i in range(done, done + n):
+                name = rng.choice(SURNAMES) + "".join(rng.choice(GIVEN) for _ in range(rng.randint(1, 2)))
+                created = start + timedelta(seconds=i * 30)
+                batch.append((
+                    name, rng.choice("男女"), rng.randint(50, 95), f"MR{rng.randint(0, rows // 5):07d}",
+                    rng.choice(LABELS), rng.random(), created.strftime("%Y-%m-%d %H:%M:%S.%f"),
+                ))
+            connection.exec_driver_sql(
+                "INSERT INTO predictionrecord (patient_name, patient_gender, patient_age, medical_id, "
+                "label, confidence, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+            done += n
+            print(f"   已写入 {done}/{rows}")
+        connection.exec_driver_sql("ANALYZE")
+
+
+def install_explain_hook(engine):
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def _explain_hook(conn, cursor, statement, parameters, context, executemany):
+        if _explain.get():
+            statement = "EXPLAIN QUERY PLAN " + statement
+        return statement, parameters
+
+
+def query_plan(engine, stmt):
+    token = _explain.set(True)
+    try:
+        with engine.connect() as connection:
+            return [row[-1] for row in connection.execute(stmt).all()]
+    finally:
+        _explain.reset(token)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000, help="模拟记录数（未指定 --db 时）")
+    parser.add_argument("--db", default=None, help="使用已有的 SQLite 数据库（只读检查）")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--budget_ms", type=float, default=50.0, help="单次查询耗时预算")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    if args.db:
+        db_path = args.db
+    else:
+        tmp_dir = tempfile.mkdtemp()
+        db_path = os.path.join(tmp_dir, "plan.db")
+    engine = create_engine(f"sqlite:///{db_path}")
+    init_db(engine)
+    if not args.db:
+        print(f"🧪 写入 {args.rows} 条模拟记录...")
+        seed(engine, args.rows)
+    install_explain_hook(engine)
+
+    columns = [name for name in PredictionRecord.model_fields if name not in ("all_results", "bboxes")]
+    failed = 0
+    with Session(engine) as session:
+        for desc, filters, expected in SCENARIOS:
+            stmt = history_search.list_statement(columns, filters, limit=args.limit)
+            plan = query_plan(engine, stmt)
+            t0 = time.perf_counter()
+            session.exec(stmt).all()
+            elapsed = (time.perf_counter() - t0) * 1000
+            ok = any(expected in line for line in plan)
+            slow = elapsed > args.budget_ms
+            failed += not ok
+            mark = "✅" if ok else "❌"
+            print(f"\n{mark} {desc} {filters}  {elapsed:.1f} ms{'  ⚠️ 超出预算' if slow else ''}")
+            for line in plan:
+                print(f"     {line}")
+            if not ok:
+                print(f"     预期使用: {expected}")
+
+    engine.dispose()
+    if tmp_dir:
+        os.remove(db_path)
+        os.rmdir(tmp_dir)
+    print(f"\n{'✅ 全部查询均命中索引' if not failed else f'❌ {failed} 个查询未命中预期索引'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import argparse
+import hashlib
+import os
+import random
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import cv2
+import numpy as np
+import albumentations as A
+import dataset_hash
+
+# 训练集增强，两种模式使用同一套变换策略：
+# 离线：为 train/<类别>/ 下每张原图生成一张 <name>_aug_<suffix><ext> 副本
+# - 进程池并行，文件列表分块提交；每个进程只构建一次增强流水线
+# - 已增强的原图记录在数据集根目录 .hash_manifest.db 的 augmented 表中，按目录列表比对，不再逐个 exists
+# - 每张图的随机种子由 (seed, 相对路径) 决定，同一策略重跑得到相同结果
+# 在线：训练时在 Ultralytics 分类数据集的变换前以概率 p 执行，不在磁盘上生成副本（online_trainer）
+#   python dataset_augment.py generate <train 目录> [--policy motion_blur,brightness_contrast] [--workers 8]
+#   python dataset_augment.py clean <train 目录>      删除已生成的 _aug_ 副本
+
+print = partial(print, flush=True)
+
+IMG_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+AUG_MARK = "_aug_"
+DEFAULT_POLICY = "motion_blur"
+DEFAULT_SUFFIX = "mri"
+CHUNK_SIZE = 64
+
+# 预置变换：名字 -> 构造函数（都以 p=1.0 依次执行）
+TRANSFORMS = {
+    # 模拟病人运动
+    "motion_blur": lambda: A.MotionBlur(blur_limit=(15, 31), p=1.0),
+    "gaussian_blur": lambda: A.GaussianBlur(blur_limit=(3, 7), p=1.0),
+    "gauss_noise": lambda: A.GaussNoise(p=1.0),
+    "brightness_contrast": lambda: A.RandomBrightnessContrast(brightness_limit=0.1, contrast_limit=0.1, p=1.0),
+    "gamma": lambda: A.RandomGamma(gamma_limit=(80, 120), p=1.0),
+    "clahe": lambda: A.CLAHE(clip_limit=2.0, p=1.0),
+    "sharpen": lambda: A.Sharpen(p=1.0),
+}
+
+
+def build_transform(policy):
+    """policy：逗号分隔的预置变换名，或 A.save 保存的 albumentations 配置文件（.json / .yaml）"""
+    if os.path.isfile(policy):
+        return A.load(policy, data_format="yaml" if policy.endswith((".yaml", ".yml")) else "json")
+    names = [name.strip() for name in policy.split(",") if name.strip()]
+    unknown = [name for name in names if name not in TRANSFORMS]
+    if unknown:
+        raise ValueError(f"未知的增强变换: {', '.join(unknown)}（可选: {', '.join(TRANSFORMS)}）")
+    return A.Compose([TRANSFORMS[name]() for name in names])
+
+
+def policy_id(policy, seed):
+    """策略指纹：变换或种子变了，旧的增强结果需要重新生成"""
+    spec = open(policy, "rb").read() if os.path.isfile(policy) else policy.encode("utf-8")
+    return hashlib.md5(spec + f"|{seed}".encode()).hexdigest()[:12]
+
+
+def image_seed(seed, rel_path):
+    return zlib.crc32(f"{seed}:{rel_path}".encode("utf-8"))
+
+
+def aug_name(file_name, suffix):
+    stem, ext = os.path.splitext(file_name)
+    return f"{stem}{AUG_MARK}{suffix}{ext}"
+
+
+_transform = None
+
+
+def _init_worker(policy):
+    global _transform
+    cv2.setNumThreads(1)  # 并行在进程层面，避免每个进程再开满线程
+    _transform = build_transform(policy)
+
+
+def _augment_one(src, dst, seed):
+    random.seed(seed)
+    np.random.seed(seed % (2 ** 32))
+    if hasattr(_transform, "set_random_seed"):
+        # albumentations 2.x 使用自己的随机数生成器
+        _transform.set_random_seed(seed)
+    image = cv2.imread(src)
+    if image is None:
+        return False
+    return cv2.imwrite(dst, _transform(image=image)['image'])
+
+
+def _augment_chunk(jobs, train_dir):
+    """子进程：处理一块 (相对路径, 输出文件名, 种子)，返回成功的相对路径"""
+    done = []
+    for rel_path, out_name, seed in jobs:
+        src = os.path.join(train_dir, rel_path)
+        dst = os.path.join(os.path.dirname(src), out_name)
+        try:
+            if _augment_one(src, dst, seed):
+                done.append(rel_path)
+        except Exception as e:
+            print(f"⚠️  {rel_path}: {e}")
+    return done
+
+
+def _ensure_table(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS augmented ("
+        " source TEXT NOT NULL, suffix TEXT NOT NULL, policy TEXT NOT NULL, seed INTEGER NOT NULL,"
+        " PRIMARY KEY (source, suffix))"
+    )
+
+
+def list_sources(train_dir):
+    """一次目录列表得到原图和已存在的文件名：[(相对路径, 文件名, 同目录文件名集合)]"""
+    sources = []
+    for class_entry in sorted(os.scandir(train_dir), key=lambda e: e.name):
+        if not class_entry.is_dir(): continue
+        names = set(os.listdir(class_entry.path))
+        for name in sorted(names):
+            if name.lower().endswith(IMG_EXTS) and AUG_MARK not in name:
+                sources.append((f"{class_entry.name}/{name}", name, names))
+    return sources
+
+
+def augment_offline(train_dir, policy=DEFAULT_POLICY, suffix=DEFAULT_SUFFIX, seed=42, workers=None):
+    """并行生成增强副本，返回统计 {"sources", "skipped", "generated", "failed", "seconds", "images_per_second"}"""
+    build_transform(policy)  # 先在主进程校验策略
+    pid = policy_id(policy, seed)
+    dataset_root = os.path.dirname(os.path.abspath(train_dir))
+    split = os.path.basename(os.path.abspath(train_dir))
+
+    with dataset_hash.HashManifest(dataset_root) as manifest:
+        conn = manifest.conn
+        _ensure_table(conn)
+        done = {
+            source: policy for source, policy in
+            conn.execute("SELECT source, policy FROM augmented WHERE suffix = ?", (suffix,))
+        }
+        jobs = []
+        sources = list_sources(train_dir)
+        for rel_path, name, siblings in sources:
+            out_name = aug_name(name, suffix)
+            key = f"{split}/{rel_path}"
+            # 清单里有记录、策略没变、输出文件也还在（目录列表里能看到）才跳过
+            if done.get(key) == pid and out_name in siblings:
+                continue
+            jobs.append((rel_path, out_name, image_seed(seed, key)))
+
+        print(f"🎨 离线增强：{len(sources)} 张原图，需生成 {len(jobs)} 张（策略 {policy}，后缀 _aug_{suffix}）")
+        start = time.perf_counter()
+        generated = 0
+        if jobs:
+            workers = workers or os.cpu_count() or 1
+            chunks = [jobs[i:i + CHUNK_SIZE] for i in range(0, len(jobs), CHUNK_SIZE)]
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(policy,)) as pool:
+                for n, finished in enumerate(pool.map(partial(_augment_chunk, train_dir=train_dir), chunks), 1):
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO augmented (source, suffix, policy, seed) VALUES (?, ?, ?, ?)",
+                        [(f"{split}/{rel_path}", suffix, pid, seed) for rel_path in finished],
+                    )
+                    generated += len(finished)
+                    if n % 50 == 0:
+                        conn.commit()
+                        elapsed = time.perf_counter() - start
+                        print(f"   已生成 {generated}/{len(jobs)}（{generated / elapsed:.1f} 张/秒）")
+        conn.commit()
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "sources": len(sources),
+        "skipped": len(sources) - len(jobs),
+        "generated": generated,
+        "failed": len(jobs) - generated,
+        "seconds": elapsed,
+        "images_per_second": generated / elapsed if generated and elapsed > 0 else None,
+    }
+    if generated:
+        print(f"✅ 增强完成：新生成 {generated} 张，耗时 {elapsed:.1f} 秒，{stats['images_per_second']:.1f} 张/秒"
+              f"（{workers} 个进程，跳过 {stats['skipped']}，失败 {stats['failed']}）")
+    else:
+        print("ℹ️  未生成新图像（可能已生成）")
+    return stats
+
+
+def clean_augmented(train_dir):
+    """删除 train_dir 下所有 _aug_ 副本并清空对应的清单记录，返回 (文件数, 字节数)"""
+    removed, freed = 0, 0
+    for class_entry in os.scandir(train_dir):
+        if not class_entry.is_dir(): continue
+        for entry in os.scandir(class_entry.path):
+            if entry.is_file() and AUG_MARK in entry.name and entry.name.lower().endswith(IMG_EXTS):
+                size = entry.stat().st_size
+                try:
+                    os.remove(entry.path)
+                except OSError as e:
+                    print(f"⚠️  {entry.path}: {e}")
+                    continue
+                removed += 1
+                freed += size
+    dataset_root = os.path.dirname(os.path.abspath(train_dir))
+    split = os.path.basename(os.path.abspath(train_dir))
+    with dataset_hash.HashManifest(dataset_root) as manifest:
+        _ensure_table(manifest.conn)
+        manifest.conn.execute("DELETE FROM augmented WHERE source LIKE ?", (f"{split}/%",))
+        manifest.conn.commit()
+    print(f"🧹 已删除 {removed} 张增强副本，释放 {freed / 1024 / 1024:.1f} MB")
+    return removed, freed
+
+
+class OnlineAugment:
+    """包在 Ultralytics 的 torch_transforms 外层：以概率 p 先执行增强策略（输入输出都是 PIL 图像）"""
+
+    def __init__(self, torch_transforms, policy=DEFAULT_POLICY, p=0.5):
+        self.torch_transforms = torch_transforms
+        self.policy = policy
+        self.p = p
+        self.transform = build_transform(policy)
+        self._seeded_pid = None
+
+    def __call__(self, im):
+        if random.random() < self.p:
+            pid = os.getpid()
+            if self._seeded_pid != pid and hasattr(self.transform, "set_random_seed"):
+                # albumentations 2.x 自带随机数生成器，DataLoader 各 worker 复制出来的状态相同；
+                # DataLoader 会给每个 worker 的 random 设置不同种子，从它派生
+                self.transform.set_random_seed(random.getrandbits(32))
+                self._seeded_pid = pid
+            from PIL import Image
+            im = Image.fromarray(self.transform(image=np.asarray(im))['image'])
+        return self.torch_transforms(im)
+
+
+def enable_online_augment(dataset, policy=DEFAULT_POLICY, p=0.5):
+    """给 ClassificationDataset 挂上在线增强，并去掉目录里残留的 _aug_ 副本，避免同一张图被增强两次"""
+    if getattr(dataset, "cache_ram", False):
+        print("⚠️  cache=ram 时不能过滤样本，保留已有的 _aug_ 副本")
+    else:
+        n = len(dataset.samples)
+        dataset.samples = [s for s in dataset.samples if AUG_MARK not in os.path.basename(str(s[0]))]
+        if n != len(dataset.samples):
+            print(f"ℹ️  在线增强模式忽略 {n - len(dataset.samples)} 张离线增强副本"
+                  f"（可用 python dataset_augment.py clean 删除）")
+    dataset.torch_transforms = OnlineAugment(dataset.torch_transforms, policy, p)
+    return dataset
+
+
+def online_trainer(policy=DEFAULT_POLICY, p=0.5):
+    """返回在训练集上启用在线增强的分类 Trainer，用于 model.train(trainer=...)"""
+    from ultralytics.models.yolo.classify import ClassificationTrainer
+
+    class OnlineAugTrainer(ClassificationTrainer):
+        def build_dataset(self, img_path, mode="train", batch=None):
+            dataset = super().build_dataset(img_path, mode, batch)
+            if mode == "train":
+                enable_online_augment(dataset, policy, p)
+            return dataset
+
+    return OnlineAugTrainer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_gen = sub.add_parser("generate")
+    p_gen.add_argument("train_dir")
+    p_gen.add_argument("--policy", default=DEFAULT_POLICY,
+                       help=f"逗号分隔的变换（{', '.join(TRANSFORMS)}）或 albumentations 配置文件")
+    p_gen.add_argument("--suffix", default=DEFAULT_SUFFIX)
+    p_gen.add_argument("--seed", type=int, default=42)
+    p_gen.add_argument("--workers", type=int, default=None)
+    p_clean = sub.add_parser("clean")
+    p_clean.add_argument("train_dir")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == "generate":
+        augment_offline(args.train_dir, args.policy, args.suffix, args.seed, args.workers)
+    elif args.command == "clean":
+        clean_augmented(args.train_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# 数据集文件哈希清单：<数据集>/.hash_manifest.db 按 (相对路径, 大小, mtime) 缓存内容哈希，
+# 数据集没变时重复运行去重不再读取任何图像，只对新增 / 修改过的文件重新计算；
+# 计算分散到进程池，每次顺序读取大块（网络存储上小块读取的往返开销很大）
+#   python dataset_hash.py <数据集目录> [--algo xxh3] [--workers 8]    只生成去重报告，不删除文件
+
+print = partial(print, flush=True)
+
+IMG_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+MANIFEST_NAME = ".hash_manifest.db"
+REPORT_NAME = "dedup_report.json"
+READ_BLOCK_SIZE = int(os.environ.get("DATASET_HASH_BLOCK_SIZE", str(8 * 1024 * 1024)))
+# 每计算多少个文件提交一次清单，中途中断时已算好的部分不会丢
+COMMIT_EVERY = 2000
+
+
+def _hasher(algo):
+    if algo == "xxh3":
+        import xxhash
+        return xxhash.xxh3_128()
+    if algo == "xxh64":
+        import xxhash
+        return xxhash.xxh64()
+    if algo == "blake3":
+        from blake3 import blake3
+        return blake3()
+    return hashlib.new(algo)
+
+
+def available_algos():
+    """md5 / blake2b 总是可用；xxh3 / xxh64 需要 xxhash，blake3 需要 blake3"""
+    algos = ["md5", "blake2b"]
+    for algo in ("xxh3", "xxh64", "blake3"):
+        try:
+            _hasher(algo)
+            algos.append(algo)
+        except ImportError:
+            pass
+    return algos
+
+
+def hash_file(path, algo="md5", block_size=READ_BLOCK_SIZE):
+    """计算文件哈希，读取失败返回 None"""
+    hasher = _hasher(algo)
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    try:
+        with open(path, 'rb', buffering=0) as f:
+            while n := f.readinto(buf):
+                hasher.update(view[:n])
+        return hasher.hexdigest()
+    except OSError:
+        return None
+
+
+def _hash_job(job, root, algo):
+    path, size, mtime_ns = job
+    return path, size, mtime_ns, hash_file(os.path.join(root, path), algo)
+
+
+def scan_images(root, subdirs):
+    """列出 root/<subdir>/<类别>/ 下的图像，返回 {相对 root 的路径: (大小, mtime_ns)}"""
+    files = {}
+    for subdir in subdirs:
+        split_dir = os.path.join(root, subdir)
+        if not os.path.isdir(split_dir): continue
+        for class_entry in os.scandir(split_dir):
+            if not class_entry.is_dir(): continue
+            for entry in os.scandir(class_entry.path):
+                if entry.is_file() and entry.name.lower().endswith(IMG_EXTS):
+                    st = entry.stat()
+                    rel = os.path.relpath(entry.path, root).replace(os.sep, "/")
+                    files[rel] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+class HashManifest:
+    def __init__(self, root, algo="md5"):
+        self.root = root
+        self.algo = algo
+        self.path = os.path.join(root, MANIFEST_NAME)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_hash ("
+            " path TEXT NOT NULL, algo TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " digest TEXT NOT NULL, PRIMARY KEY (path, algo))"
+        )
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def update(self, subdirs=("train",), workers=None):
+        """
+        同步清单与磁盘：大小和 mtime 都没变的文件直接用缓存的哈希，其余的用进程池重新计算，
+        已删除文件的记录一并清理。返回 ({相对路径: 哈希}, 统计)
+        """
+        files = scan_images(self.root, subdirs)
+        cached = {
+            path: (size, mtime_ns, digest)
+            for path, size, mtime_ns, digest in self.conn.execute(
+                "SELECT path, size, mtime_ns, digest FROM file_hash WHERE algo = ?", (self.algo,)
+            )
+        }
+        digests = {}
+        stale = []
+        for path, (size, mtime_ns) in files.items():
+            hit = cached.get(path)
+            if hit and hit[0] == size and hit[1] == mtime_ns:
+                digests[path] = hit[2]
+            else:
+                stale.append((path, size, mtime_ns))
+
+        prefixes = tuple(f"{subdir}/" for subdir in subdirs)
+        removed = [(path, self.algo) for path in cached if path.startswith(prefixes) and path not in files]
+        self.conn.executemany("DELETE FROM file_hash WHERE path = ? AND algo = ?", removed)
+
+        start = time.perf_counter()
+        hashed_bytes = 0
+        failed = 0
+        if stale:
+            workers = workers or os.cpu_count() or 1
+            print(f"🔢 需要计算哈希: {len(stale)} 个文件（缓存命中 {len(digests)}，{workers} 个进程，{self.algo}）")
+            pending = []
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for i, (path, size, mtime_ns, digest) in enumerate(
+                    pool.map(partial(_hash_job, root=self.root, algo=self.algo), stale, chunksize=32), 1
+                ):
+                    if digest is None:
+                        failed += 1
+                        continue
+                    digests[path] = digest
+                    hashed_bytes += size
+                    pending.append((path, self.algo, size, mtime_ns, digest))
+                    if len(pending) >= COMMIT_EVERY:
+                        self._save(pending)
+                        print(f"   已计算 {i}/{len(stale)}")
+            self._save(pending)
+        self.conn.commit()
+        elapsed = time.perf_counter() - start
+        stats = {
+            "files": len(files),
+            "cached": len(files) - len(stale),
+            "hashed": len(stale) - failed,
+            "failed": failed,
+            "removed": len(removed),
+            "seconds": elapsed,
+            "mb_per_second": hashed_bytes / 1024 / 1024 / elapsed if stale and elapsed > 0 else None,
+        }
+        return digests, stats
+
+    def _save(self, rows):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO file_hash (path, algo, size, mtime_ns, digest) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        self.conn.commit()
+        rows.clear()
+
+    def forget(self, paths):
+        self.conn.executemany("DELETE FROM file_hash WHERE path = ?", [(p,) for p in paths])
+        self.conn.commit()
+
+
+def find_duplicates(digests):
+    """按哈希分组，每组按路径排序保留第一个，返回 [{"digest", "keep", "duplicates"}]"""
+    groups = defaultdict(list)
+    for path, digest in digests.items():
+        groups[digest].append(path)
+    return [
+        {"digest": digest, "keep": paths[0], "duplicates": paths[1:]}
+        for digest, paths in ((d, sorted(p)) for d, p in groups.items())
+        if len(paths) > 1
+    ]
+
+
+def write_report(root, groups, stats, algo, dry_run):
+    report = {
+        "algo": algo,
+        "dry_run": dry_run,
+        "duplicate_files": sum(len(g["duplicates"]) for g in groups),
+        "groups": groups,
+        "hash_stats": stats,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    path = os.path.join(root, REPORT_NAME)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def deduplicate(root, subdirs=("train",), algo="md5", workers=None, dry_run=False):
+    """精确去重：先写报告，dry_run 时只列出重复文件，否则删除每组除第一个以外的文件。返回删除（或将删除）的数量"""
+    if algo not in available_algos():
+        print(f"⚠️  未安装 {algo} 对应的库，改用 md5")
+        algo = "md5"
+    with HashManifest(root, algo) as manifest:
+        digests, stats = manifest.update(subdirs, workers)
+        speed = f"，{stats['mb_per_second']:.1f} MB/s" if stats["mb_per_second"] else ""
+        print(f"✅ 哈希完成：{stats['files']} 个文件，缓存命中 {stats['cached']}，"
+              f"新计算 {stats['hashed']}，耗时 {stats['seconds']:.1f} 秒{speed}")
+
+        groups = find_duplicates(digests)
+        report_path = write_report(root, groups, stats, algo, dry_run)
+        deleted = []
+        for group in groups:
+            for path in group["duplicates"]:
+                if dry_run:
+                    print(f"📝 重复: {path}  (保留 {group['keep']})")
+                    deleted.append(path)
+                    continue
+                print(f"🗑️  删除重复: {path}")
+                try:
+                    os.remove(os.path.join(root, path))
+                    deleted.append(path)
+                except OSError:
+                    pass
+        if not dry_run:
+            manifest.forget(deleted)
+    action = "将删除" if dry_run else "共删除"
+    print(f"✅ 去重结束：{action} {len(deleted)} 张（{len(groups)} 组），报告: {report_path}")
+    return len(deleted)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dataset")
+    parser.add_argument("--algo", default="md5", choices=["md5", "blake2b", "xxh3", "xxh64", "blake3"])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--subdirs", default="train", help="参与去重的子目录，逗号分隔")
+    parser.add_argument("--delete", action="store_true", help="删除重复文件（默认只生成报告）")
+    args = parser.parse_args()
+    subdirs = tuple(s.strip() for s in args.subdirs.split(",") if s.strip())
+    deduplicate(args.dataset, subdirs, args.algo, args.workers, dry_run=not args.delete)
+
+
+if __name__ == "__main__":
+    main()
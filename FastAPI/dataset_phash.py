@@ -0,0 +1,312 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import combinations
+import cv2
+import numpy as np
+import dataset_hash
+
+# 近重复检测：精确哈希发现不了重新压缩 / 缩放 / 调窗后的同一张切片，这里用感知哈希（pHash / dHash，64 位）
+# 找汉明距离不超过 radius 的图像簇，重点标出同时出现在 train/ 和 valid/ 中的簇（验证集泄漏）
+#   python dataset_phash.py <数据集目录> [--radius 6] [--hash phash] [--action report|quarantine_cross|quarantine]
+# 哈希与精确去重共用数据集根目录的 .hash_manifest.db，按 (路径, 大小, mtime) 缓存
+# 检索用多索引哈希（LSH 的一种）：64 位切成 BANDS 段，距离 <= radius 的两张图至少有一段的距离
+# <= radius // BANDS（抽屉原理），每段按值排序后只探测这些邻近值，不做 N^2 两两比较
+
+print = partial(print, flush=True)
+
+HASH_KINDS = ("phash", "dhash")
+BANDS = 4
+BAND_BITS = 64 // BANDS
+REPORT_NAME = "near_dup_report.json"
+QUARANTINE_DIR = "quarantine"
+# 每个进程任务处理的图像数
+CHUNK_SIZE = 256
+# 每段一次探测的查询数，控制候选对数组的内存
+QUERY_CHUNK = 262144
+
+
+def _dct_matrix(n=32):
+    k = np.arange(n)[:, None]
+    m = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m.astype(np.float32)
+
+
+_DCT = _dct_matrix()
+
+
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(values):
+    """uint64 数组逐元素数 1 的个数（numpy < 2.0 没有 bitwise_count）"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _BYTE_POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _pack(bits):
+    """(N, 64) bool -> (N,) uint64"""
+    return np.packbits(bits.reshape(len(bits), 64), axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def compute_hashes(grays):
+    """grays: (N, 32, 32) float32 灰度图，批量返回 (phash, dhash)"""
+    # pHash：二维 DCT 取左上 8x8 低频系数，与中位数比较
+    low = (_DCT @ grays @ _DCT.T)[:, :8, :8].reshape(len(grays), 64)
+    phash = _pack(low > np.median(low, axis=1, keepdims=True))
+    # dHash：缩到 9x8，相邻像素比较
+    small = np.stack([cv2.resize(g, (9, 8), interpolation=cv2.INTER_AREA) for g in grays])
+    dhash = _pack(small[:, :, 1:] > small[:, :, :-1])
+    return phash, dhash
+
+
+def _hash_chunk(paths, root):
+    """子进程：读图并批量计算，ok 标记每张图是否读取成功（失败的不产出哈希）"""
+    grays, ok = [], []
+    for path in paths:
+        image = cv2.imread(os.path.join(root, path), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            ok.append(False)
+            continue
+        grays.append(cv2.resize(image, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32))
+        ok.append(True)
+    if not grays:
+        return paths, ok, np.zeros(0, np.uint64), np.zeros(0, np.uint64)
+    phash, dhash = compute_hashes(np.stack(grays))
+    return paths, ok, phash, dhash
+
+
+def _to_db(value):
+    # SQLite INTEGER 是有符号 64 位
+    return int(np.uint64(value).view(np.int64))
+
+
+def update_hashes(root, subdirs=("train", "valid"), workers=None):
+    """返回 (相对路径列表, {"phash": uint64 数组, "dhash": uint64 数组})，只对新增 / 修改过的图像重新计算"""
+    files = dataset_hash.scan_images(root, subdirs)
+    with dataset_hash.HashManifest(root) as manifest:
+        conn = manifest.conn
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS image_phash ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " phash INTEGER NOT NULL, dhash INTEGER NOT NULL)"
+        )
+        cached = {row[0]: row[1:] for row in conn.execute("SELECT path, size, mtime_ns, phash, dhash FROM image_phash")}
+        hashes = {}
+        stale = []
+        for path, (size, mtime_ns) in files.items():
+            hit = cached.get(path)
+            if hit and hit[0] == size and hit[1] == mtime_ns:
+                hashes[path] = (hit[2], hit[3])
+            else:
+                stale.append(path)
+        prefixes = tuple(f"{subdir}/" for subdir in subdirs)
+        conn.executemany(
+            "DELETE FROM image_phash WHERE path = ?",
+            [(path,) for path in cached if path.startswith(prefixes) and path not in files],
+        )
+
+        if stale:
+            workers = workers or os.cpu_count() or 1
+            print(f"🔢 需要计算感知哈希: {len(stale)} 张（缓存命中 {len(hashes)}，{workers} 个进程）")
+            start = time.perf_counter()
+            chunks = [stale[i:i + CHUNK_SIZE] for i in range(0, len(stale), CHUNK_SIZE)]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for n, (paths, ok, phash, dhash) in enumerate(pool.map(partial(_hash_chunk, root=root), chunks), 1):
+                    rows = []
+                    for path, values in zip((p for p, good in zip(paths, ok) if good), zip(phash, dhash)):
+                        values = (_to_db(values[0]), _to_db(values[1]))
+                        hashes[path] = values
+                        rows.append((path, *files[path], *values))
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO image_phash (path, size, mtime_ns, phash, dhash) VALUES (?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    if n % 40 == 0:
+                        conn.commit()
+                        print(f"   已计算 {min(n * CHUNK_SIZE, len(stale))}/{len(stale)}")
+            elapsed = time.perf_counter() - start
+            print(f"✅ 感知哈希完成：{len(stale)} 张，耗时 {elapsed:.1f} 秒（{len(stale) / max(elapsed, 1e-9):.0f} 张/秒）")
+        conn.commit()
+
+    paths = sorted(hashes)
+    values = np.array([hashes[p] for p in paths], dtype=np.int64).reshape(-1, 2).view(np.uint64)
+    return paths, {"phash": values[:, 0].copy(), "dhash": values[:, 1].copy()}
+
+
+def _probe_masks(radius):
+    """段内距离 <= radius 的所有异或掩码"""
+    masks = [0]
+    for d in range(1, radius + 1):
+        masks.extend(sum(1 << b for b in bits) for bits in combinations(range(BAND_BITS), d))
+    return np.array(masks, dtype=np.int64)
+
+
+def find_pairs(hashes, radius):
+    """返回汉明距离 <= radius 的所有图像对 (i, j)，i < j"""
+    n = len(hashes)
+    if n < 2:
+        return np.zeros((0, 2), np.int64)
+    masks = _probe_masks(radius // BANDS)
+    found = []
+    for band in range(BANDS):
+        keys = ((hashes >> np.uint64(band * BAND_BITS)) & np.uint64((1 << BAND_BITS) - 1)).astype(np.int64)
+        # 每段只有 2^16 个取值，直接用计数数组定位桶，不用二分查找
+        bucket_sizes = np.bincount(keys, minlength=1 << BAND_BITS)
+        bucket_starts = np.cumsum(bucket_sizes) - bucket_sizes
+        order = np.argsort(keys, kind="stable")
+        for mask in masks:
+            for lo_i in range(0, n, QUERY_CHUNK):
+                query_idx = np.arange(lo_i, min(lo_i + QUERY_CHUNK, n))
+                probe = keys[query_idx] ^ mask
+                lo = bucket_starts[probe]
+                counts = bucket_sizes[probe]
+                if not counts.any():
+                    continue
+                i = np.repeat(query_idx, counts)
+                # 每个查询在 [lo, hi) 内展开
+                offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                j = order[np.repeat(lo, counts) + offsets]
+                keep = i < j
+                i, j = i[keep], j[keep]
+                dist = popcount(hashes[i] ^ hashes[j])
+                near = dist <= radius
+                # 同一对可能在多个段被找到，编码成 i * n + j 后去重
+                found.append(i[near] * n + j[near])
+    codes = np.unique(np.concatenate(found)) if found else np.zeros(0, np.int64)
+    return np.stack([codes // n, codes % n], axis=1)
+
+
+def clusters_from_pairs(n, pairs):
+    """并查集合并为连通分量，返回 [[下标, ...]]（只含大于 1 的簇）"""
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j in pairs.tolist():
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+    groups = {}
+    for idx in np.unique(pairs).tolist():
+        groups.setdefault(find(idx), []).append(idx)
+    return list(groups.values())
+
+
+def _split(path):
+    return path.split("/", 1)[0]
+
+
+def find_near_duplicates(root, subdirs=("train", "valid"), radius=6, kind="phash", workers=None):
+    """返回 (簇列表, 统计)。每个簇的成员按路径排序，第一个（train/ 优先）作为保留项"""
+    paths, hashes = update_hashes(root, subdirs, workers)
+    values = hashes[kind]
+    start = time.perf_counter()
+    pairs = find_pairs(values, radius)
+    groups = clusters_from_pairs(len(paths), pairs)
+    elapsed = time.perf_counter() - start
+
+    clusters = []
+    for members in groups:
+        members.sort(key=lambda idx: paths[idx])
+        splits = sorted({_split(paths[idx]) for idx in members})
+        keep = values[members[0]]
+        clusters.append({
+            "keep": paths[members[0]],
+            "members": [
+                {"path": paths[idx], "distance": int(popcount(values[idx] ^ keep))} for idx in members[1:]
+            ],
+            "splits": splits,
+            "cross_split": "train" in splits and "valid" in splits,
+        })
+    clusters.sort(key=lambda c: (not c["cross_split"], c["keep"]))
+    stats = {
+        "images": len(paths),
+        "pairs": len(pairs),
+        "clusters": len(clusters),
+        "cross_split_clusters": sum(c["cross_split"] for c in clusters),
+        "search_seconds": elapsed,
+    }
+    return clusters, stats
+
+
+def quarantine(root, clusters, only_cross_split=False):
+    """把每个簇中保留项以外的图像移到 <数据集>/quarantine/ 下（保持相对路径），返回移动数量"""
+    moved = 0
+    for cluster in clusters:
+        if only_cross_split and not cluster["cross_split"]:
+            continue
+        for member in cluster["members"]:
+            src = os.path.join(root, member["path"])
+            dst = os.path.join(root, QUARANTINE_DIR, member["path"])
+            if not os.path.exists(src):
+                continue
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.move(src, dst)
+            moved += 1
+    return moved
+
+
+def check_near_duplicates(root, subdirs=("train", "valid"), radius=6, kind="phash", workers=None,
+                          action="report"):
+    """
+    检测并写 near_dup_report.json；action: report 只报告 / quarantine_cross 隔离跨 train/valid 的簇 /
+    quarantine 隔离所有簇。返回跨 train/valid 的簇数
+    """
+    print(f"\n🔍 启动近重复检测（{kind}，汉明距离 <= {radius}）...")
+    clusters, stats = find_near_duplicates(root, subdirs, radius, kind, workers)
+    moved = 0
+    if action != "report":
+        moved = quarantine(root, clusters, only_cross_split=action == "quarantine_cross")
+    report = {
+        "hash": kind,
+        "radius": radius,
+        "action": action,
+        "quarantined": moved,
+        "stats": stats,
+        "clusters": clusters,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    report_path = os.path.join(root, REPORT_NAME)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for cluster in clusters:
+        if not cluster["cross_split"]:
+            break
+        others = ", ".join(m["path"] for m in cluster["members"][:5])
+        more = f" 等 {len(cluster['members'])} 张" if len(cluster["members"]) > 5 else ""
+        print(f"⚠️  跨 train/valid: {cluster['keep']} ≈ {others}{more}")
+    print(f"✅ 近重复检测结束：{stats['images']} 张，{stats['clusters']} 个簇，"
+          f"其中跨 train/valid {stats['cross_split_clusters']} 个，检索耗时 {stats['search_seconds']:.1f} 秒")
+    if moved:
+        print(f"📦 已隔离 {moved} 张到 {os.path.join(root, QUARANTINE_DIR)}")
+    print(f"   报告: {report_path}")
+    return stats["cross_split_clusters"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dataset")
+    parser.add_argument("--radius", type=int, default=6, help="汉明距离阈值（64 位）")
+    parser.add_argument("--hash", default="phash", choices=HASH_KINDS)
+    parser.add_argument("--subdirs", default="train,valid", help="参与检测的子目录，逗号分隔")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--action", default="report", choices=["report", "quarantine_cross", "quarantine"])
+    args = parser.parse_args()
+    subdirs = tuple(s.strip() for s in args.subdirs.split(",") if s.strip())
+    check_near_duplicates(args.dataset, subdirs, args.radius, args.hash, args.workers, args.action)
+
+
+if __name__ == "__main__":
+    main()
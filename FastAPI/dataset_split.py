@@ -0,0 +1,289 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import time
+from collections import Counter, defaultdict
+from functools import partial
+import dataset_hash
+
+# 验证集划分：不移动原始图像，只写划分清单并用链接生成视图
+#   <数据集>/splits/<名称>.json        划分清单：参数 + 每个 split 的文件列表（相对路径、类别、内容哈希）
+#   <数据集>/views/<名称>/{train,valid}/<类别>/   由清单生成的视图，优先硬链接，其次符号链接，最后复制
+# 原图池为 train/ 与 valid/（兼容旧版 create_validation_split 移动过的数据集），不含 _aug_ 副本
+# 支持随机 / 分层 / k 折划分，可按病人分组（同一病人的图像只出现在一侧）
+#   python dataset_split.py <数据集目录> --strategy stratified --ratio 0.15 [--group_pattern "^(OAS1_\d+)"]
+#   python dataset_split.py <数据集目录> --strategy kfold --k 5 --fold 0
+
+print = partial(print, flush=True)
+
+STRATEGIES = ("random", "stratified", "kfold")
+SOURCE_SUBDIRS = ("train", "valid")
+SPLITS_DIR = "splits"
+VIEWS_DIR = "views"
+VIEW_STAMP = ".view.json"
+
+
+def split_name(strategy, ratio, seed, k=None, fold=None, grouped=False):
+    name = f"{strategy}-k{k}-f{fold}" if strategy == "kfold" else f"{strategy}-{int(round(ratio * 100))}"
+    return f"{name}-s{seed}{'-g' if grouped else ''}"
+
+
+def list_pool(root, subdirs=SOURCE_SUBDIRS):
+    """原图池：[(相对 root 的路径, 类别)]，按路径排序"""
+    items = []
+    for path in sorted(dataset_hash.scan_images(root, subdirs)):
+        if "_aug_" in os.path.basename(path):
+            continue
+        items.append((path, path.split("/")[1]))
+    return items
+
+
+def _group_key(path, pattern):
+    """病人 / 分组标识：group_pattern 在文件名上匹配，有捕获组时取第一个捕获组；不匹配则单独成组"""
+    name = os.path.basename(path)
+    if pattern is not None:
+        m = pattern.search(name)
+        if m:
+            return m.group(1) if m.groups() else m.group(0)
+    return f"file:{path}"
+
+
+def _strata(items, stratified, group_pattern):
+    """按分组聚合后再按类别分层：{层: [(分组, [路径...]), ...]}。分组的类别取组内最多的类别"""
+    groups = defaultdict(list)
+    for path, class_name in items:
+        groups[_group_key(path, group_pattern)].append((path, class_name))
+    strata = defaultdict(list)
+    for key in sorted(groups):
+        members = groups[key]
+        label = Counter(c for _, c in members).most_common(1)[0][0] if stratified else "*"
+        strata[label].append((key, [p for p, _ in members]))
+    return strata
+
+
+def assign_folds(items, k, seed, stratified=True, group_pattern=None):
+    """k 折：每层内分组打乱后按大小从大到小放进当前图像最少的一折，返回 {路径: 折号}"""
+    rng = random.Random(seed)
+    folds = {}
+    for label, groups in sorted(_strata(items, stratified, group_pattern).items()):
+        rng.shuffle(groups)
+        groups.sort(key=lambda g: -len(g[1]))  # 稳定排序，同样大小的保持打乱后的顺序
+        sizes = [0] * k
+        for _, paths in groups:
+            fold = sizes.index(min(sizes))
+            sizes[fold] += len(paths)
+            for path in paths:
+                folds[path] = fold
+    return folds
+
+
+def assign_holdout(items, ratio, seed, stratified=True, group_pattern=None):
+    """按比例划出验证集：每层内分组打乱后依次放入验证集直到达到 int(层内图像数 * ratio)，返回验证集路径集合"""
+    rng = random.Random(seed)
+    valid = set()
+    for label, groups in sorted(_strata(items, stratified, group_pattern).items()):
+        rng.shuffle(groups)
+        target = int(sum(len(paths) for _, paths in groups) * ratio)
+        count = 0
+        for _, paths in groups:
+            if count >= target:
+                break
+            valid.update(paths)
+            count += len(paths)
+    return valid
+
+
+def create_split(root, strategy="stratified", ratio=0.15, seed=42, k=5, fold=0, group_pattern=None,
+                 name=None, workers=None, algo="md5"):
+    """生成划分清单 splits/<name>.json 并返回其内容"""
+    if strategy not in STRATEGIES:
+        raise ValueError(f"未知的划分方式: {strategy}（可选: {', '.join(STRATEGIES)}）")
+    if strategy == "kfold" and not 0 <= fold < k:
+        raise ValueError(f"fold 需在 [0, {k}) 内")
+    pattern = re.compile(group_pattern) if group_pattern else None
+    name = name or split_name(strategy, ratio, seed, k, fold, bool(group_pattern))
+
+    items = list_pool(root)
+    if not items:
+        raise ValueError(f"{root} 下没有可划分的图像")
+    # 内容哈希与去重共用 .hash_manifest.db，只对新增 / 修改过的文件计算
+    with dataset_hash.HashManifest(root, algo) as manifest:
+        digests, _ = manifest.update(SOURCE_SUBDIRS, workers)
+
+    stratified = strategy != "random"
+    if strategy == "kfold":
+        folds = assign_folds(items, k, seed, stratified, pattern)
+        in_valid = lambda path: folds[path] == fold
+    else:
+        valid = assign_holdout(items, ratio, seed, stratified, pattern)
+        in_valid = lambda path: path in valid
+
+    files = {"train": [], "valid": []}
+    for path, class_name in items:
+        files["valid" if in_valid(path) else "train"].append(
+            {"path": path, "class": class_name, "digest": digests.get(path)}
+        )
+
+    groups = {split: {_group_key(f["path"], pattern) for f in entries} for split, entries in files.items()}
+    leaked = sorted(g for g in groups["train"] & groups["valid"] if not g.startswith("file:"))
+    split = {
+        "name": name,
+        "strategy": strategy,
+        "ratio": ratio if strategy != "kfold" else 1 / k,
+        "seed": seed,
+        "k": k if strategy == "kfold" else None,
+        "fold": fold if strategy == "kfold" else None,
+        "group_pattern": group_pattern,
+        "hash": algo,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "summary": {
+            s: dict(sorted(Counter(f["class"] for f in entries).items())) for s, entries in files.items()
+        },
+        "leaked_groups": leaked,
+        "files": files,
+    }
+    os.makedirs(os.path.join(root, SPLITS_DIR), exist_ok=True)
+    with open(split_path(root, name), "w", encoding="utf-8") as f:
+        json.dump(split, f, ensure_ascii=False, indent=1)
+    print(f"📝 划分清单: {split_path(root, name)}")
+    for s, counts in split["summary"].items():
+        print(f"   {s:<6}{sum(counts.values()):>7} 张  " + "  ".join(f"{c}: {n}" for c, n in counts.items()))
+    if group_pattern:
+        groups_n = len(groups["train"] | groups["valid"])
+        print(f"   按病人分组：{groups_n} 组，{'⚠️  ' + str(len(leaked)) + ' 组同时出现在两侧' if leaked else '无跨 train/valid 的病人'}")
+    return split
+
+
+def split_path(root, name):
+    return os.path.join(root, SPLITS_DIR, f"{name}.json")
+
+
+def load_split(root, name):
+    with open(split_path(root, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _fingerprint(split):
+    h = hashlib.md5()
+    for s in ("train", "valid"):
+        for entry in split["files"][s]:
+            h.update(f"{s}|{entry['path']}|{entry['digest']}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _link(src, dst, mode):
+    """按 hard -> symlink -> copy 的顺序尝试，返回实际使用的方式"""
+    if mode == "hard":
+        try:
+            os.link(src, dst)
+            return "hard"
+        except OSError:
+            mode = "symlink"  # 跨文件系统 / 不支持硬链接
+    if mode == "symlink":
+        try:
+            os.symlink(src, dst)
+            return "symlink"
+        except OSError:
+            pass  # Windows 未开启开发者模式时没有权限
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def materialize(root, split, link="hard", view_dir=None):
+    """
+    按清单生成视图 views/<name>/{train,valid}/<类别>/，返回视图目录
+    视图中的 .view.json 记录清单指纹，清单没变时直接复用（重复调用几乎不花时间）
+    """
+    view_dir = view_dir or os.path.join(root, VIEWS_DIR, split["name"])
+    stamp_path = os.path.join(view_dir, VIEW_STAMP)
+    fingerprint = _fingerprint(split)
+    if os.path.exists(stamp_path):
+        try:
+            with open(stamp_path, "r", encoding="utf-8") as f:
+                if json.load(f).get("fingerprint") == fingerprint:
+                    print(f"✅ 视图已是最新: {view_dir}")
+                    return view_dir
+        except (OSError, ValueError):
+            pass
+    # 清单变了，或上次生成到一半中断（没有 .view.json）：视图里只有链接（和训练时生成的文件），
+    # 整体删掉重建，不影响原图；否则残留的链接会让同名文件再加一份前缀副本
+    if os.path.isdir(view_dir):
+        shutil.rmtree(view_dir)
+
+    start = time.perf_counter()
+    used = Counter()
+    missing = []
+    created_dirs = set()
+    for s in ("train", "valid"):
+        for entry in split["files"][s]:
+            src = os.path.abspath(os.path.join(root, entry["path"]))
+            # 清单生成后原图被删除 / 移动：跳过，不生成悬空链接
+            if not os.path.exists(src):
+                missing.append(entry["path"])
+                continue
+            class_dir = os.path.join(view_dir, s, entry["class"])
+            if class_dir not in created_dirs:
+                os.makedirs(class_dir, exist_ok=True)
+                created_dirs.add(class_dir)
+            # 旧 valid/ 里的文件可能和 train/ 里的同名，加上来源目录前缀避免覆盖
+            name = os.path.basename(entry["path"])
+            dst = os.path.join(class_dir, name)
+            if os.path.lexists(dst):
+                dst = os.path.join(class_dir, f"{entry['path'].split('/')[0]}_{name}")
+            used[_link(src, dst, link)] += 1
+    os.makedirs(view_dir, exist_ok=True)
+    with open(stamp_path, "w", encoding="utf-8") as f:
+        json.dump({"split": split["name"], "fingerprint": fingerprint, "links": dict(used), "missing": missing}, f)
+    elapsed = time.perf_counter() - start
+    print(f"✅ 视图生成完成：{sum(used.values())} 个文件（{', '.join(f'{k} {v}' for k, v in used.items())}），"
+          f"耗时 {elapsed:.1f} 秒: {view_dir}")
+    if missing:
+        print(f"⚠️  {len(missing)} 个原图已不存在，未加入视图（重新运行 dataset_split.py 生成新清单）：")
+        for path in missing[:10]:
+            print(f"   {path}")
+    return view_dir
+
+
+def prepare_view(root, strategy="stratified", ratio=0.15, seed=42, k=5, fold=0, group_pattern=None,
+                 name=None, link="hard", workers=None):
+    """训练入口：清单已存在就直接用（划分结果不随原图增加而悄悄变化），否则生成；返回视图目录"""
+    name = name or split_name(strategy, ratio, seed, k, fold, bool(group_pattern))
+    if os.path.exists(split_path(root, name)):
+        print(f"📝 使用已有划分清单: {split_path(root, name)}")
+        split = load_split(root, name)
+    else:
+        split = create_split(root, strategy, ratio, seed, k, fold, group_pattern, name, workers)
+    return materialize(root, split, link)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dataset")
+    parser.add_argument("--strategy", default="stratified", choices=STRATEGIES)
+    parser.add_argument("--ratio", type=float, default=0.15)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--fold", type=int, default=0)
+    parser.add_argument("--group_pattern", default=None, help="从文件名提取病人标识的正则，取第一个捕获组")
+    parser.add_argument("--name", default=None, help="清单名，默认由参数生成")
+    parser.add_argument("--link", default="hard", choices=["hard", "symlink", "copy"])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no_view", action="store_true", help="只写清单，不生成视图")
+    parser.add_argument("--all_folds", action="store_true", help="kfold 时一次生成全部 k 折的清单和视图")
+    args = parser.parse_args()
+
+    folds = range(args.k) if args.strategy == "kfold" and args.all_folds else [args.fold]
+    for fold in folds:
+        name = args.name if len(folds) == 1 else None
+        split = create_split(args.dataset, args.strategy, args.ratio, args.seed, args.k, fold,
+                             args.group_pattern, name, args.workers)
+        if not args.no_view:
+            materialize(args.dataset, split, args.link)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import asyncio
+import os
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import async_engine
+
+# 单写任务：把多个请求的 PredictionRecord 插入合并到一个事务中提交
+# SQLite 同一时刻只允许一个写事务，多个请求各自 commit 只会互相等锁；合并后一次 fsync 写入一批
+# 通过异步引擎写入，不占用线程池，也不阻塞事件循环
+
+# 一个事务最多合并的写请求数
+DB_WRITE_BATCH = int(os.environ.get("DB_WRITE_BATCH", "64"))
+# 收到第一个写请求后最多再等待多久（毫秒）凑批
+DB_WRITE_MAX_WAIT_MS = float(os.environ.get("DB_WRITE_MAX_WAIT_MS", "5"))
+
+_STOP = object()
+
+
+class RecordWriter:
+    def __init__(self, max_batch=DB_WRITE_BATCH, max_wait_ms=DB_WRITE_MAX_WAIT_MS):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._task = None
+        self.transactions = 0
+        self.records = 0
+        self.failures = 0
+
+    def _ensure_started(self):
+        # 写任务绑定在当前事件循环上，第一次写入时启动
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def write(self, recs):
+        """写入一组记录（同一请求的记录保证在同一个事务中），返回自增 id 列表"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((list(recs), future))
+        return await future
+
+    async def _collect(self, first):
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout) if timeout > 0 else self._queue.get_nowait()
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                break
+            if item is _STOP:
+                self._queue.put_nowait(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    async def _commit(self, batch):
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            for recs, _ in batch:
+                session.add_all(recs)
+            # flush 后即可拿到自增 id，避免 commit 后逐条 refresh
+            await session.flush()
+            ids = [[rec.id for rec in recs] for recs, _ in batch]
+            await session.commit()
+        return ids
+
+    async def _loop(self):
+        while True:
+            first = await self._queue.get()
+            if first is _STOP:
+                return
+            # 请求已被取消（客户端断开）的记录不再写入
+            batch = [item for item in await self._collect(first) if not item[1].done()]
+            if not batch:
+                continue
+            preset_ids = [[rec.id for rec in recs] for recs, _ in batch]
+            try:
+                results = await self._commit(batch)
+            except Exception:
+                # 整批失败时逐个请求重试，避免一条坏数据拖垮同批的其他请求
+                results = []
+                for item, ids in zip(batch, preset_ids):
+                    for rec, id in zip(item[0], ids):
+                        rec.id = id  # 回滚前 flush 分配的 id 已无效
+                    try:
+                        results.append((await self._commit([item]))[0])
+                    except Exception as e:
+                        results.append(e)
+            for (recs, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    self.failures += 1
+                    future.set_exception(result)
+                else:
+                    self.records += len(recs)
+                    future.set_result(result)
+            self.transactions += 1
+
+    async def stop(self):
+        """处理完队列中已有的写请求后退出（应用关闭时调用）"""
+        if self._task is not None and not self._task.done():
+            await self._queue.put(_STOP)
+            await self._task
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "transactions": self.transactions,
+            "records": self.records,
+            "failures": self.failures,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+record_writer = RecordWriter()
@@ -0,0 +1,140 @@
+import csv
+import io
+import json
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import async_engine
+import history_search
+from history_models import PredictionRecord
+
+# 检测历史批量导出：服务端游标按固定大小分块读取，边读边写 NDJSON / CSV / Parquet，
+# 内存占用只与分块大小有关；all_results 展开为每个类别一列概率（prob_<类别>）
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+EXPORT_FIELDS = [
+    "id", "created_at", "patient_name", "patient_gender", "patient_age",
+    "medical_id", "label", "confidence", "image_path",
+]
+
+
+def prob_column(class_name):
+    return f"prob_{class_name}"
+
+
+async def class_names():
+    """展开列使用的类别：全表出现过的 label（走 label 索引，不扫 JSON 列）；不随筛选条件变化，增量导出的列保持一致"""
+    async with AsyncSession(async_engine) as session:
+        labels = (await session.exec(select(PredictionRecord.label).distinct())).all()
+    return sorted(label for label in labels if label)
+
+
+def flatten(row, classes):
+    data = {name: getattr(row, name) for name in EXPORT_FIELDS}
+    probs = {item.get("class"): item.get("confidence") for item in (row.all_results or [])}
+    for name in classes:
+        data[prob_column(name)] = probs.get(name)
+    data["bbox_count"] = len(row.bboxes) if row.bboxes else 0
+    return data
+
+
+async def iter_chunks(filters, classes, chunk_size):
+    """按 (created_at, id) 升序流式读取，每次产出 chunk_size 条展开后的记录；增量导出时用 date_from 接着上次的位置"""
+    # 只查列不建 ORM 对象，会话的 identity map 不会随表大小增长
+    columns = [getattr(PredictionRecord, name) for name in EXPORT_FIELDS + ["all_results", "bboxes"]]
+    stmt = history_search.apply_filters(select(*columns), **filters)
+    stmt = stmt.order_by(PredictionRecord.created_at, PredictionRecord.id).execution_options(yield_per=chunk_size)
+    async with AsyncSession(async_engine) as session:
+        result = await session.stream(stmt)
+        async for rows in result.partitions(chunk_size):
+            yield [flatten(row, classes) for row in rows]
+
+
+def _text(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+async def write_ndjson(chunks):
+    async for chunk in chunks:
+        yield "".join(
+            json.dumps({k: _text(v) for k, v in data.items()}, ensure_ascii=False) + "\n" for data in chunk
+        ).encode("utf-8")
+
+
+async def write_csv(chunks, columns):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=columns)
+    # 带 BOM，Excel 打开中文不乱码
+    yield "\ufeff".encode("utf-8")
+    writer.writeheader()
+    async for chunk in chunks:
+        writer.writerows({k: _text(v) for k, v in data.items()} for data in chunk)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """ParquetWriter 的输出目标：写入的字节暂存，由生成器取走"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.parts.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def parquet_schema(classes):
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("created_at", pa.timestamp("us", tz="UTC")),
+            ("patient_name", pa.string()),
+            ("patient_gender", pa.string()),
+            ("patient_age", pa.int32()),
+            ("medical_id", pa.string()),
+            ("label", pa.string()),
+            ("confidence", pa.float64()),
+            ("image_path", pa.string()),
+        ]
+        + [(prob_column(name), pa.float64()) for name in classes]
+        + [("bbox_count", pa.int32())]
+    )
+
+
+async def write_parquet(chunks, classes):
+    """每个分块写成一个 row group，写完即把字节交给响应"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema(classes)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        async for chunk in chunks:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -1,10 +1,20 @@
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
+import time
 from zoneinfo import ZoneInfo
 from sqlmodel import SQLModel, Field, Column, JSON, Text
+from sqlalchemy import Index
 
 # 存储检测历史表
 class PredictionRecord(SQLModel, table=True):
+    __table_args__ = (
+        # 历史列表按 (created_at, id) 倒序做游标分页
+        Index("ix_predictionrecord_created_at_id", "created_at", "id"),
+        # 常用筛选组合：按类别 / 病历号筛选后再按时间倒序
+        Index("ix_predictionrecord_label_created_at", "label", "created_at"),
+        Index("ix_predictionrecord_medical_id_created_at", "medical_id", "created_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
 
     # 表单信息
@@ -34,6 +44,24 @@ class PredictionRecord(SQLModel, table=True):
     created_at: datetime = Field(default_factory=lambda: datetime.now(tz=ZoneInfo('Asia/Shanghai')))
 
 
+# 上传图像的内容寻址存储：按 SHA-256 去重，refcount 为引用该图像的检测记录数
+class UploadBlob(SQLModel, table=True):
+    path: str = Field(primary_key=True)  # uploads/ab/cd/<sha256>.jpg，与 PredictionRecord.image_path 一致
+    size: Optional[int] = Field(default=None)
+    refcount: int = Field(default=0)
+    # 最近一次写入/复用的时间戳，垃圾回收的宽限期以此为准
+    touched_at: float = Field(default_factory=time.time)
+
+
+# 检测历史统计汇总：随 PredictionRecord 增删改增量维护，仪表盘直接按桶读取
+class PredictionStat(SQLModel, table=True):
+    dimension: str = Field(primary_key=True)  # day / gender / age / confidence
+    bucket: str = Field(primary_key=True)     # 2025-01-31 / 男 / 60-69 / 0.9
+    label: str = Field(primary_key=True)      # 检测结果类别，无类别时为空串
+    count: int = Field(default=0)
+    conf_sum: float = Field(default=0.0)      # 置信度之和，用于计算均值
+
+
 # DTO（创建 / 更新）
 class PredictionCreate(SQLModel):
     patient_name: Optional[str] = None
@@ -57,3 +85,26 @@ class PredictionUpdate(SQLModel):
     all_results: Optional[List[dict]] = None
     bboxes: Optional[List[dict]] = None
     image_path: Optional[str] = None
+
+
+# 列表接口返回：在记录字段之外附带缩略图地址
+class PredictionRead(SQLModel):
+    id: Optional[int] = None
+    patient_name: Optional[str] = None
+    patient_gender: Optional[str] = None
+    patient_age: Optional[int] = None
+    medical_id: Optional[str] = None
+    label: Optional[str] = None
+    confidence: Optional[float] = None
+    all_results: Optional[List[dict]] = None
+    bboxes: Optional[List[dict]] = None
+    image_path: Optional[str] = None
+    created_at: Optional[datetime] = None
+    thumbnails: Optional[Dict[str, str]] = None  # {"small": ..., "medium": ...}
+
+
+# 游标分页：next_cursor 为空表示没有更多记录
+class PredictionPage(SQLModel):
+    items: List[PredictionRead] = []
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
@@ -1,65 +1,235 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlmodel import select
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy import event
 from fastapi import Query
-from database import get_session
-from history_models import PredictionRecord, PredictionCreate, PredictionUpdate
-from typing import List
-import shutil, os
+from database import get_async_session
+from history_models import PredictionRecord, PredictionCreate, PredictionPage, PredictionRead, PredictionUpdate
+from datetime import date, datetime
+import base64, shutil, os, threading, time
+import blob_store  # 注册维护 UploadBlob.refcount 的 ORM 事件
+import history_export
+import history_search  # 注册姓名 / 病历号全文索引的建表事件
+import history_stats  # 注册维护统计汇总表的 ORM 事件
+import thumbnails
 
 router = APIRouter(prefix="/Predictions", tags=["Predictions"])
 
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# 历史列表单页最多返回的记录数
+HISTORY_PAGE_MAX = int(os.environ.get("HISTORY_PAGE_MAX", "200"))
+# 总数缓存有效期（秒）；本进程内的增删会立即让缓存失效，其他进程的写入最多滞后这么久
+HISTORY_COUNT_TTL = float(os.environ.get("HISTORY_COUNT_TTL", "30"))
+# 列表默认不返回的 JSON 大字段，需要时用 fields 显式指定
+LIST_EXCLUDED_FIELDS = {"all_results", "bboxes"}
+RECORD_FIELDS = [name for name in PredictionRead.model_fields if name != "thumbnails"]
+
+_count_cache = {}
+_count_lock = threading.Lock()
+
+
+@event.listens_for(PredictionRecord, "after_insert")
+@event.listens_for(PredictionRecord, "after_delete")
+def _invalidate_counts(mapper, connection, target):
+    with _count_lock:
+        _count_cache.clear()
+
+
+def _encode_cursor(created_at, id):
+    raw = f"{created_at.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def _parse_fields(fields):
+    """fields 为空时返回除 JSON 大字段外的全部列，all 返回全部列；id 和 created_at 始终返回（游标需要）"""
+    if not fields:
+        return [name for name in RECORD_FIELDS if name not in LIST_EXCLUDED_FIELDS]
+    if fields == "all":
+        return list(RECORD_FIELDS)
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in RECORD_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown fields: {unknown}")
+    return [name for name in RECORD_FIELDS if name in requested or name in ("id", "created_at")]
+
+
+def search_filters(
+    q: str | None = Query(None, description="在姓名和病历号中搜索（子串匹配：3 个字符起走全文索引，更短为 LIKE 扫描）"),
+    patient_name: str | None = Query(None, description="按病人姓名搜索（规则同 q）"),
+    medical_id: str | None = Query(None, description="按病历号精准匹配"),
+    label: str | None = Query(None, description="检测结果类别"),
+    patient_gender: str | None = Query(None),
+    age_min: int | None = Query(None, ge=0),
+    age_max: int | None = Query(None, ge=0),
+    conf_min: float | None = Query(None, ge=0, le=1),
+    conf_max: float | None = Query(None, ge=0, le=1),
+    date_from: datetime | None = Query(None, description="检测时间下界（含），不带时区按北京时间"),
+    date_to: datetime | None = Query(None, description="检测时间上界（不含）"),
+):
+    filters = dict(
+        q=q, patient_name=patient_name, medical_id=medical_id, label=label, patient_gender=patient_gender,
+        age_min=age_min, age_max=age_max, conf_min=conf_min, conf_max=conf_max,
+        date_from=date_from, date_to=date_to,
+    )
+    return {k: v for k, v in filters.items() if v is not None and v != ""}
+
+
+async def _cached_count(session, key, stmt):
+    now = time.monotonic()
+    with _count_lock:
+        hit = _count_cache.get(key)
+    if hit is not None and now - hit[1] < HISTORY_COUNT_TTL:
+        return hit[0]
+    total = (await session.exec(stmt)).one()
+    with _count_lock:
+        _count_cache[key] = (total, now)
+    return total
+
 @router.post("/", response_model=PredictionRecord)
-def create_Prediction(d: PredictionCreate, session=Depends(get_session)):
+async def create_Prediction(d: PredictionCreate, session=Depends(get_async_session)):
     rec = PredictionRecord.from_orm(d)
     session.add(rec)
-    session.commit()
-    session.refresh(rec)
+    await session.commit()
+    await session.refresh(rec)
     return rec
 
 
-@router.get("/", response_model=List[PredictionRecord])
-def list_Predictions(
-    patient_name: str | None = Query(None, description="按病人姓名模糊匹配"),
-    medical_id: str | None = Query(None, description="按病历号精准匹配"),
-    session=Depends(get_session)
+@router.get("/", response_model=PredictionPage, response_model_exclude_unset=True)
+async def list_Predictions(
+    filters: dict = Depends(search_filters),
+    limit: int = Query(50, ge=1, le=HISTORY_PAGE_MAX, description="每页记录数"),
+    cursor: str | None = Query(None, description="上一页返回的 next_cursor"),
+    fields: str | None = Query(None, description="逗号分隔的返回字段，all 表示全部（含 all_results / bboxes）"),
+    with_total: bool = Query(True, description="是否返回总数（带缓存）"),
+    session=Depends(get_async_session)
+):
+    # 按 (created_at, id) 倒序的游标分页，命中 ix_predictionrecord_created_at_id，翻页代价与页码无关
+    columns = _parse_fields(fields)
+    stmt = history_search.list_statement(
+        columns, filters, cursor=_decode_cursor(cursor) if cursor else None, limit=limit
+    )
+    rows = (await session.exec(stmt)).all()
+
+    items = []
+    for row in rows[:limit]:
+        data = dict(row._mapping)
+        if "image_path" in data:
+            data["thumbnails"] = thumbnails.thumb_urls(data["image_path"])
+        items.append(PredictionRead(**data))
+
+    page = PredictionPage(items=items, next_cursor=None)
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        page.next_cursor = _encode_cursor(last.created_at, last.id)
+    if with_total:
+        count_stmt = history_search.count_statement(filters)
+        page.total = await _cached_count(session, tuple(sorted(filters.items())), count_stmt)
+    return page
+
+
+@router.get("/export")
+async def export_Predictions(
+    filters: dict = Depends(search_filters),
+    format: str = Query("ndjson", description="ndjson / csv / parquet"),
+    chunk_size: int = Query(1000, ge=1, le=10000, description="每次从数据库读取的记录数"),
+    classes: str | None = Query(None, description="逗号分隔的概率列类别，默认取记录中出现过的 label"),
 ):
-    stmt = select(PredictionRecord)
-    if patient_name:
-        stmt = stmt.where(PredictionRecord.patient_name.contains(patient_name))
-    if medical_id:
-        stmt = stmt.where(PredictionRecord.medical_id == medical_id)
-    stmt = stmt.order_by(PredictionRecord.created_at.desc())
-    q = session.exec(stmt)
-    return q.all()
+    """流式导出（按 created_at 升序），配合 date_from / date_to 做增量导出"""
+    if format not in history_export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format 可选 {list(history_export.EXPORT_FORMATS)}")
+    if format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=400, detail="导出 Parquet 需要安装 pyarrow")
+
+    class_names = [c.strip() for c in classes.split(",") if c.strip()] if classes else \
+        await history_export.class_names()
+    chunks = history_export.iter_chunks(filters, class_names, chunk_size)
+    if format == "csv":
+        columns = history_export.EXPORT_FIELDS + [history_export.prob_column(c) for c in class_names] + ["bbox_count"]
+        body = history_export.write_csv(chunks, columns)
+    elif format == "parquet":
+        body = history_export.write_parquet(chunks, class_names)
+    else:
+        body = history_export.write_ndjson(chunks)
+
+    media_type, ext = history_export.EXPORT_FORMATS[format]
+    filename = f"predictions-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{ext}"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    })
+
+
+@router.get("/stats")
+async def prediction_stats(
+    date_from: date | None = Query(None, description="按日 / 按周走势的起始日期（含）"),
+    date_to: date | None = Query(None, description="按日 / 按周走势的结束日期（含）"),
+    session=Depends(get_async_session),
+):
+    """仪表盘统计：类别分布与平均置信度、按日 / 按周数量、置信度直方图、年龄段与性别分布"""
+    return await history_stats.load(session, date_from, date_to)
+
+
+@router.get("/thumbs/{size}/{image_path:path}")
+async def get_thumbnail(size: str, image_path: str, request: Request):
+    """缩略图：不存在时按需生成；内容寻址的图像不会变化，浏览器可长期缓存"""
+    if size not in thumbnails.THUMB_SIZES or not thumbnails.is_upload_path(image_path):
+        raise HTTPException(status_code=404)
+    try:
+        abs_path = await run_in_threadpool(thumbnails.generate, image_path, size)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="image not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"缩略图生成失败: {str(e)}")
+
+    stat = os.stat(abs_path)
+    etag = f'"{os.path.basename(abs_path).split(".")[0][:16]}-{size}-{int(stat.st_mtime)}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable" if blob_store.is_blob_path(image_path)
+        else "public, max-age=3600",
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(abs_path, media_type=f"image/{thumbnails.THUMB_FORMAT}", headers=headers, stat_result=stat)
 
 @router.get("/{id}", response_model=PredictionRecord)
-def get_Prediction(id: int, session=Depends(get_session)):
-    rec = session.get(PredictionRecord, id)
+async def get_Prediction(id: int, session=Depends(get_async_session)):
+    rec = await session.get(PredictionRecord, id)
     if not rec:
         raise HTTPException(status_code=404, detail="not found")
     return rec
 
 @router.put("/{id}", response_model=PredictionRecord)
-def update_Prediction(id: int, d: PredictionUpdate, session=Depends(get_session)):
-    rec = session.get(PredictionRecord, id)
+async def update_Prediction(id: int, d: PredictionUpdate, session=Depends(get_async_session)):
+    rec = await session.get(PredictionRecord, id)
     if not rec:
         raise HTTPException(status_code=404)
     rec_data = d.dict(exclude_unset=True)
     for k, v in rec_data.items():
         setattr(rec, k, v)
     session.add(rec)
-    session.commit()
-    session.refresh(rec)
+    await session.commit()
+    await session.refresh(rec)
     return rec
 
 @router.delete("/{id}", response_model=dict)
-def delete_Prediction(id: int, session=Depends(get_session)):
-    rec = session.get(PredictionRecord, id)
+async def delete_Prediction(id: int, session=Depends(get_async_session)):
+    rec = await session.get(PredictionRecord, id)
     if not rec:
         raise HTTPException(status_code=404)
-    session.delete(rec)
-    session.commit()
+    await session.delete(rec)
+    await session.commit()
     return {"ok": True}
\ No newline at end of file
@@ -0,0 +1,131 @@
+from zoneinfo import ZoneInfo
+from sqlalchemy import column, event, func, literal_column, or_, table, tuple_
+from sqlalchemy.exc import OperationalError
+from sqlmodel import SQLModel, select
+from history_models import PredictionRecord
+
+# 检测历史检索：
+#   姓名 / 病历号的子串搜索走 SQLite FTS5 trigram 索引（predictionrecord_fts，触发器与主表同步）；
+#   不足 3 个字符的关键词 trigram 无法命中，退化为 LIKE 子串扫描（姓名多为 2~3 个汉字，不能改成前缀匹配）；
+#   其余条件（类别、置信度、年龄、性别、日期）直接拼到 WHERE，按 (created_at, id) 倒序做游标分页
+
+FTS_TABLE = "predictionrecord_fts"
+TRIGRAM_MIN_LEN = 3
+fts = table(FTS_TABLE, column("rowid"), column("patient_name"), column("medical_id"))
+
+_fts_ready = None
+
+
+@event.listens_for(SQLModel.metadata, "after_create")
+def _create_search_index(target, connection, **kw):
+    """init_db 时建立 FTS 表和同步触发器；新建时把已有记录导入"""
+    global _fts_ready
+    if connection.dialect.name != "sqlite":
+        _fts_ready = False
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (FTS_TABLE,)
+    ).first()
+    if exists:
+        _fts_ready = True
+        return
+    try:
+        connection.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            "patient_name, medical_id, content='predictionrecord', content_rowid='id', tokenize='trigram')"
+        )
+    except OperationalError as e:
+        # SQLite < 3.34 没有 trigram 分词器，退回 LIKE 扫描
+        print(f"⚠️ 无法创建全文索引，姓名搜索将退回 LIKE 扫描: {e}")
+        _fts_ready = False
+        return
+    connection.exec_driver_sql(f"""
+        CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON predictionrecord BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, patient_name, medical_id)
+            VALUES (new.id, new.patient_name, new.medical_id);
+        END""")
+    connection.exec_driver_sql(f"""
+        CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON predictionrecord BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, patient_name, medical_id)
+            VALUES ('delete', old.id, old.patient_name, old.medical_id);
+        END""")
+    connection.exec_driver_sql(f"""
+        CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF patient_name, medical_id ON predictionrecord BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, patient_name, medical_id)
+            VALUES ('delete', old.id, old.patient_name, old.medical_id);
+            INSERT INTO {FTS_TABLE}(rowid, patient_name, medical_id)
+            VALUES (new.id, new.patient_name, new.medical_id);
+        END""")
+    connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _fts_ready = True
+
+
+def fts_enabled():
+    """本进程没有执行过建表时（例如只读副本），到主库里检查一次 FTS 表是否存在"""
+    global _fts_ready
+    if _fts_ready is None:
+        from database import engine
+        if engine.dialect.name != "sqlite":
+            _fts_ready = False
+        else:
+            with engine.connect() as connection:
+                _fts_ready = connection.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (FTS_TABLE,)
+                ).first() is not None
+    return _fts_ready
+
+
+def _text_condition(text, columns):
+    """在若干列中搜索 text（子串匹配）：够长走 FTS trigram 索引，否则 LIKE 扫描"""
+    if len(text) >= TRIGRAM_MIN_LEN and fts_enabled():
+        # trigram 分词下短语查询即子串匹配（大小写不敏感）；LIKE ... ESCAPE 用不上 FTS 索引，所以用 MATCH
+        phrase = '"' + text.replace('"', '""') + '"'
+        query = "{" + " ".join(columns) + "} : " + phrase
+        matched = select(fts.c.rowid).where(literal_column(FTS_TABLE).op("MATCH")(query))
+        return PredictionRecord.id.in_(matched)
+    return or_(*[getattr(PredictionRecord, name).contains(text, autoescape=True) for name in columns])
+
+
+def _aware(dt):
+    # 不带时区的时间按北京时间理解
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=ZoneInfo("Asia/Shanghai"))
+
+
+def apply_filters(stmt, *, q=None, patient_name=None, medical_id=None, label=None,
+                  patient_gender=None, age_min=None, age_max=None, conf_min=None, conf_max=None,
+                  date_from=None, date_to=None):
+    if q:
+        stmt = stmt.where(_text_condition(q, ("patient_name", "medical_id")))
+    if patient_name:
+        stmt = stmt.where(_text_condition(patient_name, ("patient_name",)))
+    if medical_id:
+        stmt = stmt.where(PredictionRecord.medical_id == medical_id)
+    if label:
+        stmt = stmt.where(PredictionRecord.label == label)
+    if patient_gender:
+        stmt = stmt.where(PredictionRecord.patient_gender == patient_gender)
+    if age_min is not None:
+        stmt = stmt.where(PredictionRecord.patient_age >= age_min)
+    if age_max is not None:
+        stmt = stmt.where(PredictionRecord.patient_age <= age_max)
+    if conf_min is not None:
+        stmt = stmt.where(PredictionRecord.confidence >= conf_min)
+    if conf_max is not None:
+        stmt = stmt.where(PredictionRecord.confidence <= conf_max)
+    if date_from is not None:
+        stmt = stmt.where(PredictionRecord.created_at >= _aware(date_from))
+    if date_to is not None:
+        stmt = stmt.where(PredictionRecord.created_at < _aware(date_to))
+    return stmt
+
+
+def list_statement(columns, filters, cursor=None, limit=50):
+    """一页记录：多取一条用来判断是否还有下一页"""
+    stmt = apply_filters(select(*[getattr(PredictionRecord, name) for name in columns]), **filters)
+    if cursor is not None:
+        stmt = stmt.where(tuple_(PredictionRecord.created_at, PredictionRecord.id) < tuple_(*cursor))
+    return stmt.order_by(PredictionRecord.created_at.desc(), PredictionRecord.id.desc()).limit(limit + 1)
+
+
+def count_statement(filters):
+    return apply_filters(select(func.count()).select_from(PredictionRecord), **filters)
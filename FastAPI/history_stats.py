@@ -0,0 +1,207 @@
+from collections import defaultdict
+from datetime import date, timezone
+from zoneinfo import ZoneInfo
+from sqlalchemy import and_, delete, event, inspect, or_
+from sqlmodel import SQLModel, select
+from history_models import PredictionRecord, PredictionStat
+
+# 检测历史统计：PredictionRecord 增删改时在同一个事务里更新 PredictionStat 中对应的桶
+# （日期 / 性别 / 年龄段 / 置信度区间，各自再按类别细分），仪表盘读取的行数只与桶数有关
+
+TZ = ZoneInfo("Asia/Shanghai")
+CONF_BINS = 10
+STAT_FIELDS = ("label", "confidence", "patient_gender", "patient_age", "created_at")
+_STAT_COLUMNS = [getattr(PredictionRecord, name) for name in STAT_FIELDS]
+
+
+def _day(created_at):
+    if created_at is None:
+        return "unknown"
+    if created_at.tzinfo is None:
+        # 数据库中按 UTC 存储
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.astimezone(TZ).date().isoformat()
+
+
+def _age_bucket(age):
+    if age is None:
+        return "unknown"
+    low = max(0, age) // 10 * 10
+    return f"{low}-{low + 9}"
+
+
+def _conf_bucket(confidence):
+    if confidence is None:
+        return "none"
+    return f"{min(max(int(confidence * CONF_BINS), 0), CONF_BINS - 1) / CONF_BINS:.1f}"
+
+
+def buckets(label, confidence, patient_gender, patient_age, created_at):
+    label = label or ""
+    return [
+        ("day", _day(created_at), label),
+        ("gender", patient_gender or "unknown", label),
+        ("age", _age_bucket(patient_age), label),
+        ("confidence", _conf_bucket(confidence), label),
+    ]
+
+
+def _upsert(connection, rows):
+    """rows: {(dimension, bucket, label): (count 增量, conf_sum 增量)}"""
+    if connection.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    for (dimension, bucket, label), (count, conf_sum) in rows.items():
+        stmt = insert(PredictionStat).values(
+            dimension=dimension, bucket=bucket, label=label, count=count, conf_sum=conf_sum,
+        )
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=["dimension", "bucket", "label"],
+            set_={"count": PredictionStat.count + count, "conf_sum": PredictionStat.conf_sum + conf_sum},
+        ))
+
+
+def _apply(connection, values, sign):
+    conf = values[1] or 0.0
+    _upsert(connection, {key: (sign, sign * conf) for key in buckets(*values)})
+
+
+def _values_in_db(connection, id):
+    return connection.execute(select(*_STAT_COLUMNS).where(PredictionRecord.id == id)).first()
+
+
+@event.listens_for(PredictionRecord, "after_insert")
+def _on_insert(mapper, connection, target):
+    _apply(connection, [getattr(target, name) for name in STAT_FIELDS], 1)
+
+
+@event.listens_for(PredictionRecord, "before_delete")
+def _on_delete(mapper, connection, target):
+    # 对象属性可能已过期，删除前从库里读出
+    old = _values_in_db(connection, target.id)
+    if old is not None:
+        _apply(connection, list(old), -1)
+
+
+@event.listens_for(PredictionRecord, "before_update")
+def _on_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    changed = {name: attrs[name].history.added for name in STAT_FIELDS if attrs[name].history.added}
+    if not changed:
+        return
+    old = _values_in_db(connection, target.id)
+    if old is None:
+        return
+    new = [changed[name][0] if name in changed else value for name, value in zip(STAT_FIELDS, old)]
+    _apply(connection, list(old), -1)
+    _apply(connection, new, 1)
+
+
+def rebuild(connection, chunk_size=5000):
+    """按检测记录从头统计（首次建表或数据被直接改库后使用）"""
+    totals = defaultdict(lambda: [0, 0.0])
+    result = connection.execution_options(yield_per=chunk_size).execute(select(*_STAT_COLUMNS))
+    for values in result:
+        conf = values[1] or 0.0
+        for key in buckets(*values):
+            totals[key][0] += 1
+            totals[key][1] += conf
+    connection.execute(delete(PredictionStat))
+    if totals:
+        connection.execute(PredictionStat.__table__.insert(), [
+            {"dimension": d, "bucket": b, "label": l, "count": c, "conf_sum": s}
+            for (d, b, l), (c, s) in totals.items()
+        ])
+    return len(totals)
+
+
+@event.listens_for(SQLModel.metadata, "after_create")
+def _init_stats(target, connection, **kw):
+    """统计表为空而已有检测记录时（新增统计功能后第一次启动）补算一次"""
+    if connection.execute(select(PredictionStat.dimension).limit(1)).first() is None and \
+            connection.execute(select(PredictionRecord.id).limit(1)).first() is not None:
+        rebuild(connection)
+
+
+def _age_key(item):
+    bucket = item[0]
+    return (1, 0) if bucket == "unknown" else (0, int(bucket.split("-")[0]))
+
+
+def _week(day):
+    year, week, _ = date.fromisoformat(day).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def summarize(rows, date_from=None, date_to=None):
+    """
+    汇总行 -> 仪表盘数据
+    date_from / date_to（含）只作用于按日 / 按周的走势，其余分布为全量统计
+    """
+    by_dim = defaultdict(list)
+    for row in rows:
+        by_dim[row.dimension].append(row)
+
+    # 每条记录在每个维度中恰好计数一次，用 confidence 维度得到类别分布和平均置信度
+    labels = defaultdict(lambda: [0, 0.0, 0])
+    for row in by_dim["confidence"]:
+        entry = labels[row.label]
+        entry[0] += row.count
+        if row.bucket != "none":
+            entry[1] += row.conf_sum
+            entry[2] += row.count
+
+    def breakdown(dimension, keep=lambda bucket: True):
+        groups = defaultdict(lambda: {"count": 0, "by_label": {}})
+        for row in by_dim[dimension]:
+            if row.count and keep(row.bucket):
+                group = groups[row.bucket]
+                group["count"] += row.count
+                group["by_label"][row.label] = group["by_label"].get(row.label, 0) + row.count
+        return groups
+
+    in_range = lambda day: day != "unknown" and (not date_from or day >= date_from.isoformat()) \
+        and (not date_to or day <= date_to.isoformat())
+    daily = breakdown("day", in_range)
+    weekly = defaultdict(lambda: {"count": 0, "by_label": {}})
+    for day, group in daily.items():
+        week = weekly[_week(day)]
+        week["count"] += group["count"]
+        for label, count in group["by_label"].items():
+            week["by_label"][label] = week["by_label"].get(label, 0) + count
+
+    histogram = {"bins": [i / CONF_BINS for i in range(CONF_BINS + 1)], "counts": [0] * CONF_BINS, "by_label": {}}
+    for row in by_dim["confidence"]:
+        if row.bucket == "none" or not row.count:
+            continue
+        i = round(float(row.bucket) * CONF_BINS)
+        histogram["counts"][i] += row.count
+        histogram["by_label"].setdefault(row.label, [0] * CONF_BINS)[i] += row.count
+
+    return {
+        "total": sum(entry[0] for entry in labels.values()),
+        "labels": [
+            {"label": label, "count": count, "mean_confidence": conf_sum / n if n else None}
+            for label, (count, conf_sum, n) in sorted(labels.items(), key=lambda kv: -kv[1][0]) if count
+        ],
+        "daily": [{"day": day, **group} for day, group in sorted(daily.items())],
+        "weekly": [{"week": week, **group} for week, group in sorted(weekly.items())],
+        "confidence_histogram": histogram,
+        "age": [{"bucket": bucket, **group} for bucket, group in sorted(breakdown("age").items(), key=_age_key)],
+        "gender": [{"bucket": bucket, **group} for bucket, group in sorted(breakdown("gender").items())],
+    }
+
+
+async def load(session, date_from=None, date_to=None):
+    stmt = select(PredictionStat)
+    if date_from or date_to:
+        # 日期桶按范围过滤后再读，其余维度的桶数固定
+        day_range = [PredictionStat.dimension == "day"]
+        if date_from:
+            day_range.append(PredictionStat.bucket >= date_from.isoformat())
+        if date_to:
+            day_range.append(PredictionStat.bucket <= date_to.isoformat())
+        stmt = stmt.where(or_(PredictionStat.dimension != "day", and_(*day_range)))
+    rows = (await session.exec(stmt)).all()
+    return summarize(rows, date_from, date_to)
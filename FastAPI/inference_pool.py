@@ -0,0 +1,103 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from fastapi import HTTPException
+
+# 推理方式：thread（进程内线程池）/ process（多进程工作池，见 inference_workers.py）
+INFERENCE_MODE = os.environ.get("INFERENCE_MODE", "thread")
+# 推理线程池大小（前向传播是 CPU 密集型，默认 2 个线程）
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "2"))
+# 同时处理中的预测请求上限，超过后直接返回 503，避免无限排队
+PREDICT_MAX_INFLIGHT = int(os.environ.get("PREDICT_MAX_INFLIGHT", "64"))
+
+executor = ThreadPoolExecutor(max_workers=max(1, INFERENCE_WORKERS), thread_name_prefix="inference")
+
+
+async def run_inference(fn, *args, **kwargs):
+    """在推理线程池中执行阻塞的前向传播"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+
+
+# 同一个 YOLO 实例的 predictor 不是线程安全的：调度器和 /predict/batch 共用缓存中的实例，
+# 线程模式下同一模型的前向传播逐个执行，不同模型之间仍可并行
+_model_locks = {}
+_model_locks_guard = threading.Lock()
+
+
+def _model_lock(model_id):
+    with _model_locks_guard:
+        return _model_locks.setdefault(model_id, threading.Lock())
+
+
+def _locked_call(lock, model, images):
+    with lock:
+        return model(images)
+
+
+async def run_model(model_id, model, images):
+    """执行一次前向传播：按 INFERENCE_MODE 选择线程池或多进程工作池"""
+    if INFERENCE_MODE == "process":
+        from inference_workers import get_worker_pool
+        pool = await run_inference(get_worker_pool)
+        return await asyncio.wrap_future(pool.submit(model_id, model, images))
+    return await run_inference(_locked_call, _model_lock(model_id), model, images)
+
+
+def evict_model(model_id):
+    """模型被删除时通知工作进程释放"""
+    with _model_locks_guard:
+        _model_locks.pop(model_id, None)
+    if INFERENCE_MODE == "process":
+        from inference_workers import evict_from_workers
+        evict_from_workers(model_id)
+
+
+class InflightLimiter:
+    """非阻塞的并发计数器：满了立即拒绝而不是排队"""
+
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self.inflight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.inflight >= self.limit:
+                self.rejected += 1
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.inflight = max(0, self.inflight - 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": INFERENCE_MODE,
+                "workers": executor._max_workers,
+                "inflight": self.inflight,
+                "limit": self.limit,
+                "rejected": self.rejected,
+            }
+
+
+limiter = InflightLimiter(PREDICT_MAX_INFLIGHT)
+
+
+async def inference_slot():
+    """
+    预测接口的依赖项：占用一个并发名额，请求结束后释放
+    名额用完时返回 503 + Retry-After
+    """
+    if not limiter.try_acquire():
+        raise HTTPException(status_code=503, detail="推理服务繁忙，请稍后重试", headers={"Retry-After": "1"})
+    try:
+        yield
+    finally:
+        limiter.release()
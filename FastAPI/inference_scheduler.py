@@ -0,0 +1,148 @@
+import asyncio
+import os
+from collections import Counter
+from inference_pool import run_model
+
+# 微批窗口：第一个请求到达后最多等待的毫秒数 / 单批最多合并的请求数
+SCHEDULER_MAX_WAIT_MS = float(os.environ.get("SCHEDULER_MAX_WAIT_MS", "5"))
+SCHEDULER_MAX_BATCH = int(os.environ.get("SCHEDULER_MAX_BATCH", "16"))
+
+
+def _fail(future, error):
+    if not future.done():
+        future.set_exception(error)
+
+
+class _ModelQueue:
+    """单个模型的请求队列及统计信息"""
+
+    def __init__(self, model_id):
+        self.model_id = model_id
+        self.queue = asyncio.Queue()
+        self.task = None
+        self.closed = False
+        self.batches = 0
+        self.requests = 0
+        self.last_batch_size = 0
+        self.batch_sizes = Counter()
+
+
+class InferenceScheduler:
+    """
+    动态微批调度器：每个已加载模型一个 asyncio 队列，
+    在 max_wait_ms 窗口内到达的请求合并成一次 model([...]) 调用，
+    再把 results 按顺序分发给各自的 future
+    """
+
+    def __init__(self, max_batch=SCHEDULER_MAX_BATCH, max_wait_ms=SCHEDULER_MAX_WAIT_MS):
+        self.max_batch = max(1, max_batch)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self._queues = {}
+
+    async def submit(self, model_id, model, image):
+        """提交单张图像，返回该图像对应的推理结果"""
+        loop = asyncio.get_running_loop()
+        mq = self._queues.get(model_id)
+        if mq is None or mq.closed:
+            mq = self._queues[model_id] = _ModelQueue(model_id)
+        if mq.task is None or mq.task.done():
+            mq.task = loop.create_task(self._run(mq))
+        future = loop.create_future()
+        await mq.queue.put((model, image, future))
+        if mq.closed:
+            # 队列已在 remove() 中清空，之后放进来的请求不会再被处理
+            _fail(future, RuntimeError(f"模型 {model_id} 已被移除"))
+        return await future
+
+    async def _collect(self, mq):
+        """取出一批请求：等到第一个请求后，在窗口内继续收集直到 max_batch"""
+        loop = asyncio.get_running_loop()
+        batch = [await mq.queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(mq.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # 窗口结束时已经排队的请求也一并带走
+        while len(batch) < self.max_batch and not mq.queue.empty():
+            batch.append(mq.queue.get_nowait())
+        return batch
+
+    async def _run(self, mq):
+        batch = []
+        try:
+            while True:
+                batch = await self._collect(mq)
+                # 调用方已取消的请求不再推理
+                batch = [item for item in batch if not item[2].cancelled()]
+                if not batch:
+                    continue
+                model = batch[-1][0]
+                images = [item[1] for item in batch]
+
+                mq.batches += 1
+                mq.requests += len(batch)
+                mq.last_batch_size = len(batch)
+                mq.batch_sizes[len(batch)] += 1
+
+                try:
+                    results = list(await self.run_batch(mq.model_id, model, images))
+                except Exception as e:
+                    for _, _, future in batch:
+                        _fail(future, e)
+                    continue
+                for (_, _, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+                if len(results) != len(batch):
+                    error = RuntimeError(f"推理结果数量 {len(results)} 与请求数量 {len(batch)} 不一致")
+                    for _, _, future in batch[len(results):]:
+                        _fail(future, error)
+        finally:
+            # 被 remove() 取消（或意外退出）时，正在推理的这一批和还在排队的请求都以异常结束，不会一直挂起
+            mq.closed = True
+            error = RuntimeError(f"模型 {mq.model_id} 已被移除")
+            for _, _, future in batch:
+                _fail(future, error)
+            while not mq.queue.empty():
+                _fail(mq.queue.get_nowait()[2], error)
+
+    async def run_batch(self, model_id, model, images):
+        # 前向传播在推理线程池/工作进程中执行，不阻塞事件循环
+        return await run_model(model_id, model, images)
+
+    def remove(self, model_id):
+        """模型被删除时停止对应队列（可在线程池中调用）"""
+        mq = self._queues.pop(model_id, None)
+        if mq is not None and mq.task is not None:
+            mq.task.get_loop().call_soon_threadsafe(mq.task.cancel)
+
+    def configure(self, max_batch=None, max_wait_ms=None):
+        if max_batch is not None:
+            self.max_batch = max(1, max_batch)
+        if max_wait_ms is not None:
+            self.max_wait_ms = max(0.0, max_wait_ms)
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait_ms,
+            "models": {
+                model_id: {
+                    "queue_depth": mq.queue.qsize(),
+                    "batches": mq.batches,
+                    "requests": mq.requests,
+                    "last_batch_size": mq.last_batch_size,
+                    "avg_batch_size": mq.requests / mq.batches if mq.batches else 0.0,
+                    "batch_sizes": dict(sorted(mq.batch_sizes.items())),
+                }
+                for model_id, mq in self._queues.items()
+            },
+        }
+
+
+scheduler = InferenceScheduler()
@@ -0,0 +1,349 @@
+# 多进程推理工作池（INFERENCE_MODE=process 时启用）
+# 每个工作进程绑定一组 CPU 核心并设置 torch.set_num_threads；
+# YOLO 实例本身不能跨进程传递（预测过一次后 predictor 持有线程锁，无法 pickle），
+# 只传权重路径 + 放入共享内存的 state_dict，由工作进程重建模型后直接引用共享内存中的权重，
+# 不会每个进程复制一份；ONNX 模型只传路径，在工作进程中重新创建 InferenceSession
+# 工作进程意外退出时，分配给它的任务全部以异常结束并重启该进程
+# 检查共享是否生效：python inference_workers.py <模型.pt>（对比各进程首次前向前后的 pss / uss）
+import atexit
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# 工作进程数量，默认按 CPU 核心数 / 每进程核心数计算
+INFERENCE_PROCESSES = int(os.environ.get("INFERENCE_PROCESSES", "0"))
+# 每个工作进程绑定的核心数
+INFERENCE_CORES_PER_PROCESS = int(os.environ.get("INFERENCE_CORES_PER_PROCESS", "4"))
+# 每个工作进程最多持有的模型数
+WORKER_MODEL_CACHE_SIZE = int(os.environ.get("MODEL_CACHE_SIZE", "3"))
+# 检查工作进程存活的间隔（秒）
+WORKER_HEALTH_INTERVAL = float(os.environ.get("WORKER_HEALTH_INTERVAL", "1"))
+
+
+def _available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _plan_cores(processes, cores_per_process):
+    """把可用核心切分给各工作进程"""
+    cores = _available_cores()
+    if processes <= 0:
+        processes = max(1, len(cores) // max(1, cores_per_process))
+    chunk = max(1, len(cores) // processes)
+    return [cores[i * chunk:(i + 1) * chunk] or cores for i in range(processes)]
+
+
+def _model_spec(model):
+    """主进程中把已加载的模型转换成可跨进程传递的描述：(格式, 权重路径, 共享内存中的 state_dict)"""
+    from onnx_backend import OnnxModel
+
+    if isinstance(model, OnnxModel):
+        return "onnx", model.path, None
+    # process 模式下主进程从不做前向，权重还没融合；工作进程第一次预测时 AutoBackend 会融合 Conv + BN，
+    # 而融合会新分配私有权重，每个进程又各有一份。这里先融合再放入共享内存，工作进程里的融合就成了空操作
+    if not model.model.is_fused():
+        model.model.fuse(verbose=False)
+    state_dict = {k: v.detach().share_memory_() for k, v in model.model.state_dict().items()}
+    return "pt", model.ckpt_path, state_dict
+
+
+def _build_model(spec):
+    """工作进程中按描述重建模型"""
+    fmt, path, state_dict = spec
+    if fmt == "onnx":
+        from onnx_backend import OnnxModel
+        return OnnxModel(path)
+    from ultralytics import YOLO
+
+    model = YOLO(path)
+    # 主进程传来的是融合后的权重，先同样融合再换成共享内存中的权重
+    if set(state_dict) != set(model.model.state_dict()):
+        model.model.fuse(verbose=False)
+    try:
+        model.model.load_state_dict(state_dict, assign=True)
+    except RuntimeError as e:
+        # 结构仍然对不上时沿用从权重文件加载的副本，结果相同，只是多占一份内存
+        print(f"警告：工作进程无法复用共享权重 {path}: {str(e)}")
+    return model
+
+
+def _worker_main(index, cores, task_queue, result_queue):
+    """工作进程入口：绑定核心后循环处理推理任务"""
+    import torch
+
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            pass
+    torch.set_num_threads(len(cores))
+
+    models = OrderedDict()
+    while True:
+        msg = task_queue.get()
+        if msg is None:
+            break
+        kind = msg[0]
+        if kind == "evict":
+            models.pop(msg[1], None)
+            continue
+
+        _, job_id, model_id, spec, images = msg
+        try:
+            if spec is not None:
+                models[model_id] = _build_model(spec)
+                while len(models) > WORKER_MODEL_CACHE_SIZE:
+                    models.popitem(last=False)
+            model = models[model_id]
+            models.move_to_end(model_id)
+            with torch.inference_mode():
+                results = model(images, verbose=False)
+            # 原图不回传，只回传推理结果
+            for r in results:
+                r.orig_img = None
+            result_queue.put((job_id, True, results))
+        except Exception as e:
+            result_queue.put((job_id, False, f"{type(e).__name__}: {e}"))
+
+
+def _memory_mb(pid):
+    """进程内存（MB）：rss 常驻，pss 按共享页比例分摊，uss 独占；共享权重生效时各进程 uss 远小于模型大小"""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].isdigit():
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return None  # 非 Linux / 进程已退出
+    uss = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {name: round(kb / 1024, 1) for name, kb in
+            (("rss", fields.get("Rss", 0)), ("pss", fields.get("Pss", 0)), ("uss", uss))}
+
+
+class WorkerPool:
+    def __init__(self, processes=INFERENCE_PROCESSES, cores_per_process=INFERENCE_CORES_PER_PROCESS):
+        import torch.multiprocessing as mp
+
+        self._ctx = mp.get_context("spawn")
+        self._plan = _plan_cores(processes, cores_per_process)
+        self._result_queue = self._ctx.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._job_ids = itertools.count()
+        self._specs = {}  # model_id -> 传给工作进程的模型描述，共享内存只分配一次
+        self._closing = False
+        self.restarts = 0
+
+        for index, cores in enumerate(self._plan):
+            worker = {
+                "index": index,
+                "cores": cores,
+                "models": OrderedDict(),  # 已经发送给该进程的模型
+                "pending": 0,
+            }
+            self._start(worker)
+            self._workers.append(worker)
+
+        self._collector = threading.Thread(target=self._collect, name="inference-collector", daemon=True)
+        self._collector.start()
+
+    def _start(self, worker):
+        task_queue = self._ctx.Queue()
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(worker["index"], worker["cores"], task_queue, self._result_queue),
+            daemon=True,
+        )
+        proc.start()
+        worker["process"] = proc
+        worker["queue"] = task_queue
+
+    def _collect(self):
+        last_check = time.monotonic()
+        while True:
+            try:
+                msg = self._result_queue.get(timeout=WORKER_HEALTH_INTERVAL)
+            except queue.Empty:
+                msg = ()
+            if msg is None:
+                break
+            if time.monotonic() - last_check >= WORKER_HEALTH_INTERVAL:
+                self._check_workers()
+                last_check = time.monotonic()
+            if not msg:
+                continue
+            job_id, ok, payload = msg
+            with self._lock:
+                future, worker = self._jobs.pop(job_id, (None, None))
+                if worker is not None:
+                    worker["pending"] -= 1
+            if future is None or future.cancelled():
+                continue
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+
+    def _check_workers(self):
+        """已退出的工作进程：让它名下未完成的任务失败，然后重启"""
+        failed = []
+        with self._lock:
+            if self._closing:
+                return
+            for worker in self._workers:
+                proc = worker["process"]
+                if proc.is_alive():
+                    continue
+                for job_id, (future, owner) in list(self._jobs.items()):
+                    if owner is worker:
+                        del self._jobs[job_id]
+                        failed.append(future)
+                print(f"警告：推理工作进程 {proc.pid} 已退出（exitcode={proc.exitcode}），正在重启")
+                worker["models"].clear()
+                worker["pending"] = 0
+                self._start(worker)
+                self.restarts += 1
+        for future in failed:
+            if not future.cancelled():
+                future.set_exception(RuntimeError("推理工作进程意外退出"))
+
+    def submit(self, model_id, model, images):
+        """分发到负载最低的工作进程，返回 concurrent.futures.Future"""
+        future = Future()
+        with self._lock:
+            # 优先选择已持有该模型的进程，避免重复传递
+            worker = min(self._workers, key=lambda w: (w["pending"], model_id not in w["models"]))
+            job_id = next(self._job_ids)
+            self._jobs[job_id] = (future, worker)
+            worker["pending"] += 1
+            spec = None
+            if model_id not in worker["models"]:
+                if model_id not in self._specs:
+                    self._specs[model_id] = _model_spec(model)
+                spec = self._specs[model_id]
+                worker["models"][model_id] = True
+                while len(worker["models"]) > WORKER_MODEL_CACHE_SIZE:
+                    worker["models"].popitem(last=False)
+            else:
+                worker["models"].move_to_end(model_id)
+        worker["queue"].put(("run", job_id, model_id, spec, images))
+        return future
+
+    def evict(self, model_id):
+        with self._lock:
+            self._specs.pop(model_id, None)
+            for worker in self._workers:
+                if worker["models"].pop(model_id, None):
+                    worker["queue"].put(("evict", model_id))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "restarts": self.restarts,
+                "processes": [
+                    {
+                        "pid": w["process"].pid,
+                        "alive": w["process"].is_alive(),
+                        "memory_mb": _memory_mb(w["process"].pid),
+                        "cores": w["cores"],
+                        "pending": w["pending"],
+                        "models": list(w["models"].keys()),
+                    }
+                    for w in self._workers
+                ],
+            }
+
+    def shutdown(self):
+        with self._lock:
+            self._closing = True
+        for worker in self._workers:
+            worker["queue"].put(None)
+        for worker in self._workers:
+            worker["process"].join(timeout=5)
+        self._result_queue.put(None)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """首次使用时启动工作池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+        return _pool
+
+
+def evict_from_workers(model_id):
+    """工作池未启动时无需处理"""
+    if _pool is not None:
+        _pool.evict(model_id)
+
+
+def worker_pool_stats():
+    return _pool.stats() if _pool is not None else {"processes": []}
+
+
+def shutdown_worker_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+atexit.register(shutdown_worker_pool)
+
+
+def main():
+    """
+    检查权重是否真正共享：各工作进程首次前向前后的内存对比
+    python inference_workers.py <模型.pt> [--processes 2]
+    """
+    import argparse
+    import numpy as np
+    from ultralytics import YOLO
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model")
+    parser.add_argument("--processes", type=int, default=2)
+    args = parser.parse_args()
+
+    model = YOLO(args.model)
+    pool = WorkerPool(processes=args.processes, cores_per_process=1)
+    image = np.zeros((224, 224, 3), dtype=np.uint8)
+
+    def report(title):
+        print(title)
+        for w in pool.stats()["processes"]:
+            print(f"   pid {w['pid']}: {w['memory_mb']}")
+
+    def run_round(n):
+        # 同时提交，任务按负载分散到各个进程
+        for future in [pool.submit("check", model, [image]) for _ in range(n)]:
+            future.result()
+
+    try:
+        time.sleep(5)  # 等工作进程导入完 torch
+        report("启动后（尚未加载模型）")
+        run_round(args.processes)
+        report("首次前向后（重建模型 + 换成共享权重 + AutoBackend 融合）")
+        run_round(args.processes * 4)
+        report("多次前向后（uss 不应比启动后多出一份模型大小）")
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
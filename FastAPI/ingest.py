@@ -0,0 +1,45 @@
+import mmap
+import numpy as np
+
+# 上传图像读取：直接在上传缓冲区上解码，不再先落盘再读回
+
+
+def upload_bytes(file):
+    """
+    返回上传内容的只读缓冲区（尽量不复制）：
+    小文件在内存中（BytesIO.getvalue 与内部缓冲区共享），大文件已落到临时文件则用 mmap
+    """
+    f = file.file
+    raw = getattr(f, "_file", f)  # SpooledTemporaryFile 内部的真实文件对象
+    if hasattr(raw, "getvalue"):
+        return raw.getvalue()
+    raw.flush()
+    try:
+        return mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # 空文件或不支持 fileno 的对象
+        raw.seek(0)
+        return raw.read()
+
+
+def decode_image(buf):
+    """
+    把编码后的图像解码为 RGB numpy 数组（与原先 PIL .convert("RGB") 的结果一致）
+    cv2.imdecode 直接读 memoryview，颜色转换原地完成，整个过程只分配一次图像内存
+    """
+    import cv2
+
+    data = np.frombuffer(buf, dtype=np.uint8)
+    image = cv2.imdecode(data, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION) if data.size else None
+    if image is None:
+        # OpenCV 不支持的格式退回 PIL
+        import io
+        from PIL import Image
+        return np.array(Image.open(io.BytesIO(buf)).convert("RGB"))
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+
+
+def write_bytes(path, buf):
+    """把原始字节写入 path（一次 write，不经过 copyfileobj 的分块复制）"""
+    with open(path, "wb") as f:
+        f.write(buf)
@@ -1,14 +1,44 @@
 from fastapi import FastAPI
-from predict_api import router as predict_router
-from v8_train_api import router as train_router
-from history_router import router as history_router
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
 from database import init_db
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from auth_router import router as auth_router
+import asyncio
+import importlib
 import os
 
-app = FastAPI()
+# 进程角色：api（全部接口）/ inference（只提供预测和模型注册表）/ history-only（只提供历史记录和登录）
+# history-only 不会导入 ultralytics / torch，适合轻量副本快速启动
+APP_ROLE = os.environ.get("APP_ROLE", "api")
+ROLE_ROUTERS = {
+    "api": ["predict_api", "v8_train_api", "history_router", "auth_router", "registry_router"],
+    "inference": ["predict_api", "registry_router"],
+    "history-only": ["history_router", "auth_router"],
+}
+if APP_ROLE not in ROLE_ROUTERS:
+    raise ValueError(f"未知的 APP_ROLE: {APP_ROLE}，可选 {list(ROLE_ROUTERS)}")
+
+SERVES_INFERENCE = "predict_api" in ROLE_ROUTERS[APP_ROLE]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 后台预加载并预热模型，完成前 /ready 返回 503
+    warmup_task = None
+    if SERVES_INFERENCE:
+        import warmup
+        warmup_task = asyncio.create_task(warmup.warmup())
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    if SERVES_INFERENCE:
+        # 写完队列中剩余的检测记录
+        from db_writer import record_writer
+        await record_writer.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,18 +48,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(predict_router)
-app.include_router(train_router)
-app.include_router(history_router)
-app.include_router(auth_router)
+for module_name in ROLE_ROUTERS[APP_ROLE]:
+    app.include_router(importlib.import_module(module_name).router)
 
 # 在 app 定义之后，挂载 uploads 目录作为静态文件
-UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+if "history_router" in ROLE_ROUTERS[APP_ROLE]:
+    UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 init_db()
 
 @app.get("/")
 def read_root():
-    return {"msg": "Alzheimer YOLOv8 API running"}
+    return {"msg": "Alzheimer YOLOv8 API running", "role": APP_ROLE}
+
+@app.get("/ready")
+def read_ready():
+    # 负载均衡就绪检查：模型预热完成后才返回 200；不提供推理的角色直接就绪
+    if not SERVES_INFERENCE:
+        return {"ready": True, "role": APP_ROLE}
+    import warmup
+    return JSONResponse(warmup.state, status_code=200 if warmup.state["ready"] else 503)
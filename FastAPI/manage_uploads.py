@@ -0,0 +1,124 @@
+import argparse
+import os
+from functools import partial
+from sqlmodel import Session, select
+from database import engine, init_db
+from history_models import PredictionRecord
+import blob_store
+import history_stats
+import thumbnails
+
+# 上传图像存储维护：
+#   python manage_uploads.py migrate [--keep-old]   把旧的 uploads/{time}_{uuid}_{name} 迁移到内容寻址存储
+#   python manage_uploads.py reconcile               按检测记录重新统计 refcount
+#   python manage_uploads.py gc [--dry-run]          先 reconcile，再删除无人引用的 blob（及其缩略图）
+#   python manage_uploads.py thumbs                  为已有图像补生成缩略图
+#   python manage_uploads.py stats                   按检测记录重新计算仪表盘统计（直接改库后使用）
+
+print = partial(print, flush=True)
+
+
+def migrate(keep_old=False, chunk_size=500):
+    """逐批迁移旧路径的记录，迁移完成后删除旧文件"""
+    migrated = missing = 0
+    old_files = set()
+    last_id = 0
+    while True:
+        with Session(engine) as session:
+            stmt = (
+                select(PredictionRecord)
+                .where(PredictionRecord.id > last_id, PredictionRecord.image_path.is_not(None))
+                .order_by(PredictionRecord.id)
+                .limit(chunk_size)
+            )
+            recs = session.exec(stmt).all()
+            if not recs:
+                break
+            last_id = recs[-1].id
+            for rec in recs:
+                if blob_store.is_blob_path(rec.image_path):
+                    continue
+                old_abs = os.path.join(blob_store.BASE_DIR, rec.image_path)
+                if not os.path.exists(old_abs):
+                    missing += 1
+                    continue
+                with open(old_abs, "rb") as f:
+                    rec.image_path = blob_store.put_bytes(f.read(), os.path.basename(old_abs))
+                session.add(rec)
+                old_files.add(old_abs)
+                migrated += 1
+            session.commit()
+        print(f"   已处理到 id={last_id}，迁移 {migrated} 条")
+
+    removed = 0
+    if not keep_old:
+        for path in old_files:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+    print(f"✅ 迁移完成：{migrated} 条记录，删除旧文件 {removed} 个，缺失文件 {missing} 个")
+
+
+def generate_thumbnails():
+    """为 uploads 下所有图像生成缺失的缩略图"""
+    count = 0
+    for root, _, files in os.walk(blob_store.UPLOAD_DIR):
+        for name in files:
+            if not name.lower().endswith(blob_store.IMG_EXTS):
+                continue
+            rel_path = os.path.relpath(os.path.join(root, name), blob_store.BASE_DIR).replace(os.sep, "/")
+            try:
+                for size in thumbnails.THUMB_SIZES:
+                    thumbnails.generate(rel_path, size)
+                count += 1
+            except Exception as e:
+                print(f"⚠️ {rel_path}: {e}")
+    return count
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_migrate = sub.add_parser("migrate")
+    p_migrate.add_argument("--keep-old", action="store_true", help="保留迁移前的旧文件")
+    sub.add_parser("reconcile")
+    sub.add_parser("thumbs")
+    sub.add_parser("stats")
+    p_gc = sub.add_parser("gc")
+    p_gc.add_argument("--dry-run", action="store_true")
+    p_gc.add_argument("--grace", type=int, default=blob_store.BLOB_GC_GRACE_SECONDS, help="宽限期（秒）")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    init_db()
+    if args.command == "migrate":
+        print("🚚 正在迁移旧的上传图像...")
+        migrate(keep_old=args.keep_old)
+        blob_store.reconcile()
+    elif args.command == "reconcile":
+        count = blob_store.reconcile()
+        print(f"✅ refcount 已重新统计，{count} 个 blob 仍被引用")
+    elif args.command == "thumbs":
+        print("🖼️ 正在生成缩略图...")
+        count = generate_thumbnails()
+        print(f"✅ 缩略图生成完成：{count} 张图像")
+    elif args.command == "stats":
+        with engine.begin() as connection:
+            count = history_stats.rebuild(connection)
+        print(f"✅ 统计已重新计算：{count} 个桶")
+    elif args.command == "gc":
+        removed = blob_store.gc(dry_run=args.dry_run, grace_seconds=args.grace)
+        for path in removed:
+            if not args.dry_run:
+                thumbnails.remove(path)
+            print(f"🗑️  {path}")
+        action = "将删除" if args.dry_run else "已删除"
+        print(f"✅ 垃圾回收结束：{action} {len(removed)} 个 blob")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from sqlmodel import Session, select
+from database import engine
+from registry_models import ModelEntry
+from result_cache import result_cache
+
+BASE_DIR = os.path.dirname(__file__)
+# 注册表模型存放目录：models/<sha256>.pt
+MODEL_STORE_DIR = os.environ.get("MODEL_STORE_DIR", os.path.join(BASE_DIR, "models"))
+# v8-train.py 的训练输出目录（results/<run>/weights/*.pt）
+RESULTS_DIR = os.environ.get("RESULTS_DIR", os.path.join(BASE_DIR, "results"))
+# 内存中最多缓存的 YOLO 实例数量
+MODEL_CACHE_SIZE = int(os.environ.get("MODEL_CACHE_SIZE", "3"))
+
+os.makedirs(MODEL_STORE_DIR, exist_ok=True)
+
+
+# 支持的模型格式：PyTorch 权重走 Ultralytics，ONNX 走 onnx_backend
+MODEL_FORMATS = {".pt": "pt", ".onnx": "onnx"}
+
+
+def _store_path(model_id, ext=".pt"):
+    return os.path.join(MODEL_STORE_DIR, f"{model_id}{ext}")
+
+
+def _model_ext(name):
+    ext = os.path.splitext(name or "")[1].lower()
+    return ext if ext in MODEL_FORMATS else ".pt"
+
+
+def _variant_and_group(name, source, model_id, base=None):
+    """
+    best-95_12%-int8.onnx -> ("int8", ".../best-95_12%")；训练目录里的模型按所在目录区分 group
+    上传的模型文件名不能说明来自哪次训练（每次训练都叫 best.pt），不按文件名归组：
+    指定 base（同一训练产物已注册的模型）时沿用它的 group，否则自成一组
+    """
+    stem = os.path.splitext(os.path.basename(name or ""))[0]
+    variant = "fp32"
+    if stem.endswith("-int8"):
+        variant, stem = "int8", stem[:-len("-int8")]
+    if base is not None:
+        return variant, base.group
+    if not source or source == "upload":
+        return variant, model_id
+    return variant, os.path.join(os.path.dirname(source), stem)
+
+
+def _copy_and_hash(src, dst, block_size=1024 * 1024):
+    """边复制边计算 SHA-256，只读一遍文件"""
+    hasher = hashlib.sha256()
+    size = 0
+    while chunk := src.read(block_size):
+        hasher.update(chunk)
+        dst.write(chunk)
+        size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+def _save_entry(model_id, name, source, size, ext, base_model_id=None):
+    with Session(engine) as session:
+        entry = session.get(ModelEntry, model_id)
+        if entry is None:
+            base = session.get(ModelEntry, base_model_id) if base_model_id else None
+            variant, group = _variant_and_group(name, source, model_id, base)
+            entry = ModelEntry(
+                id=model_id,
+                name=name,
+                source=source,
+                file_path=os.path.relpath(_store_path(model_id, ext), BASE_DIR),
+                size=size,
+                format=MODEL_FORMATS[ext],
+                variant=variant,
+                group=group,
+            )
+            session.add(entry)
+            session.commit()
+            session.refresh(entry)
+        return entry
+
+
+def register_fileobj(fileobj, name=None, source="upload", base_model_id=None):
+    """
+    从文件对象注册模型（上传的 UploadFile.file 等）
+    内容相同的文件只保存一次，返回已有的注册项
+    base_model_id：同一训练产物已注册的另一精度 / 格式（如上传 INT8 时对应的 FP32 模型），不存在时抛出 KeyError
+    """
+    if base_model_id and get_entry(base_model_id) is None:
+        raise KeyError(base_model_id)
+    ext = _model_ext(name)
+    fd, tmp_path = tempfile.mkstemp(suffix=ext, dir=MODEL_STORE_DIR)
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            model_id, size = _copy_and_hash(fileobj, tmp)
+        dst = _store_path(model_id, ext)
+        if os.path.exists(dst):
+            os.unlink(tmp_path)
+        else:
+            os.replace(tmp_path, dst)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return _save_entry(model_id, name, source, size, ext, base_model_id)
+
+
+def register_path(path):
+    """从本地 .pt / .onnx 文件注册模型"""
+    with open(path, "rb") as f:
+        return register_fileobj(f, name=os.path.basename(path), source=path)
+
+
+def resolve_results_dir(results_dir=None):
+    """results_dir 可以是 RESULTS_DIR 下的子目录（相对或绝对路径），解析后不在 RESULTS_DIR 内的抛出 ValueError"""
+    base = os.path.realpath(RESULTS_DIR)
+    if not results_dir:
+        return base
+    path = os.path.realpath(os.path.join(base, results_dir))
+    if os.path.commonpath([base, path]) != base:
+        raise ValueError(f"results_dir 必须位于 {RESULTS_DIR} 内")
+    return path
+
+
+def scan_results(results_dir=None):
+    """扫描 results/*/weights 下的 .pt / .onnx，把训练产出的模型全部注册"""
+    results_dir = resolve_results_dir(results_dir)
+    entries = []
+    paths = []
+    for ext in MODEL_FORMATS:
+        paths.extend(glob.glob(os.path.join(results_dir, "*", "weights", f"*{ext}")))
+    for path in sorted(paths):
+        try:
+            entries.append(register_path(path))
+        except Exception as e:
+            print(f"警告：注册模型失败 {path}: {str(e)}")
+    return entries
+
+
+def get_entry(model_id):
+    with Session(engine) as session:
+        return session.get(ModelEntry, model_id)
+
+
+def resolve_variant(model_id, variant):
+    """在同一 group 中找到指定精度（fp32 / int8）的模型，优先 ONNX"""
+    entry = get_entry(model_id)
+    if entry is None:
+        raise KeyError(model_id)
+    if not variant or entry.variant == variant:
+        return entry.id
+    with Session(engine) as session:
+        stmt = select(ModelEntry).where(ModelEntry.group == entry.group, ModelEntry.variant == variant)
+        candidates = session.exec(stmt).all()
+    if not candidates:
+        raise KeyError(f"{model_id} ({variant})")
+    candidates.sort(key=lambda e: e.format != "onnx")
+    return candidates[0].id
+
+
+def remove_model(model_id):
+    """从注册表、缓存和磁盘中删除模型，并清除该模型的推理结果缓存"""
+    model_cache.evict(model_id)
+    result_cache.invalidate_model(model_id)
+    with Session(engine) as session:
+        entry = session.get(ModelEntry, model_id)
+        if entry is None:
+            return False
+        file_path = os.path.join(BASE_DIR, entry.file_path)
+        session.delete(entry)
+        session.commit()
+    try:
+        os.unlink(file_path)
+    except FileNotFoundError:
+        pass
+    return True
+
+
+def load_model(path, fmt="pt"):
+    """按格式加载模型，返回可直接 model(images) 调用的实例"""
+    # ultralytics 会连带导入 torch / cv2，只在真正加载模型时导入
+    if fmt == "onnx":
+        from onnx_backend import OnnxModel
+        return OnnxModel(path)
+    from ultralytics import YOLO
+    return YOLO(path)
+
+
+class ModelCache:
+    """已加载 YOLO 实例的 LRU 缓存，超过容量时淘汰最久未使用的模型"""
+
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model_id):
+        with self._lock:
+            model = self._models.get(model_id)
+            if model is not None:
+                self._models.move_to_end(model_id)
+                self.hits += 1
+                return model
+            load_lock = self._load_locks.setdefault(model_id, threading.Lock())
+
+        # 同一模型只加载一次，其他请求等待加载完成
+        try:
+            with load_lock:
+                with self._lock:
+                    model = self._models.get(model_id)
+                    if model is not None:
+                        self._models.move_to_end(model_id)
+                        self.hits += 1
+                        return model
+                entry = get_entry(model_id)
+                if entry is None:
+                    raise KeyError(model_id)
+                model = load_model(os.path.join(BASE_DIR, entry.file_path), entry.format)
+                with self._lock:
+                    self.misses += 1
+                    self._models[model_id] = model
+                    self._models.move_to_end(model_id)
+                    while len(self._models) > self.capacity:
+                        self._models.popitem(last=False)
+                        self.evictions += 1
+        finally:
+            # 加载失败 / 模型不存在时也要清理，否则不存在的 model_id 会让 _load_locks 无限增长
+            with self._lock:
+                if self._load_locks.get(model_id) is load_lock:
+                    del self._load_locks[model_id]
+        return model
+
+    def evict(self, model_id):
+        with self._lock:
+            return self._models.pop(model_id, None) is not None
+
+    def resize(self, capacity):
+        with self._lock:
+            self.capacity = max(1, capacity)
+            while len(self._models) > self.capacity:
+                self._models.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "loaded": list(self._models.keys()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+model_cache = ModelCache(MODEL_CACHE_SIZE)
+
+
+def get_model(model_id):
+    """按 model_id 获取已加载的 YOLO 实例（走 LRU 缓存）"""
+    return model_cache.get(model_id)
@@ -0,0 +1,88 @@
+import ast
+import os
+from types import SimpleNamespace
+import numpy as np
+from PIL import Image
+
+# ONNX Runtime 执行后端，逗号分隔，按顺序回退；装了 onnxruntime-openvino 时可设为
+# "OpenVINOExecutionProvider,CPUExecutionProvider"
+ONNX_PROVIDERS = os.environ.get("ONNX_PROVIDERS", "CPUExecutionProvider")
+# 推理线程数，0 表示由 onnxruntime 自行决定
+ONNX_INTRA_OP_THREADS = int(os.environ.get("ONNX_INTRA_OP_THREADS", "0"))
+
+
+def preprocess(image, imgsz):
+    """
+    与 Ultralytics 分类预处理保持一致：
+    输入按 BGR 处理并转为 RGB -> 短边缩放到 imgsz -> 中心裁剪 -> [0,1] -> CHW
+    """
+    img = Image.fromarray(np.ascontiguousarray(image[..., ::-1]))
+    w, h = img.size
+    if w <= h:
+        size = (imgsz, int(imgsz * h / w))
+    else:
+        size = (int(imgsz * w / h), imgsz)
+    img = img.resize(size, Image.BILINEAR)
+    w, h = img.size
+    left, top = int(round((w - imgsz) / 2.0)), int(round((h - imgsz) / 2.0))
+    img = img.crop((left, top, left + imgsz, top + imgsz))
+    arr = np.asarray(img, dtype=np.float32) / 255.0
+    return arr.transpose(2, 0, 1)
+
+
+class OnnxModel:
+    """
+    ONNX 分类模型，调用方式与 YOLO 实例一致：
+    model(images) 返回带 .probs.data 的结果列表，类别名在 model.model.names
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._session = None
+        self._load()
+
+    def _load(self):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if ONNX_INTRA_OP_THREADS > 0:
+            options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+        available = set(ort.get_available_providers())
+        providers = [p for p in ONNX_PROVIDERS.split(",") if p in available] or ["CPUExecutionProvider"]
+        self._session = ort.InferenceSession(self.path, sess_options=options, providers=providers)
+
+        # Ultralytics 导出时把类别名和 imgsz 写在 metadata 中
+        meta = self._session.get_modelmeta().custom_metadata_map
+        names = ast.literal_eval(meta["names"]) if "names" in meta else {}
+        imgsz = ast.literal_eval(meta["imgsz"]) if "imgsz" in meta else None
+        inp = self._session.get_inputs()[0]
+        self.input_name = inp.name
+        self.imgsz = int(imgsz[0] if isinstance(imgsz, (list, tuple)) else imgsz or inp.shape[-1])
+        # 静态 batch（导出时未开启 dynamic）只能逐张推理
+        self.static_batch = inp.shape[0] if isinstance(inp.shape[0], int) else None
+        self.model = SimpleNamespace(names=names)
+
+    def __getstate__(self):
+        # InferenceSession 不能序列化，传到工作进程后重新创建
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self._load()
+
+    def __call__(self, images, verbose=False, **kwargs):
+        if isinstance(images, np.ndarray):
+            images = [images]
+        batch = np.stack([preprocess(im, self.imgsz) for im in images])
+        if self.static_batch:
+            n = self.static_batch
+            outputs = []
+            for i in range(0, len(batch), n):
+                chunk = batch[i:i + n]
+                if len(chunk) < n:
+                    chunk = np.concatenate([chunk, np.zeros((n - len(chunk),) + chunk.shape[1:], dtype=chunk.dtype)])
+                outputs.append(self._session.run(None, {self.input_name: chunk})[0])
+            probs = np.concatenate(outputs)[:len(batch)]
+        else:
+            probs = self._session.run(None, {self.input_name: batch})[0]
+        return [SimpleNamespace(probs=SimpleNamespace(data=p), boxes=None) for p in probs]
@@ -0,0 +1,111 @@
+import argparse
+import os
+import time
+from functools import partial
+import numpy as np
+from PIL import Image
+from ultralytics import YOLO
+from onnx_backend import OnnxModel
+
+# ONNX 与 PyTorch 推理一致性检查：
+# python onnx_parity.py --pt results/<run>/weights/best-95_12%.pt --onnx results/<run>/weights/best-95_12%.onnx --data <dataset>/valid
+
+print = partial(print, flush=True)
+
+IMG_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def list_images(data_dir, limit):
+    """data_dir/<类别名>/*.jpg，返回 [(路径, 类别名)]"""
+    items = []
+    for class_name in sorted(os.listdir(data_dir)):
+        class_path = os.path.join(data_dir, class_name)
+        if not os.path.isdir(class_path): continue
+        for f in sorted(os.listdir(class_path)):
+            if f.lower().endswith(IMG_EXTS):
+                items.append((os.path.join(class_path, f), class_name))
+    if limit:
+        items = items[:limit]
+    return items
+
+
+def class_probs(results, names):
+    """按类别下标返回概率向量（与 predict_api.parse_result 读取方式一致）"""
+    data = results[0].probs.data
+    probs = data.cpu().numpy() if hasattr(data, 'cpu') else np.asarray(data)
+    return probs[:len(names)]
+
+
+def run_model(model, image):
+    start = time.perf_counter()
+    results = model(image, verbose=False)
+    return results, (time.perf_counter() - start) * 1000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pt', type=str, required=True)
+    parser.add_argument('--onnx', type=str, required=True)
+    parser.add_argument('--data', type=str, required=True, help='按类别分目录的图像，如 <dataset>/valid')
+    parser.add_argument('--limit', type=int, default=0)
+    parser.add_argument('--atol', type=float, default=1e-3, help='允许的最大概率差')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    pt_model = YOLO(args.pt)
+    onnx_model = OnnxModel(args.onnx)
+    names = list(pt_model.model.names.values())
+    if names != list(onnx_model.model.names.values()):
+        print("❌ 类别名不一致")
+        return 1
+
+    items = list_images(args.data, args.limit)
+    if not items:
+        print(f"❌ 没有找到图像: {args.data}")
+        return 1
+
+    # 预热，避免首次推理耗时计入
+    warm = np.array(Image.open(items[0][0]).convert("RGB"))
+    run_model(pt_model, warm)
+    run_model(onnx_model, warm)
+
+    pt_correct = onnx_correct = agree = 0
+    pt_ms, onnx_ms, deltas = [], [], []
+    for path, label in items:
+        image = np.array(Image.open(path).convert("RGB"))
+        pt_results, t_pt = run_model(pt_model, image)
+        onnx_results, t_onnx = run_model(onnx_model, image)
+        p_pt = class_probs(pt_results, names)
+        p_onnx = class_probs(onnx_results, names)
+
+        pt_ms.append(t_pt)
+        onnx_ms.append(t_onnx)
+        deltas.append(float(np.abs(p_pt - p_onnx).max()))
+        pt_top1, onnx_top1 = names[int(p_pt.argmax())], names[int(p_onnx.argmax())]
+        pt_correct += pt_top1 == label
+        onnx_correct += onnx_top1 == label
+        agree += pt_top1 == onnx_top1
+
+    n = len(items)
+    max_delta = max(deltas)
+    print("\n" + "=" * 56)
+    print(f"📊 ONNX / PyTorch 一致性 ({n} 张)")
+    print(f"{'':12}{'PyTorch':>14}{'ONNX':>14}{'差值':>14}")
+    print(f"{'Top-1':12}{pt_correct / n:>14.4f}{onnx_correct / n:>14.4f}{(onnx_correct - pt_correct) / n:>+14.4f}")
+    print(f"{'平均 ms':12}{np.mean(pt_ms):>14.2f}{np.mean(onnx_ms):>14.2f}{np.mean(onnx_ms) - np.mean(pt_ms):>+14.2f}")
+    print(f"{'P95 ms':12}{np.percentile(pt_ms, 95):>14.2f}{np.percentile(onnx_ms, 95):>14.2f}")
+    print(f"   Top-1 一致率: {agree / n:.4f}")
+    print(f"   概率最大差: {max_delta:.6f}  平均差: {np.mean(deltas):.6f}")
+    print("=" * 56)
+
+    if max_delta > args.atol:
+        print(f"❌ 概率差超过阈值 {args.atol}")
+        return 1
+    print("✅ 一致性检查通过")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,128 @@
+import numpy as np
+
+# 推理结果后处理（向量化）：
+# extract_* 只做 NumPy 运算，得到列式数组；to_json 在返回/入库前一次性转成 Python 对象
+
+
+def _to_numpy(x):
+    return x.cpu().numpy() if hasattr(x, 'cpu') else np.asarray(x)
+
+
+def _classification_columns(order, sorted_probs):
+    return {
+        "task": "classify",
+        "order": order,          # all_results 中各项对应的类别下标
+        "scores": sorted_probs,  # all_results 的置信度
+        "scores_raw": sorted_probs,
+        "probs": sorted_probs,
+        "boxes_xyxy": np.empty((0, 4), dtype=np.float32),
+        "boxes_cls": np.empty(0, dtype=np.int64),
+        "boxes_conf": np.empty(0, dtype=np.float32),
+    }
+
+
+def extract_classification(probs):
+    """
+    分类：按置信度降序排列
+    原始分数=概率，归一化概率=概率（无需额外计算）
+    """
+    order = np.argsort(probs)[::-1]
+    return _classification_columns(order, probs[order])
+
+
+def extract_detection(xyxy, cls, conf, num_classes):
+    """检测：按类别取最大置信度作为原始分数（np.maximum.at），再归一化，all_results 按类别顺序排列"""
+    cls = cls.astype(np.int64, copy=False)
+    scores_raw = np.zeros(num_classes, dtype=np.float64)
+    np.maximum.at(scores_raw, cls, conf.astype(np.float64, copy=False))
+    total = scores_raw.sum()
+    probs = scores_raw / total if total > 0 else np.zeros_like(scores_raw)
+    return {
+        "task": "detect",
+        "order": np.arange(num_classes),
+        "scores": probs,
+        "scores_raw": scores_raw,
+        "probs": probs,
+        "boxes_xyxy": xyxy,
+        "boxes_cls": cls,
+        "boxes_conf": conf,
+    }
+
+
+def extract(result, num_classes):
+    """单张图像的推理结果 -> 列式数组；模型无有效输出时返回 None"""
+    # 情况1：分类模型（有 probs 且非 None）
+    if getattr(result, "probs", None) is not None:
+        return extract_classification(_to_numpy(result.probs.data))
+    # 情况2：检测模型（提取所有检测框的类别+置信度）
+    if getattr(result, "boxes", None) is not None:
+        boxes = result.boxes
+        return extract_detection(
+            _to_numpy(boxes.xyxy).reshape(-1, 4),
+            _to_numpy(boxes.cls).reshape(-1),
+            _to_numpy(boxes.conf).reshape(-1),
+            num_classes,
+        )
+    return None
+
+
+def extract_batch(results, num_classes):
+    """批量结果：全部是分类结果时堆叠成 (N, C) 一次排序，否则逐张处理"""
+    if results and all(getattr(r, "probs", None) is not None for r in results):
+        probs = np.stack([_to_numpy(r.probs.data) for r in results])
+        orders = np.argsort(probs, axis=1)[:, ::-1]
+        sorted_probs = np.take_along_axis(probs, orders, axis=1)
+        return [_classification_columns(order, p) for order, p in zip(orders, sorted_probs)]
+    return [extract(r, num_classes) for r in results]
+
+
+def to_json(columns, class_names):
+    """
+    列式数组 -> 接口返回结构
+    （main_class / confidence / all_results / bboxes / class_scores_raw / class_probs）
+    """
+    names = np.asarray(class_names, dtype=object)
+    order = columns["order"]
+    scores = columns["scores"].tolist()
+    all_results = [
+        {"class": name, "confidence": conf}
+        for name, conf in zip(names[order].tolist(), scores)
+    ]
+
+    xyxy = columns["boxes_xyxy"].tolist()
+    box_names = names[columns["boxes_cls"]].tolist() if len(xyxy) else []
+    bboxes = [
+        {"xyxy": box, "class": name, "confidence": conf}
+        for box, name, conf in zip(xyxy, box_names, columns["boxes_conf"].tolist())
+    ]
+
+    # 提取置信度最高的类别（并列时取排在前面的）
+    main_class = None
+    main_confidence = None
+    if all_results:
+        best = int(np.argmax(columns["scores"]))
+        main_class = all_results[best]["class"]
+        main_confidence = all_results[best]["confidence"]
+
+    return {
+        "main_class": main_class,
+        "confidence": main_confidence,
+        "all_results": all_results,
+        "bboxes": bboxes,  # 分类任务为[]，检测任务为边界框列表
+        "class_scores_raw": columns["scores_raw"].tolist(),
+        "class_probs": columns["probs"].tolist(),
+    }
+
+
+def parse_result(result, class_names):
+    """单张图像：推理结果 -> 接口返回结构，模型无有效输出时返回 None"""
+    columns = extract(result, len(class_names))
+    return to_json(columns, class_names) if columns is not None else None
+
+
+def parse_results(results, class_names):
+    """批量版本的 parse_result"""
+    return [
+        to_json(columns, class_names) if columns is not None else None
+        for columns in extract_batch(results, len(class_names))
+    ]
@@ -1,135 +1,131 @@
 from fastapi import APIRouter, UploadFile, File, Depends, Form
-from fastapi.responses import JSONResponse 
-from sqlmodel import Session
-from database import get_session
+from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from history_models import PredictionRecord
-from ultralytics import YOLO
-from PIL import Image
-import numpy as np
+from db_writer import record_writer
+from typing import List
+import asyncio
 import os
-import shutil
-import tempfile
-import time
-import uuid
+import blob_store
+import history_stats  # 检测记录写入时同步更新统计汇总表
+import ingest
+import model_registry
+import thumbnails
+from postprocess import parse_result, parse_results
+from inference_scheduler import scheduler
+from inference_pool import inference_slot, limiter, run_inference, run_model, INFERENCE_MODE
+from result_cache import result_cache
 
 router = APIRouter(tags=["Prediction"])
 
+# 批量预测时单次前向传播的最大图像数
+PREDICT_MAX_BATCH = int(os.environ.get("PREDICT_MAX_BATCH", "32"))
+
+
+def _read_and_hash(file):
+    buf = ingest.upload_bytes(file)
+    return buf, blob_store.content_hash(buf)
+
+
+async def ingest_upload(file):
+    """
+    读取上传缓冲区并计算内容哈希，原始字节在后台并发写入内容寻址存储（相同图像只存一份）
+    返回 (缓冲区, SHA-256, 落盘任务)；落盘任务的结果是 uploads/ab/cd/<sha256>.ext，入库前 await
+    解码推迟到结果缓存未命中时再做（ingest.decode_image）
+    """
+    buf, digest = await run_in_threadpool(_read_and_hash, file)
+    persist = asyncio.ensure_future(run_in_threadpool(blob_store.put_bytes, buf, file.filename, digest))
+    # 请求中途出错返回时，落盘任务的异常不再被 await，这里提前取走避免告警
+    persist.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return buf, digest, persist
+
+
+def resolve_model_id(model_file, model_id, variant=None):
+    """
+    上传的模型文件先按内容哈希注册，相同文件复用已加载的实例
+    指定 variant（fp32 / int8）时切换到同一训练产物的对应精度版本
+    """
+    if model_file is not None:
+        model_id = model_registry.register_fileobj(model_file.file, name=model_file.filename).id
+    if variant:
+        model_id = model_registry.resolve_variant(model_id, variant)
+    return model_id
+
+
 @router.post("/predict")
 async def predict(
     file: UploadFile = File(...),   # 上传的MRI图像
-    model_file: UploadFile = File(...),  # 上传的模型（分类.cls.pt / 检测.pt）
+    model_file: UploadFile = File(None),  # 上传的模型（分类.cls.pt / 检测.pt），与 model_id 二选一
+    model_id: str = Form(None),  # 模型注册表中的 SHA-256
+    variant: str = Form(None),  # 模型精度：fp32 / int8（需先注册量化模型）
     patient_name: str = Form(None),
     patient_gender: str = Form(None),
     patient_age: int = Form(None),
     medical_id: str = Form(None),
-    session: Session = Depends(get_session)
+    _slot=Depends(inference_slot),
 ):
-    # 保存上传图像（逻辑不变）
-    upload_dir = os.path.join(os.path.dirname(__file__), "uploads")
-    os.makedirs(upload_dir, exist_ok=True)
-    filename = file.filename or f"{int(time.time())}.jpg"
-    unique_name = f"{int(time.time())}_{uuid.uuid4().hex}_{filename}"
-    img_abs_path = os.path.join(upload_dir, unique_name)
-    image_rel_path = f"uploads/{unique_name}"
+    # 文件、数据库等阻塞操作放到线程池执行，避免阻塞事件循环
+    # 从注册表获取模型
+    if model_file is None and not model_id:
+        return JSONResponse({"error": "请上传模型文件或提供 model_id"}, status_code=400)
+    try:
+        model_id = await run_in_threadpool(resolve_model_id, model_file, model_id, variant)
+    except KeyError as e:
+        return JSONResponse({"error": f"模型不存在: {str(e)}"}, status_code=404)
+    except Exception as e:
+        return JSONResponse({"error": f"模型注册失败: {str(e)}"}, status_code=500)
 
+    # 读取上传图像，保存与推理并发进行
     try:
-        with open(img_abs_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        buf, image_hash, persist = await ingest_upload(file)
     except Exception as e:
-        return JSONResponse({"error": f"保存图片失败: {str(e)}"}, status_code=500)
+        return JSONResponse({"error": f"读取图片失败: {str(e)}"}, status_code=500)
 
-    # 临时保存&加载模型（逻辑不变）
-    current_model = None
-    temp_model_path = None
-    results = None
-    # 【新增】初始化分类/检测共用变量，避免未定义报错
-    class_scores_raw = None
-    class_probs = None
-    
+    # 同一图像 + 同一模型 + 同一推理参数：直接返回缓存结果，不加载模型、不解码
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pt") as temp_model:
-            shutil.copyfileobj(model_file.file, temp_model)
-            temp_model_path = temp_model.name
-        current_model = YOLO(temp_model_path)
+        parsed = await run_in_threadpool(result_cache.get, image_hash, model_id)
+    except Exception:
+        parsed = None
+    cached = parsed is not None
+
+    if not cached:
+        try:
+            current_model = await run_inference(model_registry.get_model, model_id)
+        except KeyError:
+            return JSONResponse({"error": f"模型不存在: {model_id}"}, status_code=404)
+        except Exception as e:
+            return JSONResponse({"error": f"模型加载失败: {str(e)}"}, status_code=500)
 
-        # 读取图像（逻辑不变）
-        image = Image.open(img_abs_path).convert("RGB")
-        image_np = np.array(image)
-        results = current_model(image_np)
+        try:
+            image_np = await run_in_threadpool(ingest.decode_image, buf)
+        except Exception as e:
+            return JSONResponse({"error": f"读取图片失败: {str(e)}"}, status_code=500)
 
+        try:
+            # 交给微批调度器，与同一时间窗口内的其他请求合并推理
+            results = [await scheduler.submit(model_id, current_model, image_np)]
+
+        except Exception as e:
+            return JSONResponse({"error": f"推理过程失败: {str(e)}"}, status_code=500)
+
+        class_names = list(current_model.model.names.values())  # 所有类别名
+        parsed = parse_result(results[0], class_names) if results else None
+        if parsed is None:
+            return JSONResponse({"error": "模型无有效输出（请确认是分类或检测模型）"}, status_code=500)
+        if parsed["main_class"] is None:
+            return JSONResponse({"error": "未检测到任何类别结果"}, status_code=500)
+        try:
+            await run_in_threadpool(result_cache.put, image_hash, model_id, parsed)
+        except Exception:
+            # 缓存写入失败不影响本次结果
+            pass
+
+    try:
+        image_rel_path = await persist
     except Exception as e:
-        return JSONResponse({"error": f"推理过程失败: {str(e)}"}, status_code=500)
-    finally:
-        if temp_model_path and os.path.exists(temp_model_path):
-            try:
-                os.unlink(temp_model_path)
-            except Exception as e:
-                print(f"警告：临时模型文件删除失败: {str(e)}")
-
-    # 解析结果：统一提取“多类别概率”
-    main_class = None
-    main_confidence = None
-    all_results_list = []
-    bboxes_list = []
-    class_names = list(current_model.model.names.values())  # 所有类别名
-
-    # 情况1：分类模型（有 probs 且非 None）
-    if results and len(results) > 0 and hasattr(results[0], "probs") and results[0].probs is not None:
-        probs = results[0].probs.data.cpu().numpy()
-        sorted_indices = np.argsort(probs)[::-1]  # 按置信度降序排列
-        all_results_list = [
-            {"class": class_names[int(idx)], "confidence": float(probs[int(idx)])}
-            for idx in sorted_indices
-        ]
-        # 【新增】分类任务的原始分数=概率，归一化概率=概率（无需额外计算）
-        class_scores_raw = [float(probs[int(idx)]) for idx in sorted_indices]
-        class_probs = [float(probs[int(idx)]) for idx in sorted_indices]
-
-    # 情况2：检测模型（提取所有检测框的类别+置信度）
-    elif results and len(results) > 0 and hasattr(results[0], "boxes") and results[0].boxes is not None:
-        boxes = results[0].boxes
-        det_results = []
-        xyxy = boxes.xyxy.cpu().numpy() if hasattr(boxes.xyxy, 'cpu') else np.array(boxes.xyxy)
-        confs = boxes.conf.data.cpu().numpy() if hasattr(boxes.conf, 'data') else np.array(boxes.conf)
-        clss = boxes.cls.data.cpu().numpy() if hasattr(boxes.cls, 'data') else np.array(boxes.cls)
-
-        for (xy, c, conf) in zip(xyxy, clss, confs):
-            cls_idx = int(c)
-            conf_val = float(conf)
-            det_results.append({
-                "class": class_names[cls_idx],
-                "confidence": conf_val,
-            })
-            bboxes_list.append({
-                "xyxy": [float(xy[0]), float(xy[1]), float(xy[2]), float(xy[3])],
-                "class": class_names[cls_idx],
-                "confidence": conf_val,
-            })
-
-        # 检测任务：按类别取最大置信度作为原始分数，再归一化
-        class_scores = {name: 0.0 for name in class_names}
-        for d in det_results:
-            cname = d["class"]
-            class_scores[cname] = max(class_scores.get(cname, 0.0), d["confidence"])
-        class_scores_raw = [float(class_scores[name]) for name in class_names]
-        total = sum(class_scores_raw)
-        class_probs = [score/total if total>0 else 0.0 for score in class_scores_raw]
-        # 检测任务的all_results_list按类别顺序排列
-        all_results_list = [
-            {"class": class_names[i], "confidence": class_probs[i]}
-            for i in range(len(class_names))
-        ]
-
-    else:
-        return JSONResponse({"error": "模型无有效输出（请确认是分类或检测模型）"}, status_code=500)
-
-    # 提取置信度最高的类别
-    if all_results_list:
-        main_result = max(all_results_list, key=lambda x: x["confidence"])
-        main_class = main_result["class"]
-        main_confidence = main_result["confidence"]
-    else:
-        return JSONResponse({"error": "未检测到任何类别结果"}, status_code=500)
+        return JSONResponse({"error": f"保存图片失败: {str(e)}"}, status_code=500)
+    # 缩略图在后台生成，不等待
+    thumbnails.schedule(image_rel_path)
 
     # 数据库存储 + 返回结果
     try:
@@ -138,36 +134,193 @@ async def predict(
             patient_gender=patient_gender,
             patient_age=patient_age,
             medical_id=medical_id,
-            label=main_class,
-            confidence=main_confidence,
-            all_results=all_results_list,
-            bboxes=bboxes_list,  # 分类任务自动为[]，检测任务为边界框列表
+            label=parsed["main_class"],
+            confidence=parsed["confidence"],
+            all_results=parsed["all_results"],
+            bboxes=parsed["bboxes"],
             image_path=image_rel_path
         )
-        session.add(rec)
-        session.commit()
-        session.refresh(rec)
+        # 交给单写线程，与其他请求的插入合并到同一个事务
+        saved_id, = await record_writer.write([rec])
     except Exception as e:
         return JSONResponse({
             "error": f"数据库存储失败: {str(e)}",
             "result": {
-                "main_class": main_class,
-                "confidence": main_confidence,
-                "all_results": all_results_list,
-                "bboxes": bboxes_list,
+                "main_class": parsed["main_class"],
+                "confidence": parsed["confidence"],
+                "all_results": parsed["all_results"],
+                "bboxes": parsed["bboxes"],
                 "image_path": image_rel_path
             }
         }, status_code=500)
 
-    # 【修改】返回时判断变量是否存在，避免返回未定义字段
     return JSONResponse({
-        "saved_id": rec.id,
+        "saved_id": saved_id,
         "medical_id": medical_id,
-        "main_class": main_class,
-        "confidence": main_confidence,
-        "all_results": all_results_list,
-        "bboxes": bboxes_list,
-        "class_scores_raw": class_scores_raw if class_scores_raw is not None else [],
-        "class_probs": class_probs if class_probs is not None else [],
+        "model_id": model_id,
+        **parsed,
         "image_path": image_rel_path,
-    })
\ No newline at end of file
+        "cached": cached,
+    })
+
+
+@router.get("/predict/scheduler")
+async def scheduler_stats():
+    """微批调度器状态：各模型队列深度与批大小分布"""
+    stats = {**scheduler.stats(), "pool": limiter.stats(), "db_writer": record_writer.stats()}
+    if INFERENCE_MODE == "process":
+        from inference_workers import worker_pool_stats
+        stats["workers"] = worker_pool_stats()
+    return stats
+
+
+@router.get("/predict/cache")
+async def cache_stats():
+    """推理结果缓存状态：命中（内存 / 数据库）与未命中次数"""
+    return result_cache.stats()
+
+
+@router.put("/predict/scheduler")
+async def configure_scheduler(
+    max_batch: int = Form(None),
+    max_wait_ms: float = Form(None),
+):
+    scheduler.configure(max_batch=max_batch, max_wait_ms=max_wait_ms)
+    return scheduler.stats()
+
+
+@router.post("/predict/batch")
+async def predict_batch(
+    files: List[UploadFile] = File(...),   # 同一病人的多张MRI切片
+    model_file: UploadFile = File(None),
+    model_id: str = Form(None),
+    variant: str = Form(None),
+    batch_size: int = Form(None),  # 单次前向传播的图像数，默认 PREDICT_MAX_BATCH
+    patient_name: str = Form(None),
+    patient_gender: str = Form(None),
+    patient_age: int = Form(None),
+    medical_id: str = Form(None),
+    _slot=Depends(inference_slot),
+):
+    if model_file is None and not model_id:
+        return JSONResponse({"error": "请上传模型文件或提供 model_id"}, status_code=400)
+    try:
+        model_id = await run_in_threadpool(resolve_model_id, model_file, model_id, variant)
+    except KeyError as e:
+        return JSONResponse({"error": f"模型不存在: {str(e)}"}, status_code=404)
+    except Exception as e:
+        return JSONResponse({"error": f"模型注册失败: {str(e)}"}, status_code=500)
+
+    batch_size = min(batch_size or PREDICT_MAX_BATCH, PREDICT_MAX_BATCH)
+    if batch_size < 1:
+        return JSONResponse({"error": "batch_size 必须大于 0"}, status_code=400)
+
+    # 读取全部图像，保存与推理并发进行
+    uploads = []
+    persists = []
+    try:
+        for file in files:
+            buf, image_hash, persist = await ingest_upload(file)
+            uploads.append((buf, image_hash))
+            persists.append(persist)
+    except Exception as e:
+        return JSONResponse({"error": f"读取图片失败: {str(e)}"}, status_code=500)
+
+    # 先查结果缓存，只有未命中的图像才解码、推理
+    try:
+        parsed_list = await run_in_threadpool(
+            lambda: [result_cache.get(image_hash, model_id) for _, image_hash in uploads]
+        )
+    except Exception:
+        parsed_list = [None] * len(uploads)
+    misses = [i for i, parsed in enumerate(parsed_list) if parsed is None]
+    cached_flags = [parsed is not None for parsed in parsed_list]
+    decode_errors = {}
+
+    if misses:
+        try:
+            current_model = await run_inference(model_registry.get_model, model_id)
+        except KeyError:
+            return JSONResponse({"error": f"模型不存在: {model_id}"}, status_code=404)
+        except Exception as e:
+            return JSONResponse({"error": f"模型加载失败: {str(e)}"}, status_code=500)
+
+        # 逐张解码：个别切片损坏只标记该项失败，其余照常推理、保存
+        decoded, images = [], []
+        for i in misses:
+            try:
+                images.append(await run_in_threadpool(ingest.decode_image, uploads[i][0]))
+                decoded.append(i)
+            except Exception as e:
+                decode_errors[i] = f"读取图片失败: {str(e)}"
+
+        # 按 batch_size 分批堆叠推理
+        results = []
+        try:
+            for i in range(0, len(images), batch_size):
+                results.extend(await run_model(model_id, current_model, images[i:i + batch_size]))
+        except Exception as e:
+            return JSONResponse({"error": f"推理过程失败: {str(e)}"}, status_code=500)
+
+        class_names = list(current_model.model.names.values())
+        for i, parsed in zip(decoded, parse_results(results, class_names)):
+            parsed_list[i] = parsed
+        try:
+            await run_in_threadpool(lambda: [
+                result_cache.put(uploads[i][1], model_id, parsed_list[i])
+                for i in misses
+                if parsed_list[i] is not None and parsed_list[i]["main_class"] is not None
+            ])
+        except Exception:
+            # 缓存写入失败不影响本次结果
+            pass
+
+    try:
+        image_paths = await asyncio.gather(*persists)
+    except Exception as e:
+        return JSONResponse({"error": f"保存图片失败: {str(e)}"}, status_code=500)
+    for image_rel_path in image_paths:
+        thumbnails.schedule(image_rel_path)
+
+    items = []
+    for i, (parsed, image_rel_path, cached) in enumerate(zip(parsed_list, image_paths, cached_flags)):
+        if i in decode_errors:
+            items.append({"error": decode_errors[i], "image_path": image_rel_path})
+        elif parsed is None:
+            items.append({"error": "模型无有效输出（请确认是分类或检测模型）", "image_path": image_rel_path})
+        elif parsed["main_class"] is None:
+            items.append({"error": "未检测到任何类别结果", "image_path": image_rel_path})
+        else:
+            items.append({**parsed, "image_path": image_rel_path, "cached": cached})
+
+    # 所有记录在同一个事务中写入
+    ok_items = [item for item in items if "error" not in item]
+    recs = [
+        PredictionRecord(
+            patient_name=patient_name,
+            patient_gender=patient_gender,
+            patient_age=patient_age,
+            medical_id=medical_id,
+            label=item["main_class"],
+            confidence=item["confidence"],
+            all_results=item["all_results"],
+            bboxes=item["bboxes"],
+            image_path=item["image_path"]
+        )
+        for item in ok_items
+    ]
+    try:
+        ids = iter(await record_writer.write(recs))
+        saved_ids = [None if "error" in item else next(ids) for item in items]
+    except Exception as e:
+        return JSONResponse({"error": f"数据库存储失败: {str(e)}", "results": items}, status_code=500)
+
+    return JSONResponse({
+        "medical_id": medical_id,
+        "model_id": model_id,
+        "count": len(items),
+        "results": [
+            {"saved_id": saved_id, "medical_id": medical_id, "model_id": model_id, **item} if saved_id else item
+            for saved_id, item in zip(saved_ids, items)
+        ],
+    })
@@ -0,0 +1,19 @@
+from typing import Optional
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from sqlmodel import SQLModel, Field
+
+# 模型注册表：以文件内容 SHA-256 作为主键，同一个 .pt 只保存一份
+class ModelEntry(SQLModel, table=True):
+    id: str = Field(primary_key=True, description="模型文件的 SHA-256")
+
+    name: Optional[str] = Field(default=None, index=True)  # 原始文件名，如 best-95_12%.pt
+    source: Optional[str] = Field(default=None)  # upload / results 目录的原始路径
+    file_path: str  # 注册表内的存储路径（相对 FastAPI 目录）
+    size: Optional[int] = Field(default=None)
+    format: str = Field(default="pt")  # pt / onnx
+    variant: str = Field(default="fp32")  # fp32 / int8
+    group: Optional[str] = Field(default=None, index=True)  # 同一训练产物的不同格式、精度共用一个 group
+
+    # 使用北京时间
+    created_at: datetime = Field(default_factory=lambda: datetime.now(tz=ZoneInfo('Asia/Shanghai')))
@@ -0,0 +1,75 @@
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from sqlmodel import Session, select
+from database import get_session
+from registry_models import ModelEntry
+from typing import List
+import model_registry
+from inference_scheduler import scheduler
+from inference_pool import evict_model
+
+router = APIRouter(prefix="/models", tags=["Models"])
+
+
+@router.post("/", response_model=ModelEntry)
+def upload_model(model_file: UploadFile = File(...), base_model_id: str = Form(None)):
+    """
+    上传模型；内容相同的文件直接返回已有的 model_id
+    上传量化模型时用 base_model_id 指明对应的 FP32 模型，之后才能用 variant 在两者之间切换
+    """
+    try:
+        return model_registry.register_fileobj(model_file.file, name=model_file.filename, base_model_id=base_model_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"基础模型不存在: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"模型注册失败: {str(e)}")
+
+
+@router.post("/scan", response_model=List[ModelEntry])
+def scan_models(results_dir: str = Form(None)):
+    """扫描训练输出目录 results/*/weights 并注册其中的模型；results_dir 只能是 RESULTS_DIR 下的目录"""
+    try:
+        return model_registry.scan_results(results_dir)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/", response_model=List[ModelEntry])
+def list_models(session: Session = Depends(get_session)):
+    stmt = select(ModelEntry).order_by(ModelEntry.created_at.desc())
+    return session.exec(stmt).all()
+
+
+@router.get("/cache", response_model=dict)
+def cache_stats():
+    return model_registry.model_cache.stats()
+
+
+@router.put("/cache", response_model=dict)
+def resize_cache(capacity: int = Form(...)):
+    if capacity < 1:
+        raise HTTPException(status_code=400, detail="capacity 必须大于 0")
+    model_registry.model_cache.resize(capacity)
+    return model_registry.model_cache.stats()
+
+
+@router.delete("/cache/{model_id}", response_model=dict)
+def evict_cached_model(model_id: str):
+    evict_model(model_id)
+    return {"evicted": model_registry.model_cache.evict(model_id)}
+
+
+@router.get("/{model_id}", response_model=ModelEntry)
+def get_model_entry(model_id: str):
+    entry = model_registry.get_entry(model_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="not found")
+    return entry
+
+
+@router.delete("/{model_id}", response_model=dict)
+def delete_model(model_id: str):
+    if not model_registry.remove_model(model_id):
+        raise HTTPException(status_code=404)
+    scheduler.remove(model_id)
+    evict_model(model_id)
+    return {"ok": True}
@@ -0,0 +1,119 @@
+import os
+import threading
+from collections import OrderedDict
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+from database import engine
+from cache_models import PredictionCacheEntry
+
+# 推理结果缓存：内存 LRU + SQLite 持久化，同一图像用同一模型重复推理时直接返回
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "1") == "1"
+# 内存中最多保留的结果条数
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "10000"))
+# 推理参数标识，参与缓存 key；推理参数或后处理逻辑变化时修改，旧缓存自然失效
+RESULT_CACHE_PARAMS = os.environ.get("RESULT_CACHE_PARAMS", "default")
+
+
+class ResultCache:
+    def __init__(self, capacity, enabled=True):
+        self.capacity = max(0, capacity)
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(image_hash, model_id, params=RESULT_CACHE_PARAMS):
+        return f"{image_hash}:{model_id}:{params}"
+
+    def _remember(self, key, result):
+        if self.capacity == 0:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def get(self, image_hash, model_id, params=RESULT_CACHE_PARAMS):
+        """命中返回缓存的结果 dict，未命中返回 None"""
+        if not self.enabled:
+            return None
+        key = self.make_key(image_hash, model_id, params)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return result
+
+        with Session(engine) as session:
+            entry = session.get(PredictionCacheEntry, key)
+            result = entry.result if entry is not None else None
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.db_hits += 1
+        if result is not None:
+            self._remember(key, result)
+        return result
+
+    def put(self, image_hash, model_id, result, params=RESULT_CACHE_PARAMS):
+        if not self.enabled:
+            return
+        key = self.make_key(image_hash, model_id, params)
+        self._remember(key, result)
+        with Session(engine) as session:
+            session.merge(PredictionCacheEntry(
+                key=key, image_hash=image_hash, model_id=model_id, params=params, result=result,
+            ))
+            try:
+                session.commit()
+            except IntegrityError:
+                # 并发请求已写入同一条结果
+                session.rollback()
+        with self._lock:
+            self.stores += 1
+
+    def invalidate_model(self, model_id):
+        """模型从注册表删除时清除其全部缓存结果"""
+        marker = f":{model_id}:"
+        with self._lock:
+            for key in [k for k in self._entries if marker in k]:
+                del self._entries[key]
+            self.invalidations += 1
+        with Session(engine) as session:
+            session.execute(delete(PredictionCacheEntry).where(PredictionCacheEntry.model_id == model_id))
+            session.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        with Session(engine) as session:
+            session.execute(delete(PredictionCacheEntry))
+            session.commit()
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.db_hits
+            total = hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "capacity": self.capacity,
+                "size": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "stores": self.stores,
+                "invalidations": self.invalidations,
+            }
+
+
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_ENABLED)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 后端模块是 FastAPI/ 下的平铺模块，测试从仓库任意目录运行时都能导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,141 @@
+import os
+import time
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import update
+from sqlmodel import Session, SQLModel, create_engine, select
+import blob_store
+from history_models import PredictionRecord, UploadBlob
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'blobs.db'}")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(blob_store, "engine", engine)
+    monkeypatch.setattr(blob_store, "BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(blob_store, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    yield engine
+    engine.dispose()
+
+
+def blob(engine, rel_path):
+    with Session(engine) as session:
+        return session.get(UploadBlob, rel_path)
+
+
+def test_blob_registered_with_record_insert(engine, tmp_path):
+    rel_path = blob_store.put_bytes(b"image", "a.png")
+    # 只落盘不登记，登记随检测记录在同一事务中完成
+    assert blob(engine, rel_path) is None
+    with Session(engine) as session:
+        session.add_all([PredictionRecord(image_path=rel_path), PredictionRecord(image_path=rel_path)])
+        session.commit()
+    row = blob(engine, rel_path)
+    assert (row.refcount, row.size) == (2, len(b"image"))
+
+
+def test_gc_only_removes_unreferenced(engine, tmp_path):
+    kept = blob_store.put_bytes(b"kept", "a.png")
+    dropped = blob_store.put_bytes(b"dropped", "b.png")
+    with Session(engine) as session:
+        session.add_all([PredictionRecord(image_path=kept), PredictionRecord(image_path=dropped)])
+        session.commit()
+        session.delete(session.exec(select(PredictionRecord).where(PredictionRecord.image_path == dropped)).one())
+        session.commit()
+
+    assert blob_store.gc(dry_run=True, grace_seconds=0) == [dropped]
+    assert os.path.exists(tmp_path / dropped)
+    assert blob_store.gc(grace_seconds=0) == [dropped]
+    assert not os.path.exists(tmp_path / dropped)
+    assert blob(engine, dropped) is None
+    assert os.path.exists(tmp_path / kept)
+    assert blob(engine, kept).refcount == 1
+
+
+def age(engine, tmp_path, rel_path, seconds=3600):
+    """把 blob 的登记时间和文件 mtime 都往前拨，模拟早已超过宽限期"""
+    old = time.time() - seconds
+    os.utime(tmp_path / rel_path, (old, old))
+    with Session(engine) as session:
+        session.execute(update(UploadBlob).where(UploadBlob.path == rel_path).values(touched_at=old))
+        session.commit()
+
+
+def unreferenced(engine, rel_path):
+    with Session(engine) as session:
+        record = PredictionRecord(image_path=rel_path)
+        session.add(record)
+        session.commit()
+        session.delete(record)
+        session.commit()
+
+
+def after_scan(monkeypatch, action):
+    """gc 查出候选之后、逐个删除之前执行 action"""
+    real_session = blob_store.Session
+
+    class ScanThen(real_session):
+        def exec(self, stmt):
+            result = super().exec(stmt)
+            if "touched_at" not in str(stmt):
+                return result
+            candidates = result.all()
+            action()
+            return SimpleNamespace(all=lambda: candidates)
+
+    monkeypatch.setattr(blob_store, "Session", ScanThen)
+
+
+def test_gc_skips_blob_referenced_after_scan(engine, tmp_path, monkeypatch):
+    rel_path = blob_store.put_bytes(b"image", "a.png")
+    unreferenced(engine, rel_path)
+    age(engine, tmp_path, rel_path)
+
+    def reference():
+        with Session(engine) as other:
+            other.add(PredictionRecord(image_path=rel_path))
+            other.commit()
+
+    after_scan(monkeypatch, reference)
+    assert blob_store.gc(grace_seconds=60) == []
+    assert os.path.exists(tmp_path / rel_path)
+    assert blob(engine, rel_path).refcount == 1
+
+
+def test_gc_skips_blob_uploaded_again_after_scan(engine, tmp_path, monkeypatch):
+    # 推理进行中（记录还没写入）同一张图像又被上传：put_bytes 刷新 mtime，gc 不能删文件
+    rel_path = blob_store.put_bytes(b"image", "a.png")
+    unreferenced(engine, rel_path)
+    age(engine, tmp_path, rel_path)
+
+    after_scan(monkeypatch, lambda: blob_store.put_bytes(b"image", "a.png"))
+    assert blob_store.gc(grace_seconds=60) == []
+    assert os.path.exists(tmp_path / rel_path)
+    with Session(engine) as session:
+        session.add(PredictionRecord(image_path=rel_path))
+        session.commit()
+    assert blob(engine, rel_path).refcount == 1
+
+
+def test_gc_collects_unregistered_files(engine, tmp_path):
+    # 模型不存在 / 解码失败时图像已落盘但没有记录
+    stale = blob_store.put_bytes(b"stale", "a.png")
+    fresh = blob_store.put_bytes(b"fresh", "b.png")
+    old = time.time() - 3600
+    os.utime(tmp_path / stale, (old, old))
+
+    assert blob_store.gc(grace_seconds=60) == [stale]
+    assert not os.path.exists(tmp_path / stale)
+    assert os.path.exists(tmp_path / fresh)
+    assert blob(engine, fresh).refcount == 0
+
+
+def test_remove_file_restores_recently_touched(tmp_path):
+    path = tmp_path / "blob.png"
+    path.write_bytes(b"x")
+    assert blob_store._remove_file(str(path), cutoff=time.time() - 60) is False
+    assert path.read_bytes() == b"x"
+    assert not os.path.exists(str(path) + ".gc")
+    assert blob_store._remove_file(str(path), cutoff=time.time() + 60) is True
+    assert not os.path.exists(path)
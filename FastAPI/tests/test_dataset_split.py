@@ -0,0 +1,38 @@
+import json
+import os
+import dataset_split
+
+
+def _dataset(root):
+    for subdir, class_name, name in [("train", "AD", "a.png"), ("train", "NC", "b.png"), ("valid", "AD", "a.png")]:
+        os.makedirs(root / subdir / class_name, exist_ok=True)
+        (root / subdir / class_name / name).write_bytes(f"{subdir}/{class_name}/{name}".encode())
+
+
+def _view_files(view_dir):
+    return sorted(
+        os.path.relpath(os.path.join(d, f), view_dir).replace(os.sep, "/")
+        for d, _, files in os.walk(view_dir) for f in files if f != dataset_split.VIEW_STAMP
+    )
+
+
+def test_materialize_rebuilds_interrupted_view(tmp_path):
+    _dataset(tmp_path)
+    split = dataset_split.create_split(str(tmp_path), strategy="random", ratio=0.0, workers=1)
+    view_dir = dataset_split.materialize(str(tmp_path), split)
+    expected = _view_files(view_dir)
+    # 模拟中断：视图里留有链接但没有 .view.json
+    os.remove(os.path.join(view_dir, dataset_split.VIEW_STAMP))
+    dataset_split.materialize(str(tmp_path), split)
+    assert _view_files(view_dir) == expected
+    assert expected == ["train/AD/a.png", "train/AD/valid_a.png", "train/NC/b.png"]
+
+
+def test_materialize_skips_missing_sources(tmp_path):
+    _dataset(tmp_path)
+    split = dataset_split.create_split(str(tmp_path), strategy="random", ratio=0.0, workers=1)
+    os.remove(tmp_path / "train" / "NC" / "b.png")
+    view_dir = dataset_split.materialize(str(tmp_path), split, link="symlink")
+    assert _view_files(view_dir) == ["train/AD/a.png", "train/AD/valid_a.png"]
+    with open(os.path.join(view_dir, dataset_split.VIEW_STAMP), encoding="utf-8") as f:
+        assert json.load(f)["missing"] == ["train/NC/b.png"]
@@ -0,0 +1,48 @@
+import pytest
+from sqlmodel import Session, SQLModel, create_engine, select
+import history_search
+from history_models import PredictionRecord
+
+NAMES = ["王芳", "李芳华", "张伟", "王小明", "芳1"]
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'search.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(
+            PredictionRecord(patient_name=name, medical_id=f"MR{i:05d}") for i, name in enumerate(NAMES)
+        )
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+def search(session, **filters):
+    stmt = history_search.apply_filters(select(PredictionRecord.patient_name), **filters)
+    return sorted(session.exec(stmt).all())
+
+
+def test_one_char_substring(session):
+    # 单字出现在姓名中间 / 末尾 / 开头都要命中
+    assert search(session, patient_name="芳") == sorted(["王芳", "李芳华", "芳1"])
+
+
+def test_two_char_substring(session):
+    assert search(session, patient_name="芳华") == ["李芳华"]
+    assert search(session, patient_name="小明") == ["王小明"]
+    assert search(session, patient_name="芳1") == ["芳1"]
+
+
+def test_two_char_query_matches_medical_id(session):
+    assert search(session, q="03") == ["王小明"]
+
+
+def test_trigram_substring(session):
+    assert search(session, patient_name="王小明") == ["王小明"]
+    assert search(session, q="R00001") == ["李芳华"]
+
+
+def test_like_wildcards_are_escaped(session):
+    assert search(session, patient_name="%") == []
@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+from inference_scheduler import InferenceScheduler
+
+
+class SlowScheduler(InferenceScheduler):
+    """run_batch 挂起直到 release 被设置；drop 个结果被丢弃，模拟返回数量不足"""
+
+    def __init__(self, drop=0):
+        super().__init__(max_batch=4, max_wait_ms=1)
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.drop = drop
+
+    async def run_batch(self, model_id, model, images):
+        self.started.set()
+        await self.release.wait()
+        return [f"r{image}" for image in images][:len(images) - self.drop]
+
+
+def test_short_results_fail_remaining_futures():
+    async def main():
+        scheduler = SlowScheduler(drop=1)
+        scheduler.release.set()
+        tasks = [asyncio.create_task(scheduler.submit("m", None, i)) for i in range(3)]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert results[:2] == ["r0", "r1"]
+    assert isinstance(results[2], RuntimeError)
+
+
+def test_remove_fails_inflight_and_queued_requests():
+    async def main():
+        scheduler = SlowScheduler()
+        inflight = [asyncio.create_task(scheduler.submit("m", None, i)) for i in range(4)]
+        await scheduler.started.wait()
+        queued = [asyncio.create_task(scheduler.submit("m", None, i)) for i in range(4, 6)]
+        await asyncio.sleep(0)
+        scheduler.remove("m")
+        done = await asyncio.wait_for(asyncio.gather(*inflight, *queued, return_exceptions=True), 1)
+        # 移除后同一模型的新请求重新建队列，正常处理
+        scheduler.release.set()
+        again = await asyncio.wait_for(scheduler.submit("m", None, 9), 1)
+        return done, again
+
+    done, again = asyncio.run(main())
+    assert len(done) == 6
+    assert all(isinstance(r, RuntimeError) for r in done)
+    assert again == "r9"
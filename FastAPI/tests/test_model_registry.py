@@ -0,0 +1,62 @@
+import os
+import pytest
+import model_registry
+
+
+def test_resolve_results_dir_stays_inside(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_registry, "RESULTS_DIR", str(tmp_path))
+    base = os.path.realpath(tmp_path)
+    assert model_registry.resolve_results_dir(None) == base
+    assert model_registry.resolve_results_dir("run1") == os.path.join(base, "run1")
+    assert model_registry.resolve_results_dir(os.path.join(base, "run1")) == os.path.join(base, "run1")
+    for bad in ("..", "../other", "/etc", "run1/../../x"):
+        with pytest.raises(ValueError):
+            model_registry.resolve_results_dir(bad)
+
+
+def test_failed_load_releases_load_lock(monkeypatch):
+    monkeypatch.setattr(model_registry, "get_entry", lambda model_id: None)
+    cache = model_registry.ModelCache(2)
+    for model_id in ("missing-1", "missing-2"):
+        with pytest.raises(KeyError):
+            cache.get(model_id)
+    assert cache._load_locks == {}
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    from sqlmodel import SQLModel, create_engine
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'registry.db'}")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(model_registry, "engine", engine)
+    monkeypatch.setattr(model_registry, "BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(model_registry, "MODEL_STORE_DIR", str(tmp_path))
+    yield
+    engine.dispose()
+
+
+def upload(content, name, base_model_id=None):
+    import io
+    return model_registry.register_fileobj(io.BytesIO(content), name=name, base_model_id=base_model_id)
+
+
+def test_uploaded_variants_only_match_linked_models(registry):
+    # 两次训练各自上传 best.pt，只有第一次登记了对应的 INT8 模型
+    run1 = upload(b"run1-fp32", "best.pt")
+    run2 = upload(b"run2-fp32", "best.pt")
+    run1_int8 = upload(b"run1-int8", "best-int8.onnx", base_model_id=run1.id)
+    assert run1_int8.variant == "int8"
+    assert model_registry.resolve_variant(run1.id, "int8") == run1_int8.id
+    assert model_registry.resolve_variant(run1_int8.id, "fp32") == run1.id
+    with pytest.raises(KeyError):
+        model_registry.resolve_variant(run2.id, "int8")
+    # 未指明对应模型的 INT8 上传自成一组
+    orphan = upload(b"orphan-int8", "best-int8.onnx")
+    with pytest.raises(KeyError):
+        model_registry.resolve_variant(orphan.id, "fp32")
+
+
+def test_upload_with_unknown_base_is_rejected(registry):
+    with pytest.raises(KeyError):
+        upload(b"int8", "best-int8.onnx", base_model_id="missing")
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 上传图像的缩略图 / 多分辨率衍生图：thumbs/<尺寸>/ab/cd/<key>.webp
+# 预测完成后交给后台线程池生成（不增加 /predict 的延迟），历史记录接口第一次请求时也会按需生成
+
+BASE_DIR = os.path.dirname(__file__)
+THUMB_DIR = os.path.join(BASE_DIR, "thumbs")
+# 尺寸名 -> 最长边像素
+THUMB_SIZES = {"small": 128, "medium": 512}
+# 输出格式：webp / jpeg
+THUMB_FORMAT = os.environ.get("THUMB_FORMAT", "webp").lower()
+THUMB_QUALITY = int(os.environ.get("THUMB_QUALITY", "80"))
+# 后台生成线程数（PIL 缩放时会释放 GIL）
+THUMB_WORKERS = int(os.environ.get("THUMB_WORKERS", "2"))
+
+_EXT = ".jpg" if THUMB_FORMAT == "jpeg" else ".webp"
+_executor = ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix="thumb")
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def is_upload_path(image_path):
+    """只接受 uploads/ 下的相对路径，防止越权读取其他文件"""
+    if not image_path or not image_path.startswith("uploads/"):
+        return False
+    return ".." not in image_path.split("/")
+
+
+def _key(image_path):
+    # 内容寻址的 blob 直接用文件名中的 SHA-256；旧路径按路径字符串哈希
+    name = os.path.splitext(os.path.basename(image_path))[0]
+    if len(name) == 64 and all(c in "0123456789abcdef" for c in name):
+        return name
+    return hashlib.sha256(image_path.encode("utf-8")).hexdigest()
+
+
+def thumb_rel_path(image_path, size):
+    key = _key(image_path)
+    return f"thumbs/{size}/{key[:2]}/{key[2:4]}/{key}{_EXT}"
+
+
+def thumb_urls(image_path):
+    """历史记录接口中返回的缩略图地址（相对路径，与 image_path 的用法一致）"""
+    if not is_upload_path(image_path):
+        return None
+    return {size: f"Predictions/thumbs/{size}/{image_path}" for size in THUMB_SIZES}
+
+
+def generate(image_path, size):
+    """生成（或复用）一张衍生图，返回绝对路径；原图不存在时抛 FileNotFoundError"""
+    from PIL import Image
+
+    abs_path = os.path.join(BASE_DIR, thumb_rel_path(image_path, size))
+    if os.path.exists(abs_path):
+        return abs_path
+    src = os.path.join(BASE_DIR, image_path)
+    max_side = THUMB_SIZES[size]
+    with Image.open(src) as image:
+        # JPEG 在解码阶段就按 1/2、1/4、1/8 缩小，避免先解码整张大图
+        image.draft("RGB", (max_side, max_side))
+        image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        out_dir = os.path.dirname(abs_path)
+        os.makedirs(out_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=out_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, THUMB_FORMAT.upper(), quality=THUMB_QUALITY)
+            os.replace(tmp_path, abs_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    return abs_path
+
+
+def _generate_all(image_path):
+    try:
+        for size in THUMB_SIZES:
+            generate(image_path, size)
+    except Exception as e:
+        print(f"⚠️ 缩略图生成失败 {image_path}: {e}")
+    finally:
+        with _pending_lock:
+            _pending.discard(image_path)
+
+
+def schedule(image_path):
+    """提交到后台线程池生成全部尺寸，立即返回；同一张图像排队中时不重复提交"""
+    if not is_upload_path(image_path):
+        return
+    with _pending_lock:
+        if image_path in _pending:
+            return
+        _pending.add(image_path)
+    _executor.submit(_generate_all, image_path)
+
+
+def remove(image_path):
+    """原图被回收时删除其全部衍生图"""
+    for size in THUMB_SIZES:
+        try:
+            os.unlink(os.path.join(BASE_DIR, thumb_rel_path(image_path, size)))
+        except FileNotFoundError:
+            pass
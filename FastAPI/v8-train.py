@@ -5,90 +5,39 @@ from datetime import datetime
 import argparse
 import sys
 from functools import partial
-import hashlib
-import cv2
 import numpy as np
 import pandas as pd  
-import albumentations as A
+import json
+import time
+from PIL import Image
 from ultralytics import YOLO
+import dataset_hash
+import dataset_phash
+import dataset_augment
+import dataset_split
 
 # 强制刷新打印缓冲区
 print = partial(print, flush=True)
 
-def calculate_file_hash(file_path, block_size=65536):
-    """计算文件MD5哈希值"""
-    hasher = hashlib.md5()
-    try:
-        with open(file_path, 'rb') as f:
-            while chunk := f.read(block_size):
-                hasher.update(chunk)
-        return hasher.hexdigest()
-    except Exception:
-        return None
-
-def remove_duplicate_exact(train_dir, backup_confirmed):
-    """MD5 精确去重"""
-    if not backup_confirmed:
+def remove_duplicate_exact(train_dir, backup_confirmed, algo='md5', workers=None, dry_run=False):
+    """
+    精确去重：哈希缓存在数据集根目录的 .hash_manifest.db，只对新增 / 修改过的文件重新计算
+    dry_run 时只写出 dedup_report.json 列出重复文件，不删除
+    """
+    if not backup_confirmed and not dry_run:
         print("ℹ️  未选择执行去重操作")
         return 0
 
-    print(f"\n🔍 启动 MD5 精确去重...")
-    total_deleted = 0
-    hash_map = {}
-    
-    for class_name in os.listdir(train_dir):
-        class_path = os.path.join(train_dir, class_name)
-        if not os.path.isdir(class_path): continue
-        
-        files = sorted([f for f in os.listdir(class_path) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))])
-        for img_name in files:
-            img_path = os.path.join(class_path, img_name)
-            file_hash = calculate_file_hash(img_path)
-            if file_hash is None: continue
-            
-            if file_hash in hash_map:
-                print(f"🗑️  删除重复: {img_name}")
-                try:
-                    os.remove(img_path)
-                    total_deleted += 1
-                except: pass
-            else:
-                hash_map[file_hash] = img_path
-    
-    print(f"✅ 去重结束：共删除 {total_deleted} 张")
-    return total_deleted
+    print(f"\n🔍 启动 {algo} 精确去重{'（仅报告）' if dry_run else ''}...")
+    dataset_root = os.path.dirname(os.path.abspath(train_dir))
+    return dataset_hash.deduplicate(
+        dataset_root, (os.path.basename(os.path.abspath(train_dir)),), algo, workers, dry_run=dry_run
+    )
 
-def augment_dataset_offline(train_dir):
-    """离线增强：生成动态模糊副本"""
+def augment_dataset_offline(train_dir, policy=dataset_augment.DEFAULT_POLICY, seed=42, workers=None):
+    """离线增强：多进程生成增强副本（默认动态模糊，模拟病人运动），已生成的记录在清单中跳过"""
     print("\n🎨 正在生成模拟病人运动的MRI图像...")
-    
-    transform = A.Compose([
-        A.MotionBlur(blur_limit=(15, 31), p=1.0),
-    ])
-
-    aug_count = 0
-    
-    for root, dirs, files in os.walk(train_dir):
-        for file in files:
-            if file.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')) and "_aug_" not in file:
-                file_name, ext = os.path.splitext(file)
-                expected_aug_path = os.path.join(root, f"{file_name}_aug_mri{ext}")
-                
-                if os.path.exists(expected_aug_path): continue 
-
-                img_path = os.path.join(root, file)
-                try:
-                    image = cv2.imread(img_path)
-                    if image is None: continue
-                    augmented = transform(image=image)['image']
-                    cv2.imwrite(expected_aug_path, augmented)
-                    aug_count += 1
-                except: pass
-
-    if aug_count > 0:
-        print(f"✅ 增强完成：新生成 {aug_count} 张模糊图像")
-    else:
-        print("ℹ️  未生成新图像（可能已生成）")
+    return dataset_augment.augment_offline(train_dir, policy, seed=seed, workers=workers)
 
 def create_validation_split(train_dir, valid_dir, split_ratio=0.15):
     """划分验证集"""
@@ -174,8 +123,131 @@ def rename_and_cleanup_models(results_save_dir, final_accuracy):
                 if f.endswith('.pt') and f != new_best_name:
                     try: os.remove(os.path.join(weights_dir, f))
                     except: pass
+            return os.path.join(weights_dir, new_best_name)
         except: pass
 
+def export_models(model_path, formats, img_size):
+    """
+    导出 CPU 推理格式：onnx（动态 batch，供 onnx_backend 加载）/ openvino（IR 目录）
+    导出文件与 .pt 同目录同名
+    """
+    if not model_path or not formats:
+        return []
+    exported = []
+    for fmt in formats:
+        try:
+            print(f"\n📦 正在导出 {fmt.upper()} 模型...")
+            model = YOLO(model_path)
+            if fmt == 'onnx':
+                out = model.export(format='onnx', imgsz=img_size, dynamic=True, simplify=True)
+            else:
+                out = model.export(format=fmt, imgsz=img_size)
+            exported.append(str(out))
+            print(f"✅ 导出完成: {out}")
+        except Exception as e:
+            print(f"⚠️  导出 {fmt} 失败: {e}")
+    return exported
+
+def list_split_images(split_dir):
+    """列出 split_dir/<类别>/ 下的图像，返回 [(路径, 类别名)]"""
+    items = []
+    for class_name in sorted(os.listdir(split_dir)):
+        class_path = os.path.join(split_dir, class_name)
+        if not os.path.isdir(class_path): continue
+        for f in sorted(os.listdir(class_path)):
+            if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')) and "_aug_" not in f:
+                items.append((os.path.join(class_path, f), class_name))
+    return items
+
+def evaluate_onnx(model, items):
+    """返回 (Top-1 准确率, 平均单张耗时 ms)"""
+    names = list(model.model.names.values())
+    correct = 0
+    elapsed = 0.0
+    for path, label in items:
+        image = np.array(Image.open(path).convert("RGB"))
+        start = time.perf_counter()
+        probs = model(image)[0].probs.data
+        elapsed += time.perf_counter() - start
+        correct += names[int(np.argmax(probs))] == label
+    n = max(1, len(items))
+    return correct / n, elapsed / n * 1000
+
+def quantize_model_int8(onnx_path, valid_dir, num_samples=200, eval_samples=1000):
+    """
+    INT8 静态量化：用验证集抽样做校准，输出 <name>-int8.onnx 与 FP32 模型同目录，
+    并对比两者的 Top-1、单张延迟和文件大小，写入 <name>-quant.json
+    """
+    if not onnx_path or not os.path.exists(onnx_path):
+        print("⚠️  未找到 ONNX 模型，跳过量化")
+        return None
+    items = list_split_images(valid_dir) if os.path.exists(valid_dir) else []
+    if not items:
+        print("⚠️  验证集为空，跳过量化")
+        return None
+
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnx_backend import OnnxModel, preprocess
+
+    print(f"\n🧮 正在进行 INT8 量化（校准样本 {min(num_samples, len(items))} 张）...")
+    fp32_model = OnnxModel(onnx_path)
+    calib_items = random.sample(items, min(num_samples, len(items)))
+
+    class ValidCalibrationReader(CalibrationDataReader):
+        # 与线上推理相同的读图和预处理，保证校准分布一致
+        def __init__(self):
+            self._iter = iter(calib_items)
+
+        def get_next(self):
+            item = next(self._iter, None)
+            if item is None:
+                return None
+            image = np.array(Image.open(item[0]).convert("RGB"))
+            return {fp32_model.input_name: preprocess(image, fp32_model.imgsz)[None]}
+
+    stem, _ = os.path.splitext(onnx_path)
+    int8_path = f"{stem}-int8.onnx"
+    try:
+        quantize_static(
+            onnx_path, int8_path, ValidCalibrationReader(),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+        # 保留类别名 / imgsz 等元数据，onnx_backend 依赖这些字段
+        src, dst = onnx.load(onnx_path), onnx.load(int8_path)
+        del dst.metadata_props[:]
+        dst.metadata_props.extend(src.metadata_props)
+        onnx.save(dst, int8_path)
+    except Exception as e:
+        print(f"❌ 量化失败: {e}")
+        return None
+
+    eval_items = random.sample(items, min(eval_samples, len(items)))
+    int8_model = OnnxModel(int8_path)
+    fp32_acc, fp32_ms = evaluate_onnx(fp32_model, eval_items)
+    int8_acc, int8_ms = evaluate_onnx(int8_model, eval_items)
+    report = {
+        "fp32": {"path": os.path.basename(onnx_path), "top1": fp32_acc, "latency_ms": fp32_ms,
+                 "size_mb": os.path.getsize(onnx_path) / 1024 / 1024},
+        "int8": {"path": os.path.basename(int8_path), "top1": int8_acc, "latency_ms": int8_ms,
+                 "size_mb": os.path.getsize(int8_path) / 1024 / 1024},
+        "calibration_samples": len(calib_items),
+        "eval_samples": len(eval_items),
+    }
+    with open(f"{stem}-quant.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print("\n" + "="*40)
+    print(f"📊 INT8 量化结果 (评估 {len(eval_items)} 张)")
+    print(f"   FP32: Top-1 {fp32_acc*100:.2f}%  {fp32_ms:.2f} ms  {report['fp32']['size_mb']:.1f} MB")
+    print(f"   INT8: Top-1 {int8_acc*100:.2f}%  {int8_ms:.2f} ms  {report['int8']['size_mb']:.1f} MB")
+    print(f"   准确率变化: {(int8_acc - fp32_acc)*100:+.2f}%")
+    print("="*40 + "\n")
+    return int8_path
+
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--dataset', type=str, required=True)
@@ -185,6 +257,34 @@ def parse_args():
     parser.add_argument('--model_type', type=str, required=True)
     parser.add_argument('--deduplicate', action='store_true')
     parser.add_argument('--backup_confirmed', action='store_true')
+    parser.add_argument('--dedup_dry_run', action='store_true', help='只生成重复文件报告，不删除')
+    parser.add_argument('--hash_algo', type=str, default='md5', choices=['md5', 'blake2b', 'xxh3', 'xxh64', 'blake3'],
+                        help='去重哈希算法，xxh3 / blake3 需另外安装 xxhash / blake3')
+    parser.add_argument('--hash_workers', type=int, default=None, help='计算哈希的进程数，默认 CPU 核数')
+    parser.add_argument('--split_strategy', type=str, default='move', choices=['move', *dataset_split.STRATEGIES],
+                        help='move 把验证集移出 train（旧方式）；其余方式写划分清单并用链接生成 views/<名称>，不移动原图')
+    parser.add_argument('--split_ratio', type=float, default=0.15)
+    parser.add_argument('--split_seed', type=int, default=42)
+    parser.add_argument('--kfold', type=int, default=5)
+    parser.add_argument('--fold', type=int, default=0)
+    parser.add_argument('--group_pattern', type=str, default=None, help='从文件名提取病人标识的正则，同一病人不会同时出现在 train / valid')
+    parser.add_argument('--split_name', type=str, default=None, help='划分清单名，默认由划分参数生成')
+    parser.add_argument('--near_dedup', action='store_true', help='划分验证集后做感知哈希近重复检测')
+    parser.add_argument('--near_dup_radius', type=int, default=6, help='近重复的汉明距离阈值（64 位）')
+    parser.add_argument('--near_dup_hash', type=str, default='phash', choices=list(dataset_phash.HASH_KINDS))
+    parser.add_argument('--near_dup_action', type=str, default='report', choices=['report', 'quarantine_cross', 'quarantine'],
+                        help='report 只报告；quarantine_cross 把与 train 近重复的 valid 图像移到 quarantine/；quarantine 隔离所有簇')
+    parser.add_argument('--aug_mode', type=str, default='offline', choices=['offline', 'online', 'none'],
+                        help='offline 在磁盘上生成 _aug_ 副本；online 训练时按概率实时增强，不占磁盘')
+    parser.add_argument('--online_aug_p', type=float, default=0.5, help='在线增强时每张图执行增强的概率')
+    parser.add_argument('--clean_aug', action='store_true', help='训练前删除 train 目录中已生成的 _aug_ 副本')
+    parser.add_argument('--aug_policy', type=str, default=dataset_augment.DEFAULT_POLICY,
+                        help=f"增强变换（离线 / 在线共用），逗号分隔（{', '.join(dataset_augment.TRANSFORMS)}）或 albumentations 配置文件")
+    parser.add_argument('--aug_seed', type=int, default=42, help='离线增强随机种子（每张图的种子由它和路径决定）')
+    parser.add_argument('--aug_workers', type=int, default=None, help='离线增强进程数，默认 CPU 核数')
+    parser.add_argument('--export', type=str, default='', help='训练后导出格式，逗号分隔：onnx,openvino')
+    parser.add_argument('--quantize', action='store_true', help='导出 ONNX 后用验证集校准生成 INT8 模型')
+    parser.add_argument('--quantize_samples', type=int, default=200)
     return parser.parse_args()
 
 def main():
@@ -201,16 +301,40 @@ def main():
         return
 
     # 1. 去重
-    if args.deduplicate and args.backup_confirmed:
-        remove_duplicate_exact(train_dir, True)
+    if args.deduplicate and (args.backup_confirmed or args.dedup_dry_run):
+        remove_duplicate_exact(train_dir, args.backup_confirmed, args.hash_algo, args.hash_workers,
+                               dry_run=args.dedup_dry_run)
     else:
         print("ℹ️  跳过去重")
 
-    # 2. 验证集划分
-    create_validation_split(train_dir, valid_dir)
+    # 2. 验证集划分：移动文件（旧方式）或按清单生成链接视图，之后的步骤都在视图上进行
+    if args.split_strategy == 'move':
+        create_validation_split(train_dir, valid_dir, args.split_ratio)
+    else:
+        print(f"\n🔄 正在准备划分视图（{args.split_strategy}）...")
+        dataset_root = dataset_split.prepare_view(
+            dataset_root, args.split_strategy, args.split_ratio, args.split_seed, args.kfold, args.fold,
+            args.group_pattern, args.split_name, workers=args.hash_workers,
+        )
+        train_dir = os.path.join(dataset_root, 'train')
+        valid_dir = os.path.join(dataset_root, 'valid')
+
+    # 2.1 近重复检测（重点检查 train / valid 之间的泄漏）
+    if args.near_dedup:
+        dataset_phash.check_near_duplicates(
+            dataset_root, ('train', 'valid'), args.near_dup_radius, args.near_dup_hash,
+            args.hash_workers, args.near_dup_action,
+        )
 
-    # 3. 离线增强
-    augment_dataset_offline(train_dir)
+    # 3. 增强：离线生成副本 / 训练时在线增强
+    if args.clean_aug:
+        dataset_augment.clean_augmented(train_dir)
+    trainer = None
+    if args.aug_mode == 'offline':
+        augment_dataset_offline(train_dir, args.aug_policy, args.aug_seed, args.aug_workers)
+    elif args.aug_mode == 'online':
+        print(f"\n🎨 在线增强：训练时以 {args.online_aug_p:.0%} 的概率执行 {args.aug_policy}")
+        trainer = dataset_augment.online_trainer(args.aug_policy, args.online_aug_p)
 
     # 4. 启动训练
     try:
@@ -226,6 +350,7 @@ def main():
         # 训练开始
         results = model.train(
             data=dataset_root,
+            trainer=trainer,
             epochs=args.epochs,
             batch=args.batch_size,
             imgsz=args.img_size,
@@ -267,7 +392,14 @@ def main():
             pass
 
         result_dir = str(results.save_dir)
-        rename_and_cleanup_models(result_dir, final_acc)
+        best_path = rename_and_cleanup_models(result_dir, final_acc)
+        export_formats = [f.strip().lower() for f in args.export.split(',') if f.strip()]
+        if args.quantize and 'onnx' not in export_formats:
+            export_formats.append('onnx')
+        exported = export_models(best_path, export_formats, args.img_size)
+        if args.quantize:
+            onnx_path = next((p for p in exported if p.endswith('.onnx')), None)
+            quantize_model_int8(onnx_path, valid_dir, args.quantize_samples)
         analyze_overfitting(result_dir)
 
     except Exception as e:
@@ -17,6 +17,12 @@ async def train(
     img_size: int = Form(640),
     model_type: str = Form("s"),
     backup_confirmed: bool = Form(False),
+    export_formats: str = Form(""),  # 训练后导出格式，如 "onnx" 或 "onnx,openvino"
+    quantize: bool = Form(False),  # 是否生成 INT8 量化模型
+    dedup_dry_run: bool = Form(False),  # 只生成重复文件报告（数据集根目录 dedup_report.json），不删除
+    aug_mode: str = Form("offline"),  # offline：生成 _aug_ 副本；online：训练时实时增强；none：不增强
+    split_strategy: str = Form("move"),  # move：移动文件划分验证集；random / stratified / kfold：清单 + 链接视图
+    group_pattern: str = Form(""),  # 从文件名提取病人标识的正则，按病人划分
     background_tasks: BackgroundTasks = None
 ):
     # 训练前清空日志
@@ -34,6 +40,11 @@ async def train(
     if not os.path.exists(train_dir_check):
         return JSONResponse({"status": "error", "msg": f"找不到 train 文件夹: {train_dir_check}"}, status_code=400)
 
+    if aug_mode not in ("offline", "online", "none"):
+        return JSONResponse({"status": "error", "msg": f"未知的增强模式: {aug_mode}"}, status_code=400)
+    if split_strategy not in ("move", "random", "stratified", "kfold"):
+        return JSONResponse({"status": "error", "msg": f"未知的划分方式: {split_strategy}"}, status_code=400)
+
     # 使用当前 Python 解释器，并开启 unbuffered 模式(-u)
     python_exe = sys.executable or "python"
     cmd = [
@@ -44,8 +55,19 @@ async def train(
         "--img_size", str(img_size),
         "--model_type", model_type,
     ]
+    if backup_confirmed or dedup_dry_run:
+        cmd.append("--deduplicate")
     if backup_confirmed:
-        cmd.extend(["--deduplicate", "--backup_confirmed"])
+        cmd.append("--backup_confirmed")
+    if dedup_dry_run:
+        cmd.append("--dedup_dry_run")
+    cmd.extend(["--aug_mode", aug_mode, "--split_strategy", split_strategy])
+    if group_pattern:
+        cmd.extend(["--group_pattern", group_pattern])
+    if export_formats:
+        cmd.extend(["--export", export_formats])
+    if quantize:
+        cmd.append("--quantize")
 
     env = os.environ.copy()
     env.setdefault('PYTHONUNBUFFERED', '1')
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import time
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+import model_registry
+from inference_pool import INFERENCE_MODE, run_inference, run_model
+
+# 启动时预加载的模型，逗号分隔：model_id / 本地 .pt、.onnx 路径 / "results"（注册并预加载训练目录下全部模型）
+PRELOAD_MODELS = os.environ.get("PRELOAD_MODELS", "")
+# 每个模型的空跑次数，以及空跑使用的图像尺寸（与训练 imgsz 一致）
+WARMUP_RUNS = int(os.environ.get("WARMUP_RUNS", "2"))
+WARMUP_IMGSZ = int(os.environ.get("WARMUP_IMGSZ", "224"))
+
+# 预热状态，/ready 接口据此判断是否可以接流量
+state = {
+    "ready": False,
+    "started_at": None,
+    "finished_at": None,
+    "models": {},
+}
+
+
+def _resolve_preload(spec):
+    """把 PRELOAD_MODELS 解析成 model_id 列表"""
+    model_ids = []
+    for item in [s.strip() for s in spec.split(",") if s.strip()]:
+        try:
+            if item == "results":
+                model_ids.extend(e.id for e in model_registry.scan_results())
+            elif os.path.exists(item):
+                model_ids.append(model_registry.register_path(item).id)
+            else:
+                model_ids.append(item)
+        except Exception as e:
+            state["models"][item] = {"error": str(e)}
+    # 去重并保持顺序
+    return list(dict.fromkeys(model_ids))
+
+
+async def _warm_model(model_id, runs, imgsz):
+    info = {}
+    start = time.perf_counter()
+    model = await run_inference(model_registry.get_model, model_id)
+    info["load_ms"] = (time.perf_counter() - start) * 1000
+
+    dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    # 多进程模式下每轮并发提交，让每个工作进程都完成一次前向传播
+    fanout = 1
+    if INFERENCE_MODE == "process":
+        from inference_workers import get_worker_pool
+        fanout = len((await run_inference(get_worker_pool)).stats()["processes"]) or 1
+    forward_ms = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await asyncio.gather(*[run_model(model_id, model, [dummy]) for _ in range(fanout)])
+        forward_ms.append((time.perf_counter() - start) * 1000)
+    info["forward_ms"] = forward_ms
+    return info
+
+
+async def warmup(spec=PRELOAD_MODELS, runs=WARMUP_RUNS, imgsz=WARMUP_IMGSZ):
+    """预加载模型并空跑若干次，完成后标记 ready"""
+    state["ready"] = False
+    state["started_at"] = time.time()
+    model_ids = await run_in_threadpool(_resolve_preload, spec)
+    if len(model_ids) > model_registry.model_cache.capacity:
+        print(f"警告：预加载 {len(model_ids)} 个模型超过缓存容量 {model_registry.model_cache.capacity}，先加载的会被淘汰")
+
+    for model_id in model_ids:
+        try:
+            state["models"][model_id] = await _warm_model(model_id, runs, imgsz)
+        except Exception as e:
+            state["models"][model_id] = {"error": str(e)}
+            print(f"警告：模型预热失败 {model_id}: {str(e)}")
+
+    state["finished_at"] = time.time()
+    state["ready"] = True